@@ -0,0 +1,485 @@
+"""API móvil sobre ASGI con sesiones asíncronas de SQLAlchemy
+
+Las rutas de la app móvil (``/api/paradas``, ``/api/usuarios/registro`` y
+``/api/progreso/*`` salvo ``/api/progreso/cola``) se atienden con Starlette y
+un motor asíncrono (asyncpg o aiosqlite), así que una petición esperando a la
+base de datos no ocupa un hilo. La lógica es la misma que la de los blueprints: cada petición
+ejecuta los servicios con ``AsyncSession.run_sync`` dentro de un contexto de
+aplicación de Flask en el que ``db.session`` es la sesión de esa petición.
+El resto de rutas (panel, administración, ``/metrics``...) se sirven con la
+aplicación Flask montada como WSGI.
+
+Lo usa ``asgi.py``; necesita las dependencias de ``requirements-asgi.txt``.
+"""
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+from app import db, limites, motor, respuestas
+from app.models import Progreso
+from app.routes.paradas import leer_posicion
+from app.services import catalogo, cola_progreso, estadisticas, indice_paradas, registro
+from app.services import progreso as progreso_servicio
+
+logger = logging.getLogger(__name__)
+
+_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def url_asincrona(url):
+    """Misma base de datos con el driver asíncrono (asyncpg o aiosqlite)"""
+    url = make_url(url)
+    return url.set(drivername=_DRIVERS[url.get_backend_name()])
+
+
+def opciones_asincronas(config, opciones=None):
+    """SQLALCHEMY_ENGINE_OPTIONS (u ``opciones``) traducidas a los argumentos de asyncpg/aiosqlite"""
+    opciones = dict((config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}) if opciones is None else opciones)
+    conexion = dict(opciones.pop('connect_args', {}))
+    if config['DB_PERFIL'] == 'sqlite':
+        conexion.pop('check_same_thread', None)
+        return dict(opciones, connect_args=conexion)
+
+    argumentos = {}
+    if 'connect_timeout' in conexion:
+        argumentos['timeout'] = conexion['connect_timeout']
+    if '-c statement_timeout=' in conexion.get('options', ''):
+        argumentos['server_settings'] = {
+            'statement_timeout': conexion['options'].split('-c statement_timeout=', 1)[1].split()[0]
+        }
+    if config['DB_PERFIL'] == 'pgbouncer':
+        # PgBouncer en modo transacción no admite sentencias preparadas con nombre
+        argumentos['statement_cache_size'] = 0
+        opciones['poolclass'] = NullPool
+    return dict(opciones, connect_args=argumentos)
+
+
+class MotorAsincrono:
+    """Motor y fábrica de sesiones asíncronas de la aplicación Flask
+
+    Con ``SQLITE_ESCRITOR_UNICO`` reproduce el reparto del motor síncrono: un
+    escritor con una sola conexión que abre las transacciones con BEGIN
+    IMMEDIATE y un pool aparte de solo lectura (``lector``) para las lecturas.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        self.motor = create_async_engine(url_asincrona(config['SQLALCHEMY_DATABASE_URI']),
+                                         **opciones_asincronas(config))
+        self.lector = None
+        lector = (config.get('SQLALCHEMY_BINDS') or {}).get('lector')
+        if config['DB_PERFIL'] == 'sqlite':
+            escritor_unico = bool(config.get('SQLITE_ESCRITOR_UNICO')) and lector is not None
+            event.listen(self.motor.sync_engine, 'connect', motor.pragmas_sqlite(config, escritor=escritor_unico))
+            if escritor_unico:
+                # Sin reintentos propios: la espera la hace busy_timeout en el hilo de aiosqlite,
+                # así que no se duerme el bucle de eventos
+                event.listen(self.motor.sync_engine, 'begin', motor.begin_inmediato(0, 0))
+                opciones = dict(lector)
+                self.lector = create_async_engine(url_asincrona(opciones.pop('url')),
+                                                  **opciones_asincronas(config, opciones))
+                event.listen(self.lector.sync_engine, 'connect', motor.pragmas_lector(config))
+        self.sesiones = async_sessionmaker(self.motor, expire_on_commit=False)
+        self.sesiones_lectura = async_sessionmaker(self.lector or self.motor, expire_on_commit=False)
+
+    def _en_contexto(self, sesion, funcion, *args):
+        # Los servicios usan db.session: durante la llamada es la sesión de esta petición
+        with self.flask_app.app_context():
+            db.session.registry.set(sesion)
+            try:
+                return funcion(*args)
+            finally:
+                db.session.registry.clear()
+
+    async def ejecutar(self, funcion, *args):
+        """Ejecutar ``funcion(*args)`` con una sesión nueva; la función hace commit si escribe"""
+        async with self.sesiones() as sesion:
+            return await sesion.run_sync(self._en_contexto, funcion, *args)
+
+    async def leer(self, funcion, *args):
+        """Como ``ejecutar``, con una sesión del pool de lectura; ``funcion`` no debe escribir"""
+        async with self.sesiones_lectura() as sesion:
+            return await sesion.run_sync(self._en_contexto, funcion, *args)
+
+    async def cerrar(self):
+        await self.motor.dispose()
+        if self.lector is not None:
+            await self.lector.dispose()
+
+
+def _json(flask_app, datos, estado=200, cabeceras=None):
+    """Respuesta JSON serializada igual que en Flask"""
+    return Response(flask_app.json.dumps(datos), status_code=estado, media_type='application/json',
+                    headers=cabeceras)
+
+
+async def _cuerpo(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def _catalogo(request, serializada, cache_control):
+    """Respuesta cacheable con ETag fuerte y soporte de If-None-Match"""
+    if serializada is None:
+        return Response(status_code=404)
+    cuerpo, etag = serializada
+    cabeceras = {'ETag': f'"{etag}"', 'Cache-Control': cache_control}
+    coincidencias = [valor.strip().removeprefix('W/') for valor in request.headers.get('if-none-match', '').split(',')]
+    if f'"{etag}"' in coincidencias or '*' in coincidencias:
+        return Response(status_code=304, headers=cabeceras)
+    return Response(cuerpo, media_type='application/json', headers=cabeceras)
+
+
+async def _limite(flask_app, request, endpoint, datos):
+    """Respuesta 429 si el cliente agotó su límite para ``endpoint``, o None"""
+    reenviadas = [ip.strip() for ip in request.headers.get('x-forwarded-for', '').split(',') if ip.strip()]
+    clave = limites.cliente(datos, request.headers, reenviadas, request.client.host if request.client else None,
+                            flask_app.config)
+    # El almacén en fichero bloquea: fuera del bucle de eventos
+    espera = await run_in_threadpool(limites.comprobar, endpoint, clave, flask_app.config)
+    if not espera:
+        return None
+    limites.registrar_rechazo(endpoint, clave, espera)
+    segundos = limites.segundos_espera(espera)
+    return Response(flask_app.json.dumps({'error': f'Demasiadas peticiones, vuelve a intentarlo en {segundos} s'}),
+                    status_code=429, media_type='application/json', headers={'Retry-After': str(segundos)})
+
+
+def rutas(asincrono):
+    """Rutas de la API móvil sobre ``asincrono`` (un ``MotorAsincrono``)"""
+    flask_app = asincrono.flask_app
+    cache_catalogo = respuestas.politica_cache('paradas.obtener_paradas', flask_app.config)
+    cache_progreso = respuestas.politica_cache('progreso.obtener_progreso', flask_app.config)
+
+    async def obtener_paradas(request):
+        try:
+            ruta_id = int(request.query_params['ruta_id']) if request.query_params.get('ruta_id') else None
+        except ValueError:
+            ruta_id = None
+        return _catalogo(request, await asincrono.leer(catalogo.lista_serializada, ruta_id), cache_catalogo)
+
+    async def obtener_parada(request):
+        serializada = await asincrono.leer(catalogo.parada_serializada, request.path_params['id'])
+        return _catalogo(request, serializada, cache_catalogo)
+
+    async def registrar_usuario(request):
+        data = await _cuerpo(request)
+        limitada = await _limite(flask_app, request, 'usuarios.registrar_usuario', data)
+        if limitada:
+            return limitada
+        if not data:
+            return _json(flask_app, {'error': 'No se proporcionaron datos'}, 400)
+        if 'nombre' not in data or 'apellido' not in data:
+            return _json(flask_app, {'error': 'Nombre y apellido son requeridos'}, 400)
+
+        def registrar():
+            ruta_id = data.get('ruta_id')
+            if ruta_id is not None and not indice_paradas.obtener().existe_ruta(ruta_id):
+                return None, False
+            usuario, nuevo = registro.registrar([data], ruta_id)[0]
+            datos = usuario.to_dict()
+            db.session.commit()
+            return datos, nuevo
+
+        try:
+            datos, nuevo = await asincrono.ejecutar(registrar)
+        except Exception as e:
+            logger.exception("❌ Error en registro: %s", e)
+            return _json(flask_app, {'error': str(e)}, 500)
+        if datos is None:
+            return _json(flask_app, {'error': 'Ruta no encontrada'}, 404)
+        logger.info("%s usuario %s: %s", '🆕 Creado nuevo' if nuevo else '♻️ Recuperado', datos['id'], datos['nombre'],
+                    extra={'usuario_id': datos['id'], 'nuevo': nuevo})
+        return _json(flask_app, {'mensaje': 'Usuario procesado correctamente', 'usuario': datos})
+
+    async def registrar_grupo(request):
+        data = await _cuerpo(request)
+        limitada = await _limite(flask_app, request, 'usuarios.registrar_grupo', data)
+        if limitada:
+            return limitada
+        if not data or not isinstance(data.get('usuarios'), list) or not data['usuarios']:
+            return _json(flask_app, {'error': 'Se requiere la lista usuarios'}, 400)
+
+        personas = data['usuarios']
+        maximo = flask_app.config.get('REGISTRO_LOTE_MAXIMO', 100)
+        if len(personas) > maximo:
+            return _json(flask_app, {'error': f'Máximo {maximo} usuarios por lote'}, 400)
+        for indice, persona in enumerate(personas):
+            if not isinstance(persona, dict) or 'nombre' not in persona or 'apellido' not in persona:
+                return _json(flask_app, {'error': f'Nombre y apellido son requeridos (usuario {indice})'}, 400)
+
+        def registrar():
+            ruta_id = data.get('ruta_id')
+            if ruta_id is not None and not indice_paradas.obtener().existe_ruta(ruta_id):
+                return None
+            registrados = registro.registrar(personas, ruta_id)
+            datos = [dict(usuario.to_dict(), nuevo=nuevo) for usuario, nuevo in registrados]
+            db.session.commit()
+            return datos
+
+        try:
+            datos = await asincrono.ejecutar(registrar)
+        except Exception as e:
+            logger.exception("❌ Error en registro de grupo: %s", e)
+            return _json(flask_app, {'error': str(e)}, 500)
+        if datos is None:
+            return _json(flask_app, {'error': 'Ruta no encontrada'}, 404)
+        nuevos = sum(d['nuevo'] for d in datos)
+        logger.info("👥 Grupo registrado: %s nuevos de %s", nuevos, len(datos),
+                    extra={'nuevos': nuevos, 'total': len(datos)})
+        return _json(flask_app, {'mensaje': 'Usuarios procesados correctamente', 'usuarios': datos})
+
+    async def obtener_progreso(request):
+        usuario_id = request.path_params['usuario_id']
+        try:
+            since = request.query_params.get('since')
+            desde = progreso_servicio.leer_desde(since) if since else None
+        except ValueError:
+            return _json(flask_app, {'error': 'since debe ser una fecha ISO 8601'}, 400)
+
+        def leer():
+            ahora = datetime.utcnow()
+            usuario, progresos = progreso_servicio.leer_progreso_publico(usuario_id, desde)
+            if usuario is None:
+                return None
+            return {
+                'usuario_id': usuario_id,
+                'nombre_completo': f"{usuario['nombre']} {usuario['apellido']}",
+                'progreso': progresos,
+                'actualizado_hasta': ahora.isoformat()
+            }
+
+        datos = await asincrono.leer(leer)
+        if datos is None:
+            return Response(status_code=404)
+        return _json(flask_app, datos, cabeceras={'Cache-Control': cache_progreso})
+
+    async def completar_parada(request):
+        data = await _cuerpo(request)
+        if not data:
+            return _json(flask_app, {'error': 'No se proporcionaron datos'}, 400)
+
+        usuario_id = data.get('usuario_id')
+        parada_id = data.get('parada_id')
+        if not usuario_id or not parada_id:
+            return _json(flask_app, {'error': 'usuario_id y parada_id son requeridos'}, 400)
+        campo = progreso_servicio.metrica_invalida(data)
+        if campo:
+            return _json(flask_app, {'error': f'{campo} debe ser un entero'}, 400)
+
+        if flask_app.config.get('PROGRESO_WRITE_BEHIND'):
+            try:
+                evento = {campo: data[campo] for campo in progreso_servicio.METRICAS if campo in data}
+                evento.update(usuario_id=int(usuario_id), parada_id=int(parada_id))
+            except (TypeError, ValueError):
+                return _json(flask_app, {'error': 'usuario_id y parada_id deben ser enteros'}, 400)
+
+            def comprobar():
+                # Un evento sin progreso al que aplicarse no llega a la cola
+                existe = db.session.execute(
+                    select(Progreso.id).where(Progreso.usuario_id == evento['usuario_id'],
+                                              Progreso.parada_id == evento['parada_id'])
+                ).first()
+                return existe is not None, indice_paradas.obtener().siguiente(evento['parada_id'])
+
+            existe, siguiente = await asincrono.leer(comprobar)
+            if not existe:
+                return _json(flask_app, {'error': 'Progreso no encontrado'}, 404)
+            # La cola escribe en disco de forma síncrona: fuera del bucle de eventos
+            evento_id = await run_in_threadpool(cola_progreso.encolar, 'completar', evento)
+            return _json(flask_app, {
+                'mensaje': 'Parada recibida, se aplicará en segundo plano',
+                'evento_id': evento_id,
+                'siguiente_parada_id': siguiente
+            }, 202)
+
+        def completar():
+            resultado, progreso, siguiente_parada_id = progreso_servicio.completar(usuario_id, parada_id, data)
+            if resultado == 'completada':
+                db.session.commit()
+            return resultado, progreso.to_dict() if progreso else None, siguiente_parada_id
+
+        try:
+            resultado, progreso, siguiente_parada_id = await asincrono.ejecutar(completar)
+        except Exception as e:
+            return _json(flask_app, {'error': str(e)}, 500)
+
+        if resultado == 'no_encontrado':
+            return _json(flask_app, {'error': 'Progreso no encontrado'}, 404)
+        if resultado == 'ya_completada':
+            return _json(flask_app, {'mensaje': 'Esta parada ya fue completada'})
+        return _json(flask_app, {
+            'mensaje': 'Parada completada correctamente',
+            'progreso': progreso,
+            'siguiente_parada_id': siguiente_parada_id
+        })
+
+    async def sincronizar_progreso(request):
+        data = await _cuerpo(request)
+        if not data or not isinstance(data.get('completados'), list):
+            return _json(flask_app, {'error': 'Se requiere la lista completados'}, 400)
+
+        elementos = data['completados']
+        maximo = flask_app.config.get('SYNC_MAX_ELEMENTOS', 500)
+        if len(elementos) > maximo:
+            return _json(flask_app, {'error': f'Máximo {maximo} elementos por sincronización'}, 400)
+
+        def sincronizar():
+            resultados = progreso_servicio.aplicar_completados(elementos)
+            db.session.commit()
+            return resultados
+
+        try:
+            resultados = await asincrono.ejecutar(sincronizar)
+        except Exception as e:
+            return _json(flask_app, {'error': str(e)}, 500)
+        return _json(flask_app, {'mensaje': 'Sincronización completada', 'resultados': resultados})
+
+    async def checkin(request):
+        data = await _cuerpo(request)
+        if not data:
+            return _json(flask_app, {'error': 'No se proporcionaron datos'}, 400)
+
+        usuario_id = data.get('usuario_id')
+        parada_id = data.get('parada_id')
+        posicion = leer_posicion(data)
+        if not isinstance(usuario_id, int) or not isinstance(parada_id, (int, type(None))) or posicion is None:
+            return _json(flask_app, {'error': 'usuario_id, lat y lon son requeridos (parada_id opcional)'}, 400)
+        ruta_id = data['ruta_id'] if isinstance(data.get('ruta_id'), int) else None
+
+        def comprobar():
+            filas = progreso_servicio.paradas_checkin(usuario_id, parada_id, ruta_id)
+            if len(filas) != 1 or filas[0].estado != 'activa':
+                return filas, None
+            return filas, indice_paradas.obtener().distancia(filas[0].parada_id, *posicion)
+
+        filas, distancia = await asincrono.leer(comprobar)
+        if not filas:
+            return _json(flask_app, {'error': 'El usuario no tiene ninguna parada activa'}, 404)
+        if len(filas) > 1:
+            return _json(flask_app, {'error': 'El usuario tiene paradas activas en varias rutas: indica ruta_id'}, 400)
+        fila = filas[0]
+        if fila.estado != 'activa':
+            return _json(flask_app, {'error': f'La parada {fila.parada_id} no es la activa ({fila.estado})'}, 409)
+        if distancia is None:
+            return Response(status_code=404)
+        radio = flask_app.config.get('CHECKIN_RADIO', 50)
+        return _json(flask_app, {
+            'usuario_id': usuario_id,
+            'parada_id': fila.parada_id,
+            'en_rango': distancia <= radio,
+            'distancia': round(distancia, 1),
+            'radio': radio
+        })
+
+    async def actualizar_progreso(request):
+        progreso_id = request.path_params['id']
+        data = await _cuerpo(request)
+        if not data:
+            return _json(flask_app, {'error': 'No se proporcionaron datos'}, 400)
+        campo = progreso_servicio.metrica_invalida(data)
+        if campo:
+            return _json(flask_app, {'error': f'{campo} debe ser un entero'}, 400)
+        write_behind = flask_app.config.get('PROGRESO_WRITE_BEHIND')
+
+        def actualizar():
+            progreso = db.session.get(Progreso, progreso_id)
+            if progreso is None:
+                return 'no_encontrado', None
+            # Con la revisión que vio la app, un reintento tras un timeout no pisa cambios posteriores
+            if 'revision' in data and data['revision'] != progreso.revision:
+                return 'conflicto', progreso.to_dict()
+            if write_behind:
+                return 'encolar', None
+            cambios = estadisticas.CambiosEstadisticas()
+            progreso_servicio.actualizar_metricas(progreso, data, cambios)
+            cambios.aplicar()
+            db.session.commit()
+            return 'actualizado', progreso.to_dict()
+
+        try:
+            # Con write-behind solo se lee: la escritura la hace quien vacía la cola
+            resultado, progreso = await (asincrono.leer if write_behind else asincrono.ejecutar)(actualizar)
+        except Exception as e:
+            return _json(flask_app, {'error': str(e)}, 500)
+
+        if resultado == 'no_encontrado':
+            return Response(status_code=404)
+        if resultado == 'conflicto':
+            return _json(flask_app, {'error': 'El progreso cambió en el servidor', 'progreso': progreso}, 409)
+        if resultado == 'encolar':
+            evento = {campo: data[campo] for campo in progreso_servicio.METRICAS if campo in data}
+            evento['id'] = progreso_id
+            if 'revision' in data:
+                # Se vuelve a comprobar al aplicarlo: lo encolado antes puede cambiarla
+                evento['revision'] = data['revision']
+            evento_id = await run_in_threadpool(cola_progreso.encolar, 'actualizar', evento)
+            return _json(flask_app, {
+                'mensaje': 'Progreso recibido, se aplicará en segundo plano',
+                'evento_id': evento_id
+            }, 202)
+        return _json(flask_app, progreso)
+
+    return [
+        Route('/api/paradas', obtener_paradas, methods=['GET']),
+        Route('/api/paradas/{id:int}', obtener_parada, methods=['GET']),
+        Route('/api/usuarios/registro', registrar_usuario, methods=['POST']),
+        Route('/api/usuarios/registro/lote', registrar_grupo, methods=['POST']),
+        Route('/api/progreso/{usuario_id:int}', obtener_progreso, methods=['GET']),
+        Route('/api/progreso/completar', completar_parada, methods=['POST']),
+        Route('/api/progreso/sync', sincronizar_progreso, methods=['POST']),
+        Route('/api/progreso/checkin', checkin, methods=['POST']),
+        Route('/api/progreso/{id:int}', actualizar_progreso, methods=['PUT']),
+    ]
+
+
+class _GZip(GZipMiddleware):
+    """GZip salvo en los flujos de eventos (SSE): comprimidos llegarían con retraso"""
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and b'text/event-stream' in dict(scope['headers']).get(b'accept', b''):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+def crear_asgi(flask_app):
+    """Aplicación ASGI: API móvil asíncrona y el resto de la aplicación Flask como WSGI"""
+    asincrono = MotorAsincrono(flask_app)
+
+    @asynccontextmanager
+    async def ciclo_de_vida(_):
+        if flask_app.config.get('PROGRESO_WRITE_BEHIND'):
+            # Cada worker de uvicorn arranca su propio hilo de vaciado tras el fork
+            cola_progreso.asegurar_hilo()
+        logger.info("⚡ API móvil asíncrona sobre %s", asincrono.motor.url.drivername,
+                    extra={'driver': asincrono.motor.url.drivername})
+        yield
+        await asincrono.cerrar()
+
+    return Starlette(
+        routes=rutas(asincrono) + [Mount('/', app=WSGIMiddleware(flask_app))],
+        # Misma política que CORS(app) en Flask: cualquier origen y preflight cacheado
+        middleware=[
+            Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'],
+                       max_age=flask_app.config.get('CORS_MAX_AGE', 86400)),
+            Middleware(_GZip, minimum_size=flask_app.config.get('COMPRESION_MINIMO', 1024))
+        ],
+        lifespan=ciclo_de_vida
+    )
@@ -0,0 +1,78 @@
+"""Coalescencia de cálculos caros ("single-flight")
+
+Cuando varias peticiones piden a la vez el mismo resultado (las
+estadísticas de la portada, por ejemplo), solo la primera lo calcula; el
+resto espera a que termine y recibe el mismo objeto. Con ``ventana`` el
+resultado se reutiliza además durante unos milisegundos, de modo que los
+workers síncronos, que atienden una petición por hilo, también comparten
+los cálculos de las ráfagas.
+
+Los resultados se comparten entre hilos: quien los recibe no debe
+modificarlos.
+"""
+import threading
+import time
+
+
+class _Vuelo:
+    """Cálculo en curso y su resultado"""
+
+    def __init__(self):
+        self.terminado = threading.Event()
+        self.resultado = None
+        self.error = None
+        self.fin = None
+
+
+class VueloUnico:
+    """Agrupa las llamadas simultáneas con la misma clave en un único cálculo"""
+
+    def __init__(self, maximo=256):
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._vuelos = {}
+
+    def hacer(self, clave, funcion, ventana=0.0):
+        """Resultado de ``funcion()``, compartido con las llamadas de ``clave`` en curso
+
+        ``ventana`` (segundos) permite reutilizar un resultado recién calculado.
+        Si el cálculo falla, todas las llamadas que lo esperaban reciben el error.
+        """
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            if vuelo is not None and vuelo.fin is not None and time.monotonic() - vuelo.fin > ventana:
+                vuelo = None
+            lider = vuelo is None
+            if lider:
+                if len(self._vuelos) >= self.maximo:
+                    # Demasiadas claves: se descartan los resultados ya terminados
+                    self._vuelos = {c: v for c, v in self._vuelos.items() if v.fin is None}
+                vuelo = self._vuelos[clave] = _Vuelo()
+
+        if not lider:
+            vuelo.terminado.wait()
+        else:
+            try:
+                vuelo.resultado = funcion()
+            except BaseException as e:
+                vuelo.error = e
+            finally:
+                vuelo.fin = time.monotonic()
+                with self._lock:
+                    # Los errores no se reutilizan: la siguiente llamada lo reintenta
+                    if vuelo.error is not None or not ventana:
+                        if self._vuelos.get(clave) is vuelo:
+                            del self._vuelos[clave]
+                vuelo.terminado.set()
+
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.resultado
+
+    def olvidar(self, clave=None):
+        """Descartar el resultado guardado de ``clave`` (o de todas)"""
+        with self._lock:
+            if clave is None:
+                self._vuelos.clear()
+            else:
+                self._vuelos.pop(clave, None)
@@ -0,0 +1,152 @@
+"""Comandos de consola (``flask <grupo> <comando>``)"""
+import os
+
+import click
+from flask.cli import AppGroup
+
+from app import db
+
+estadisticas_cli = AppGroup('estadisticas', help='Gestión de los contadores agregados.')
+progreso_cli = AppGroup('progreso', help='Gestión de la cola de progreso (write-behind).')
+exportar_cli = AppGroup('exportar', help='Exportación de datos para análisis.')
+
+# Ruta creada por defecto y sus paradas (coordenadas correctas)
+RUTA_INICIAL = {'slug': 'santurtzi', 'nombre': 'Santurtzi', 'descripcion': 'Recorrido de Mentxu por Santurtzi'}
+
+PARADAS_INICIALES = [
+    {'nombre': 'Santurtziko Udala (Mentxu)', 'latitud': 43.328833, 'longitud': -3.032944, 'tipo_juego': 'Sopa de Letras', 'orden': 1},
+    {'nombre': '"El niño y el perro" eskultura', 'latitud': 43.328833, 'longitud': -3.032306, 'tipo_juego': 'Diferencias', 'orden': 2},
+    {'nombre': 'Agurtza itsasontzia', 'latitud': 43.327000, 'longitud': -3.023778, 'tipo_juego': 'Relacionar', 'orden': 3},
+    {'nombre': 'Itsas-museoa', 'latitud': 43.330639, 'longitud': -3.030750, 'tipo_juego': 'Basura', 'orden': 4},
+    {'nombre': 'Itsas-portua', 'latitud': 43.330417, 'longitud': -3.030722, 'tipo_juego': 'Pesca', 'orden': 5},
+    {'nombre': '"Monumento niños y niñas de la guerra" eskultura', 'latitud': 43.330500, 'longitud': -3.029917, 'tipo_juego': 'Puzzle', 'orden': 6}
+]
+
+
+def sembrar_datos_iniciales():
+    """Crear o sincronizar el admin, la ruta inicial, sus paradas y los contadores (idempotente)"""
+    from app.models import Admin, EstadisticaGlobal, Parada, Ruta
+    from app.services import catalogo, estadisticas
+    
+    # Sincronizar Admin con las variables de entorno
+    admin_username = os.getenv('ADMIN_USERNAME', 'admin')
+    admin_password = os.getenv('ADMIN_PASSWORD', 'admin123')
+    
+    admin = Admin.query.filter_by(username=admin_username).first()
+    if not admin:
+        admin = Admin(username=admin_username)
+        admin.set_password(admin_password)
+        db.session.add(admin)
+        click.echo(f"✅ Admin creado: {admin_username}")
+    elif not admin.check_password(admin_password):
+        admin.set_password(admin_password)
+        click.echo(f"✅ Contraseña del admin actualizada: {admin_username}")
+    else:
+        click.echo(f"ℹ️  Admin verificado: {admin_username}")
+    
+    # Ruta por defecto (la de menor id; la migración ya la crea)
+    ruta = Ruta.query.order_by(Ruta.id).first()
+    if ruta is None:
+        ruta = Ruta(**RUTA_INICIAL)
+        db.session.add(ruta)
+        db.session.flush()
+        catalogo.incrementar_version()
+        click.echo(f"✅ Ruta creada: {ruta.slug}")
+    
+    # Paradas del recorrido
+    if Parada.query.count() == 0:
+        for p_data in PARADAS_INICIALES:
+            db.session.add(Parada(
+                ruta_id=ruta.id,
+                nombre=p_data['nombre'],
+                nombre_corto=p_data['nombre'],
+                latitud=p_data['latitud'],
+                longitud=p_data['longitud'],
+                descripcion=f"Parada {p_data['orden']}",
+                tipo_juego=p_data['tipo_juego'],
+                orden=p_data['orden']
+            ))
+        catalogo.incrementar_version()
+        click.echo(f"✅ {len(PARADAS_INICIALES)} paradas creadas con coordenadas correctas")
+        estadisticas.reconstruir()
+    elif (db.session.get(EstadisticaGlobal, estadisticas.ID_GLOBAL) is None
+          or Ruta.query.filter(~Ruta.estadistica.has()).first() is not None):
+        # Las lecturas de estadísticas no crean los contadores que falten
+        estadisticas.reconstruir()
+        click.echo("✅ Estadísticas agregadas calculadas")
+    
+    db.session.commit()
+
+
+@click.command('seed')
+def seed():
+    """Cargar los datos iniciales (ejecutar tras `flask db upgrade`)"""
+    sembrar_datos_iniciales()
+
+
+@estadisticas_cli.command('reconstruir')
+def reconstruir_estadisticas():
+    """Recalcular los contadores de estadísticas desde cero"""
+    from app.services import estadisticas
+    
+    estadisticas.reconstruir()
+    db.session.commit()
+    
+    globales = estadisticas.obtener_globales()
+    click.echo(f"✅ Estadísticas reconstruidas: {globales.total_usuarios} usuarios, "
+               f"{globales.total_completados} paradas completadas")
+
+
+@progreso_cli.command('vaciar')
+def vaciar_cola_progreso():
+    """Aplicar ahora todos los eventos pendientes de la cola de progreso"""
+    from flask import current_app
+    from app.services import cola_progreso
+    
+    app = current_app._get_current_object()
+    total = 0
+    while True:
+        procesados = cola_progreso.vaciar(app)
+        if not procesados:
+            break
+        total += procesados
+    
+    estado = cola_progreso.metricas()
+    click.echo(f"✅ {total} eventos de progreso procesados ({estado['pendientes']} pendientes, "
+               f"{estado.get('fallidos', 0)} en eventos_fallidos)")
+
+
+@exportar_cli.command('progreso')
+@click.option('--formato', type=click.Choice(['csv', 'parquet', 'arrow']), default='csv', show_default=True)
+@click.option('--desde', help='Usuarios registrados desde esta fecha (ISO 8601)')
+@click.option('--hasta', help='Usuarios registrados antes de esta fecha (ISO 8601)')
+@click.option('--ruta', 'ruta_id', type=int, help='Solo el progreso de esta ruta')
+@click.option('--salida', type=click.File('wb'), default='-', help='Fichero de salida (por defecto la salida estándar)')
+def exportar_progreso(formato, desde, hasta, ruta_id, salida):
+    """Volcar el historial de progreso (usuarios, progreso y paradas) a un fichero"""
+    from flask import current_app
+    from app.services import exportacion
+    from app.services import progreso as progreso_servicio
+    
+    if not exportacion.disponible(formato):
+        raise click.ClickException(f'El formato {formato} necesita pyarrow (requirements-analitica.txt)')
+    try:
+        fechas = {clave: progreso_servicio.leer_desde(valor)
+                  for clave, valor in (('desde', desde), ('hasta', hasta)) if valor}
+    except ValueError:
+        raise click.BadParameter('las fechas deben estar en ISO 8601')
+    
+    total = 0
+    for trozo in exportacion.exportar(formato, ruta_id=ruta_id, lote=current_app.config['EXPORTACION_LOTE'], **fechas):
+        salida.write(trozo)
+        total += len(trozo)
+    salida.flush()
+    click.echo(f"✅ Historial exportado en {formato} ({total} bytes)", err=True)
+
+
+def registrar_comandos(app):
+    """Registrar los grupos de comandos en la aplicación"""
+    app.cli.add_command(seed)
+    app.cli.add_command(estadisticas_cli)
+    app.cli.add_command(progreso_cli)
+    app.cli.add_command(exportar_cli)
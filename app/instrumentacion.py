@@ -0,0 +1,218 @@
+"""Métricas por endpoint: consultas SQL, tiempos y tamaño de respuesta
+
+Los eventos del motor de SQLAlchemy y los hooks de Flask acumulan en ``g``
+lo que cuesta cada petición (número de consultas, tiempo en la base de
+datos, tiempo serializando JSON) y al terminar se suma a contadores e
+histogramas por endpoint. ``/metrics`` los expone en formato de texto de
+Prometheus y, con ``SERVER_TIMING`` activado, cada respuesta incluye la
+cabecera ``Server-Timing`` para verlos en las herramientas del navegador.
+
+Cada proceso (worker de gunicorn) lleva sus propias métricas. ``/metrics``
+pide ``METRICAS_TOKEN``; sin token solo responde con ``METRICAS_PUBLICAS``.
+"""
+import logging
+import threading
+from collections import defaultdict
+from time import perf_counter
+
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.serializacion import ProveedorJSON
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_eventos_registrados = False
+
+# Límites de los histogramas
+_CUBOS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+_CUBOS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+def _etiquetas(nombres, valores):
+    pares = []
+    for nombre, valor in zip(nombres, valores):
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pares.append(f'{nombre}="{valor}"')
+    return ','.join(pares)
+
+
+class Contador:
+    """Contador de Prometheus con etiquetas"""
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, etiquetas
+        self.valores = defaultdict(float)
+
+    def sumar(self, valores, cantidad=1):
+        with _lock:
+            self.valores[valores] += cantidad
+
+    def lineas(self):
+        for valores, total in sorted(self.valores.items()):
+            yield f'{self.nombre}{{{_etiquetas(self.etiquetas, valores)}}} {total:g}'
+
+
+class Histograma:
+    """Histograma de Prometheus con etiquetas"""
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas, cubos):
+        self.nombre, self.ayuda, self.etiquetas, self.cubos = nombre, ayuda, etiquetas, cubos
+        self.series = {}
+
+    def observar(self, valores, medida):
+        with _lock:
+            serie = self.series.setdefault(valores, [[0] * len(self.cubos), 0, 0.0])
+            for posicion, limite in enumerate(self.cubos):
+                if medida <= limite:
+                    serie[0][posicion] += 1
+            serie[1] += 1
+            serie[2] += medida
+
+    def lineas(self):
+        for valores, (cubos, cuenta, suma) in sorted(self.series.items()):
+            base = _etiquetas(self.etiquetas, valores)
+            for limite, acumulado in zip(self.cubos, cubos):
+                yield f'{self.nombre}_bucket{{{base},le="{limite:g}"}} {acumulado}'
+            yield f'{self.nombre}_bucket{{{base},le="+Inf"}} {cuenta}'
+            yield f'{self.nombre}_sum{{{base}}} {suma:g}'
+            yield f'{self.nombre}_count{{{base}}} {cuenta}'
+
+
+PETICIONES = Contador('mentxu_peticiones_total', 'Peticiones atendidas',
+                      ('endpoint', 'metodo', 'estado'))
+DURACION = Histograma('mentxu_peticion_segundos', 'Duración de las peticiones',
+                      ('endpoint',), _CUBOS_SEGUNDOS)
+CONSULTAS = Histograma('mentxu_sql_consultas_por_peticion', 'Consultas SQL por petición',
+                       ('endpoint',), _CUBOS_CONSULTAS)
+TIEMPO_SQL = Contador('mentxu_sql_segundos_total', 'Tiempo esperando a la base de datos',
+                      ('endpoint',))
+TIEMPO_SERIALIZACION = Contador('mentxu_serializacion_segundos_total', 'Tiempo serializando JSON',
+                                ('endpoint',))
+BYTES = Contador('mentxu_respuesta_bytes_total', 'Bytes de cuerpo enviados', ('endpoint',))
+
+METRICAS = (PETICIONES, DURACION, CONSULTAS, TIEMPO_SQL, TIEMPO_SERIALIZACION, BYTES)
+
+
+def _medicion():
+    """Acumulador de la petición en curso, o None fuera de una petición medida"""
+    return g.get('_medicion') if has_app_context() else None
+
+
+class ProveedorJSONMedido(ProveedorJSON):
+    """Proveedor JSON de la app que suma el tiempo de serialización de la petición"""
+
+    def codificar(self, obj, indent=None, **kwargs):
+        inicio = perf_counter()
+        try:
+            return super().codificar(obj, indent=indent, **kwargs)
+        finally:
+            medicion = _medicion()
+            if medicion is not None:
+                medicion['serializacion'] += perf_counter() - inicio
+
+
+def _antes_de_consulta(conn, cursor, sentencia, parametros, contexto, executemany):
+    if _medicion() is not None:
+        conn.info.setdefault('_inicios_mentxu', []).append(perf_counter())
+
+
+def _despues_de_consulta(conn, cursor, sentencia, parametros, contexto, executemany):
+    inicios = conn.info.get('_inicios_mentxu')
+    medicion = _medicion()
+    if inicios and medicion is not None:
+        medicion['consultas'] += 1
+        medicion['sql'] += perf_counter() - inicios.pop()
+
+
+def _error_de_consulta(contexto):
+    # La consulta falló: descartar su inicio para no desemparejar los siguientes
+    if contexto.connection is not None and contexto.connection.info.get('_inicios_mentxu'):
+        contexto.connection.info['_inicios_mentxu'].pop()
+
+
+def _iniciar_medicion():
+    g._medicion = {'inicio': perf_counter(), 'consultas': 0, 'sql': 0.0, 'serializacion': 0.0}
+
+
+def _terminar_medicion(respuesta):
+    medicion = g.pop('_medicion', None)
+    if medicion is None:
+        return respuesta
+
+    total = perf_counter() - medicion['inicio']
+    endpoint = request.endpoint or 'sin_ruta'
+    PETICIONES.sumar((endpoint, request.method, respuesta.status_code))
+    DURACION.observar((endpoint,), total)
+    CONSULTAS.observar((endpoint,), medicion['consultas'])
+    TIEMPO_SQL.sumar((endpoint,), medicion['sql'])
+    TIEMPO_SERIALIZACION.sumar((endpoint,), medicion['serializacion'])
+    if not respuesta.is_streamed:
+        BYTES.sumar((endpoint,), respuesta.calculate_content_length() or 0)
+
+    if current_app.config.get('SERVER_TIMING'):
+        respuesta.headers['Server-Timing'] = (
+            f'db;dur={medicion["sql"] * 1000:.2f};desc="{medicion["consultas"]} consultas", '
+            f'json;dur={medicion["serializacion"] * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}'
+        )
+    return respuesta
+
+
+def exponer():
+    """Todas las métricas en el formato de texto de Prometheus"""
+    from app.services import cola_progreso
+
+    lineas = []
+    for metrica in METRICAS:
+        lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+        lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+        lineas.extend(metrica.lineas())
+
+    if cola_progreso.activo():
+        cola = cola_progreso.metricas()
+        lineas += [
+            '# HELP mentxu_cola_progreso_pendientes Eventos de progreso sin aplicar',
+            '# TYPE mentxu_cola_progreso_pendientes gauge',
+            f'mentxu_cola_progreso_pendientes {cola["pendientes"]}',
+            '# HELP mentxu_cola_progreso_retraso_segundos Antigüedad del evento pendiente más viejo',
+            '# TYPE mentxu_cola_progreso_retraso_segundos gauge',
+            f'mentxu_cola_progreso_retraso_segundos {cola["retraso_segundos"]:g}',
+        ]
+    return '\n'.join(lineas) + '\n'
+
+
+def _vista_metricas():
+    token = current_app.config.get('METRICAS_TOKEN')
+    if not token and not current_app.config.get('METRICAS_PUBLICAS'):
+        # Sin token las métricas (rutas, volumen, cola) no se publican por defecto
+        return Response('No encontrado\n', status=404, mimetype='text/plain')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    return Response(exponer(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Activar la medición por petición y la ruta ``/metrics`` (si ``METRICAS_ACTIVAS``)"""
+    global _eventos_registrados
+
+    if not app.config.get('METRICAS_ACTIVAS', True):
+        return
+
+    app.json = ProveedorJSONMedido(app)
+    app.before_request(_iniciar_medicion)
+    app.after_request(_terminar_medicion)
+    app.add_url_rule('/metrics', 'metricas', _vista_metricas)
+    if not app.config.get('METRICAS_TOKEN') and not app.config.get('METRICAS_PUBLICAS'):
+        logger.warning("⚠️ /metrics responde 404: define METRICAS_TOKEN (o METRICAS_PUBLICAS=1 en local)")
+
+    with _lock:
+        if not _eventos_registrados:
+            event.listen(Engine, 'before_cursor_execute', _antes_de_consulta)
+            event.listen(Engine, 'after_cursor_execute', _despues_de_consulta)
+            event.listen(Engine, 'handle_error', _error_de_consulta)
+            _eventos_registrados = True
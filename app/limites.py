@@ -0,0 +1,200 @@
+"""Límite de peticiones por cliente con cubos de fichas (token bucket)
+
+Cada regla de ``LIMITES`` (``'n/segundos'`` en la configuración) da a cada
+cliente un cubo de ``n`` fichas que se rellena a ``n/segundos`` fichas por
+segundo; cada petición gasta una y sin fichas se responde 429 con
+``Retry-After``. El cliente se identifica por su ``device_id`` (cuerpo JSON
+o cabecera ``X-Device-Id``) o, si no lo envía, por su IP.
+
+Los cubos se guardan en memoria (``LIMITES_BACKEND=memoria``, cada worker
+lleva los suyos) o en un SQLite local compartido por todos los workers de
+la máquina (``LIMITES_BACKEND=fichero``).
+"""
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from flask import current_app, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+# Endpoint -> clave de configuración con su límite
+LIMITES = {
+    'usuarios.registrar_usuario': 'LIMITE_REGISTRO',
+    'usuarios.registrar_grupo': 'LIMITE_REGISTRO',
+    'progreso.estadisticas_generales': 'LIMITE_ESTADISTICAS',
+    'progreso.obtener_ranking': 'LIMITE_ESTADISTICAS',
+    'progreso.obtener_embudo': 'LIMITE_ESTADISTICAS',
+    'web.index': 'LIMITE_ESTADISTICAS',
+}
+
+
+def leer_regla(texto):
+    """(capacidad, fichas por segundo) de ``'n/segundos'``, o None si está desactivada"""
+    if not texto or texto == '0':
+        return None
+    try:
+        cantidad, segundos = texto.split('/')
+        capacidad, periodo = int(cantidad), float(segundos)
+    except ValueError as e:
+        raise ValueError(f"Límite no válido: {texto!r} (formato n/segundos)") from e
+    if capacidad <= 0 or periodo <= 0:
+        return None
+    return capacidad, capacidad / periodo
+
+
+def _rellenar(fichas, ultimo, capacidad, ritmo, ahora):
+    """Fichas tras rellenar desde ``ultimo``; gasta una si hay. Devuelve (fichas, espera)"""
+    fichas = min(capacidad, fichas + (ahora - ultimo) * ritmo)
+    if fichas >= 1:
+        return fichas - 1, 0.0
+    return fichas, (1 - fichas) / ritmo
+
+
+class CubosMemoria:
+    """Cubos en memoria del proceso"""
+
+    def __init__(self, maximo=10000):
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._cubos = {}
+
+    def consumir(self, clave, capacidad, ritmo):
+        ahora = time.monotonic()
+        with self._lock:
+            fichas, ultimo = self._cubos.get(clave, (capacidad, ahora))
+            fichas, espera = _rellenar(fichas, ultimo, capacidad, ritmo, ahora)
+            if len(self._cubos) >= self.maximo and clave not in self._cubos:
+                # Los cubos llenos no guardan nada que no se pueda recalcular
+                self._cubos = {c: (f, u) for c, (f, u) in self._cubos.items()
+                               if f + (ahora - u) * ritmo < capacidad}
+            self._cubos[clave] = (fichas, ahora)
+        return espera
+
+
+class CubosFichero:
+    """Cubos en un SQLite local compartido por los workers de la máquina"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or self._local.pid != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            # Si se pierde el estado de los cubos al caer la máquina no pasa nada
+            conexion.execute('PRAGMA synchronous=OFF')
+            conexion.execute('CREATE TABLE IF NOT EXISTS cubos ('
+                             'clave TEXT PRIMARY KEY, fichas REAL NOT NULL, actualizado REAL NOT NULL)')
+            self._local.conexion, self._local.pid = conexion, os.getpid()
+        return conexion
+
+    def consumir(self, clave, capacidad, ritmo):
+        conexion = self._conexion()
+        ahora = time.time()
+        conexion.execute('BEGIN IMMEDIATE')
+        try:
+            fila = conexion.execute('SELECT fichas, actualizado FROM cubos WHERE clave = ?', (clave,)).fetchone()
+            fichas, espera = _rellenar(*(fila or (capacidad, ahora)), capacidad, ritmo, ahora)
+            conexion.execute('INSERT OR REPLACE INTO cubos (clave, fichas, actualizado) VALUES (?, ?, ?)',
+                             (clave, fichas, ahora))
+            if random.random() < 0.001:
+                # Limpieza ocasional de clientes que ya no aparecen
+                conexion.execute('DELETE FROM cubos WHERE actualizado < ?', (ahora - 86400,))
+            conexion.execute('COMMIT')
+        except Exception:
+            conexion.execute('ROLLBACK')
+            raise
+        return espera
+
+
+_estado = {'cubos': None}
+
+
+def ip_cliente(reenviadas, remota, proxies):
+    """IP del cliente
+
+    Sin proxies de confianza (``LIMITES_PROXIES=0``) es la del socket; con
+    ``proxies`` delante, la que añadió a ``X-Forwarded-For`` el más lejano de
+    ellos (las anteriores las puede inventar el cliente).
+    """
+    if proxies and len(reenviadas) >= proxies:
+        return reenviadas[-proxies]
+    return remota or 'desconocida'
+
+
+def cliente(datos, cabeceras, reenviadas, remota, config):
+    """Clave del cliente: su ``device_id`` si lo envía o su IP"""
+    device_id = datos.get('device_id') if isinstance(datos, dict) else None
+    return device_id or cabeceras.get('X-Device-Id') or \
+        ip_cliente(reenviadas, remota, config.get('LIMITES_PROXIES', 0))
+
+
+def comprobar(endpoint, clave_cliente, config):
+    """Segundos que debe esperar el cliente para ``endpoint`` (0 si puede pasar)"""
+    clave_config = LIMITES.get(endpoint)
+    regla = leer_regla(config.get(clave_config)) if clave_config and _estado['cubos'] else None
+    if regla is None:
+        return 0.0
+    try:
+        return _estado['cubos'].consumir(f'{clave_config}:{clave_cliente}', *regla)
+    except sqlite3.Error as e:
+        # Sin poder leer los cubos se deja pasar antes que rechazar a todos
+        logger.warning("⚠️ No se pudo comprobar el límite de %s: %s", endpoint, e)
+        return 0.0
+
+
+def registrar_rechazo(endpoint, clave_cliente, espera):
+    logger.info("🚫 Límite de %s alcanzado por %s", endpoint, clave_cliente,
+                extra={'endpoint': endpoint, 'cliente': clave_cliente, 'espera_s': round(espera, 3)})
+
+
+def segundos_espera(espera):
+    """Valor de Retry-After (segundos enteros, al menos 1)"""
+    return max(1, math.ceil(espera))
+
+
+def respuesta_limitada(espera):
+    """429 con Retry-After"""
+    segundos = segundos_espera(espera)
+    if request.path.startswith('/api/'):
+        respuesta = jsonify({'error': f'Demasiadas peticiones, vuelve a intentarlo en {segundos} s'})
+    else:
+        respuesta = current_app.response_class('Demasiadas peticiones\n', mimetype='text/plain')
+    respuesta.status_code = 429
+    respuesta.headers['Retry-After'] = str(segundos)
+    return respuesta
+
+
+def _limitar():
+    if request.endpoint not in LIMITES:
+        return None
+    datos = request.get_json(silent=True) if request.is_json else None
+    reenviadas = request.access_route if 'X-Forwarded-For' in request.headers else []
+    clave = cliente(datos, request.headers, reenviadas, request.remote_addr, current_app.config)
+    espera = comprobar(request.endpoint, clave, current_app.config)
+    if espera:
+        registrar_rechazo(request.endpoint, clave, espera)
+        return respuesta_limitada(espera)
+    return None
+
+
+def init_app(app):
+    """Crear el almacén de cubos y comprobar los límites antes de cada petición"""
+    if not app.config.get('LIMITES_ACTIVOS', True):
+        return
+    for clave_config in set(LIMITES.values()):
+        leer_regla(app.config.get(clave_config))  # Fallar al arrancar si el formato es incorrecto
+
+    if app.config.get('LIMITES_BACKEND') == 'fichero':
+        _estado['cubos'] = CubosFichero(app.config.get('LIMITES_RUTA') or
+                                        os.path.join(app.instance_path, 'limites.db'))
+    else:
+        _estado['cubos'] = CubosMemoria()
+    app.before_request(_limitar)
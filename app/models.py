@@ -4,6 +4,15 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
 
+def campos_publicos(objeto):
+    """Diccionario con los ``CAMPOS_PUBLICOS`` del modelo (fechas en ISO 8601)"""
+    datos = {}
+    for campo in objeto.CAMPOS_PUBLICOS:
+        valor = getattr(objeto, campo)
+        datos[campo] = valor.isoformat() if isinstance(valor, datetime) else valor
+    return datos
+
+
 @login_manager.user_loader
 def load_user(user_id):
     """Cargar usuario para Flask-Login"""
@@ -41,22 +50,58 @@ class Usuario(db.Model):
     apellido = db.Column(db.String(100), nullable=False)
     fecha_registro = db.Column(db.DateTime, default=datetime.utcnow)
     device_id = db.Column(db.String(200))  # Identificador del dispositivo (no único para permitir múltiples perfiles)
+    # Última revisión asignada a su progreso (ver app/services/sincronizacion.py)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Campos que devuelve la API (to_dict y las consultas de columnas)
+    CAMPOS_PUBLICOS = ('id', 'nombre', 'apellido', 'fecha_registro', 'device_id')
     
     # Relación con progreso
     progresos = db.relationship('Progreso', backref='usuario', lazy=True, cascade='all, delete-orphan')
     
+    # Totales del ranking (se borran con el usuario)
+    puntuacion = db.relationship('PuntuacionUsuario', lazy=True, uselist=False, cascade='all, delete-orphan')
+    puntuaciones_diarias = db.relationship('PuntuacionDiaria', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        # Búsqueda del registro (mismo nombre y apellido en el mismo dispositivo)
+        db.Index('ix_usuarios_nombre_apellido_device', 'nombre', 'apellido', 'device_id'),
+        # Listados paginados por (fecha_registro, id)
+        db.Index('ix_usuarios_fecha_registro_id', 'fecha_registro', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Usuario {self.nombre} {self.apellido}>'
     
     def to_dict(self):
         """Serializar a diccionario"""
-        return {
-            'id': self.id,
-            'nombre': self.nombre,
-            'apellido': self.apellido,
-            'fecha_registro': self.fecha_registro.isoformat() if self.fecha_registro else None,
-            'device_id': self.device_id
-        }
+        return campos_publicos(self)
+
+
+class Ruta(db.Model):
+    """Modelo para cada recorrido turístico (otro municipio, versión infantil...)"""
+    __tablename__ = 'rutas'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(100), unique=True, nullable=False)  # Ej: "santurtzi"
+    nombre = db.Column(db.String(200), nullable=False)
+    descripcion = db.Column(db.Text)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    CAMPOS_PUBLICOS = ('id', 'slug', 'nombre', 'descripcion')
+    
+    # Paradas del recorrido
+    paradas = db.relationship('Parada', backref='ruta', lazy=True)
+    
+    # Contadores agregados de la ruta
+    estadistica = db.relationship('EstadisticaRuta', lazy=True, uselist=False, cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<Ruta {self.slug}>'
+    
+    def to_dict(self):
+        """Serializar a diccionario"""
+        return campos_publicos(self)
 
 
 class Parada(db.Model):
@@ -64,34 +109,36 @@ class Parada(db.Model):
     __tablename__ = 'paradas'
     
     id = db.Column(db.Integer, primary_key=True)
+    ruta_id = db.Column(db.Integer, db.ForeignKey('rutas.id'), nullable=False)
     nombre = db.Column(db.String(200), nullable=False)
     nombre_corto = db.Column(db.String(100))  # Ej: "El Ayuntamiento"
     latitud = db.Column(db.Float, nullable=False)
     longitud = db.Column(db.Float, nullable=False)
     descripcion = db.Column(db.Text)
     tipo_juego = db.Column(db.String(50))  # 'sopa_letras', 'diferencias', 'relacionar', etc.
-    orden = db.Column(db.Integer, unique=True)  # Orden en el recorrido
+    orden = db.Column(db.Integer)  # Orden dentro de su ruta
     imagen_url = db.Column(db.String(300))  # URL o path de la imagen
     
+    CAMPOS_PUBLICOS = ('id', 'ruta_id', 'nombre', 'nombre_corto', 'latitud', 'longitud', 'descripcion',
+                       'tipo_juego', 'orden', 'imagen_url')
+    
     # Relación con progreso
     progresos = db.relationship('Progreso', backref='parada', lazy=True, cascade='all, delete-orphan')
     
+    # Contadores agregados de la parada
+    estadistica = db.relationship('EstadisticaParada', backref='parada', lazy=True, uselist=False, cascade='all, delete-orphan')
+    
+    # El orden es único dentro de cada ruta (su índice sirve también para listar una ruta)
+    __table_args__ = (
+        db.UniqueConstraint('ruta_id', 'orden', name='unique_ruta_orden'),
+    )
+    
     def __repr__(self):
         return f'<Parada {self.orden}: {self.nombre_corto}>'
     
     def to_dict(self):
         """Serializar a diccionario"""
-        return {
-            'id': self.id,
-            'nombre': self.nombre,
-            'nombre_corto': self.nombre_corto,
-            'latitud': self.latitud,
-            'longitud': self.longitud,
-            'descripcion': self.descripcion,
-            'tipo_juego': self.tipo_juego,
-            'orden': self.orden,
-            'imagen_url': self.imagen_url
-        }
+        return campos_publicos(self)
 
 
 class Progreso(db.Model):
@@ -101,6 +148,7 @@ class Progreso(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     parada_id = db.Column(db.Integer, db.ForeignKey('paradas.id'), nullable=False)
+    ruta_id = db.Column(db.Integer, db.ForeignKey('rutas.id'), nullable=False)  # La de la parada
     
     # Estados: 'bloqueada', 'activa', 'completada'
     estado = db.Column(db.String(20), default='bloqueada')
@@ -113,9 +161,25 @@ class Progreso(db.Model):
     tiempo_empleado = db.Column(db.Integer)  # Segundos
     intentos = db.Column(db.Integer, default=0)
     
+    # Última modificación (para que la app pida solo los cambios con ?since=)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Revisión del usuario en la que cambió por última vez (feed /api/sync/changes)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    CAMPOS_PUBLICOS = ('id', 'usuario_id', 'parada_id', 'ruta_id', 'estado', 'fecha_inicio', 'fecha_completado',
+                       'puntuacion', 'tiempo_empleado', 'intentos', 'fecha_actualizacion', 'revision')
+    
     # Constraint único: un usuario solo puede tener un progreso por parada
+    # (su índice también sirve para buscar el progreso de un usuario)
     __table_args__ = (
         db.UniqueConstraint('usuario_id', 'parada_id', name='unique_usuario_parada'),
+        db.Index('ix_progreso_estado', 'estado'),
+        db.Index('ix_progreso_parada_estado', 'parada_id', 'estado'),
+        db.Index('ix_progreso_usuario_actualizacion', 'usuario_id', 'fecha_actualizacion'),
+        # Parada activa y paradas completadas de un usuario en una ruta
+        db.Index('ix_progreso_usuario_ruta_estado', 'usuario_id', 'ruta_id', 'estado'),
+        # Cambios de un usuario a partir de una revisión
+        db.Index('ix_progreso_usuario_revision', 'usuario_id', 'revision'),
     )
     
     def __repr__(self):
@@ -123,14 +187,90 @@ class Progreso(db.Model):
     
     def to_dict(self):
         """Serializar a diccionario"""
-        return {
-            'id': self.id,
-            'usuario_id': self.usuario_id,
-            'parada_id': self.parada_id,
-            'estado': self.estado,
-            'fecha_inicio': self.fecha_inicio.isoformat() if self.fecha_inicio else None,
-            'fecha_completado': self.fecha_completado.isoformat() if self.fecha_completado else None,
-            'puntuacion': self.puntuacion,
-            'tiempo_empleado': self.tiempo_empleado,
-            'intentos': self.intentos
-        }
+        return campos_publicos(self)
+
+
+class EstadisticaGlobal(db.Model):
+    """Contadores agregados de todo el sistema (una única fila)"""
+    __tablename__ = 'estadisticas_globales'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    total_usuarios = db.Column(db.Integer, nullable=False, default=0)
+    total_completados = db.Column(db.Integer, nullable=False, default=0)
+    total_activos = db.Column(db.Integer, nullable=False, default=0)
+    usuarios_completaron_todo = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<EstadisticaGlobal Usuarios:{self.total_usuarios} Completados:{self.total_completados}>'
+
+
+class EstadisticaParada(db.Model):
+    """Contadores agregados del progreso en cada parada"""
+    __tablename__ = 'estadisticas_paradas'
+    
+    parada_id = db.Column(db.Integer, db.ForeignKey('paradas.id'), primary_key=True)
+    completados = db.Column(db.Integer, nullable=False, default=0)
+    activos = db.Column(db.Integer, nullable=False, default=0)
+    # Suma y número de tiempo_empleado de los completados que lo tienen (para la media)
+    tiempo_total = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    tiempo_cuenta = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    def __repr__(self):
+        return f'<EstadisticaParada Parada:{self.parada_id} Completados:{self.completados}>'
+
+
+class EstadisticaRuta(db.Model):
+    """Contadores agregados de cada ruta"""
+    __tablename__ = 'estadisticas_rutas'
+    
+    ruta_id = db.Column(db.Integer, db.ForeignKey('rutas.id'), primary_key=True)
+    usuarios = db.Column(db.Integer, nullable=False, default=0)  # Con progreso en la ruta
+    total_completados = db.Column(db.Integer, nullable=False, default=0)
+    total_activos = db.Column(db.Integer, nullable=False, default=0)
+    usuarios_completaron_todo = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<EstadisticaRuta Ruta:{self.ruta_id} Usuarios:{self.usuarios}>'
+
+
+class PuntuacionUsuario(db.Model):
+    """Totales de las paradas completadas por un usuario (ranking general)"""
+    __tablename__ = 'puntuaciones_usuarios'
+    
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    puntuacion = db.Column(db.Integer, nullable=False, default=0)
+    tiempo_empleado = db.Column(db.Integer, nullable=False, default=0)
+    completadas = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<PuntuacionUsuario Usuario:{self.usuario_id} Puntuación:{self.puntuacion}>'
+
+
+class PuntuacionDiaria(db.Model):
+    """Totales de un usuario con las paradas completadas cada día (ranking diario)"""
+    __tablename__ = 'puntuaciones_diarias'
+    
+    fecha = db.Column(db.Date, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    puntuacion = db.Column(db.Integer, nullable=False, default=0)
+    tiempo_empleado = db.Column(db.Integer, nullable=False, default=0)
+    completadas = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # Borrado de las filas de un usuario
+        db.Index('ix_puntuaciones_diarias_usuario', 'usuario_id'),
+    )
+    
+    def __repr__(self):
+        return f'<PuntuacionDiaria {self.fecha} Usuario:{self.usuario_id} Puntuación:{self.puntuacion}>'
+
+
+class ContadorVersion(db.Model):
+    """Contador de versión compartido entre procesos (p. ej. del catálogo de paradas)"""
+    __tablename__ = 'contadores_version'
+    
+    nombre = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ContadorVersion {self.nombre}: {self.version}>'
@@ -0,0 +1,133 @@
+"""Ajustes del motor de base de datos al arrancar cada worker
+
+Con SQLite y ``SQLITE_ESCRITOR_UNICO`` cada proceso tiene una única conexión
+de escritura, que abre sus transacciones con ``BEGIN IMMEDIATE`` (reintentando
+con espera exponencial si otro proceso tiene el bloqueo), y un pool aparte de
+conexiones de solo lectura (bind ``lector``). ``SesionEnrutada`` manda a ese
+pool las consultas de cada petición, sea cual sea el método, hasta que la
+sesión escribe: así una petición que solo lee (un check-in, el login, la
+comprobación previa a encolar en write-behind) no toma el bloqueo de escritura.
+Desde el primer flush o DML la sesión lee de la conexión que escribe. Como en
+PostgreSQL con READ COMMITTED, lo leído antes de escribir puede haber cambiado
+al aplicar la escritura.
+"""
+import logging
+import os
+import random
+import time
+
+from flask import has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+class SesionEnrutada(Session):
+    """Sesión que lee del bind ``lector`` en las peticiones mientras no haya escrito"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and 'lector' in self._db.engines:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                # A partir de aquí la sesión lee de la conexión que escribe
+                self.info['_escribe'] = True
+            elif getattr(clause, 'is_select', False) and not self.info.get('_escribe') and has_request_context():
+                return self._db.engines['lector']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(SesionEnrutada, 'after_transaction_end')
+def _fin_de_transaccion(sesion, transaccion):
+    if transaccion.parent is None:
+        sesion.info.pop('_escribe', None)
+
+
+def pragmas_sqlite(config, escritor=False):
+    """PRAGMA de cada conexión SQLite nueva: WAL para que las lecturas no esperen a las escrituras"""
+    def aplicar(conexion_dbapi, registro):
+        cursor = conexion_dbapi.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(config.get("SQLITE_BUSY_TIMEOUT_MS", 5000))}')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA mmap_size={int(config.get("SQLITE_MMAP_SIZE", 0))}')
+        cursor.execute(f'PRAGMA cache_size={-int(config.get("SQLITE_CACHE_SIZE_KB", 2000))}')
+        cursor.close()
+        if escritor:
+            # SQLAlchemy abre la transacción (ver begin_inmediato), no pysqlite
+            conexion_dbapi.isolation_level = None
+    return aplicar
+
+
+def pragmas_lector(config):
+    """PRAGMA de las conexiones de solo lectura (el modo WAL ya lo fija el escritor)"""
+    def aplicar(conexion_dbapi, registro):
+        cursor = conexion_dbapi.cursor()
+        cursor.execute(f'PRAGMA busy_timeout={int(config.get("SQLITE_BUSY_TIMEOUT_MS", 5000))}')
+        cursor.execute(f'PRAGMA mmap_size={int(config.get("SQLITE_MMAP_SIZE", 0))}')
+        cursor.execute(f'PRAGMA cache_size={-int(config.get("SQLITE_CACHE_SIZE_KB", 2000))}')
+        cursor.close()
+    return aplicar
+
+
+def begin_inmediato(reintentos, backoff_ms):
+    """Abrir cada transacción con BEGIN IMMEDIATE, reintentando si la base de datos está bloqueada
+
+    Sirve para pysqlite y para aiosqlite: la sentencia va por el cursor de la
+    conexión DB-API (en aiosqlite, su adaptador síncrono).
+    """
+    def begin(conexion):
+        for intento in range(reintentos + 1):
+            cursor = conexion.connection.dbapi_connection.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                return
+            except conexion.dialect.dbapi.OperationalError as e:
+                if intento == reintentos or ('locked' not in str(e) and 'busy' not in str(e)):
+                    raise
+                espera = backoff_ms / 1000 * 2 ** intento * random.uniform(0.5, 1.5)
+                logger.warning("⏳ Base de datos bloqueada, reintento %s en %.3f s", intento + 1, espera,
+                               extra={'intento': intento + 1, 'espera_s': espera})
+                time.sleep(espera)
+            finally:
+                cursor.close()
+    return begin
+
+
+def init_app(app):
+    """Preparar el motor del perfil elegido y dejar en el log su configuración efectiva"""
+    from app import db
+    
+    with app.app_context():
+        motor = db.engine
+        lector = db.engines.get('lector')
+    perfil = app.config.get('DB_PERFIL')
+    escritor_unico = bool(app.config.get('SQLITE_ESCRITOR_UNICO')) and lector is not None
+    
+    if perfil == 'sqlite' and motor.dialect.name == 'sqlite':
+        event.listen(motor, 'connect', pragmas_sqlite(app.config, escritor=escritor_unico))
+    if escritor_unico:
+        event.listen(motor, 'begin', begin_inmediato(app.config.get('SQLITE_REINTENTOS', 5),
+                                                      app.config.get('SQLITE_BACKOFF_MS', 50)))
+        event.listen(lector, 'connect', pragmas_lector(app.config))
+        logger.info("✍️ SQLite con un escritor por proceso y lecturas en un pool de solo lectura (%s)",
+                    type(lector.pool).__name__, extra={'escritor_unico': True})
+    
+    pool = motor.pool
+    workers = int(os.environ.get('WEB_CONCURRENCY') or 1)
+    if isinstance(pool, QueuePool):
+        por_worker = pool.size() + max(pool._max_overflow, 0)
+        logger.info("🔌 Motor %s (%s): %s pool_size=%s max_overflow=%s recycle=%ss timeout=%ss pre_ping=%s",
+                    perfil, motor.dialect.name, type(pool).__name__, pool.size(), pool._max_overflow,
+                    pool._recycle, pool.timeout(), pool._pre_ping,
+                    extra={'perfil': perfil, 'pool': type(pool).__name__, 'conexiones_por_worker': por_worker})
+    else:
+        por_worker = 1
+        logger.info("🔌 Motor %s (%s): %s (una conexión por uso, sin pool propio)",
+                    perfil, motor.dialect.name, type(pool).__name__,
+                    extra={'perfil': perfil, 'pool': type(pool).__name__})
+    
+    maximo = app.config.get('DB_MAX_CONEXIONES')
+    if maximo and perfil != 'sqlite' and workers * por_worker > maximo:
+        logger.warning("⚠️ %s workers × %s conexiones superan DB_MAX_CONEXIONES=%s; "
+                       "baja DB_POOL_SIZE/DB_MAX_OVERFLOW o usa DB_PERFIL=pgbouncer",
+                       workers, por_worker, maximo)
@@ -0,0 +1,165 @@
+"""Compresión y caché HTTP de las respuestas
+
+- Las respuestas de texto (JSON, HTML, CSS...) de más de ``COMPRESION_MINIMO``
+  bytes se comprimen con brotli (si está instalado) o gzip según
+  ``Accept-Encoding``. El ETag pasa a débil porque el cuerpo enviado ya no es
+  byte a byte el mismo; la revalidación con ``If-None-Match`` sigue valiendo.
+- ``POLITICAS_CACHE`` fija el ``Cache-Control`` de cada ruta (o blueprint):
+  largo para el catálogo de paradas, privado y sin almacenar para el progreso.
+- Los ficheros de ``app/static`` se enlazan con el hash de su contenido en el
+  nombre (``css/style.3f2a1b9c04de.css``) y se sirven como inmutables durante
+  un año: un cambio en el fichero cambia la URL.
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Cache-Control por endpoint o, si no aparece, por blueprint (GET/HEAD con éxito)
+POLITICAS_CACHE = {
+    # El catálogo apenas cambia y se revalida con su ETag
+    'paradas.obtener_paradas': 'public, max-age={CATALOGO_MAX_AGE}, stale-while-revalidate=86400',
+    'paradas.obtener_parada': 'public, max-age={CATALOGO_MAX_AGE}, stale-while-revalidate=86400',
+    'rutas.obtener_rutas': 'public, max-age={CATALOGO_MAX_AGE}, stale-while-revalidate=86400',
+    'rutas.obtener_ruta': 'public, max-age={CATALOGO_MAX_AGE}, stale-while-revalidate=86400',
+    'rutas.obtener_paradas_ruta': 'public, max-age={CATALOGO_MAX_AGE}, stale-while-revalidate=86400',
+    # Datos de cada visitante: ni proxies ni caché del dispositivo
+    'progreso.obtener_progreso': 'private, no-store',
+    'progreso.estado_cola': 'no-store',
+    # El ranking es público y cada worker lo renueva cada RANKING_TTL segundos
+    'progreso.obtener_ranking': 'public, max-age={RANKING_TTL}',
+    # Las métricas del embudo se renuevan cada ANALITICA_TTL segundos
+    'progreso.obtener_embudo': 'public, max-age={ANALITICA_TTL}',
+    'usuarios': 'private, no-store',
+    'sincronizacion': 'private, no-store',
+    'exportacion': 'private, no-store',
+    # Panel: solo el navegador del administrador, revalidando siempre
+    'web': 'private, no-cache',
+    'auth': 'no-store',
+}
+
+_COMPRIMIBLES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+# Cuerpos ya comprimidos de respuestas con ETag fuerte (el catálogo)
+_MAXIMO_COMPRIMIDOS = 64
+_lock = threading.Lock()
+_comprimidos = {}
+
+_estaticos = {'con_hash': {}, 'originales': {}}
+
+
+def politica_cache(endpoint, config):
+    """Cache-Control configurado para ``endpoint`` (o su blueprint), o None"""
+    politica = POLITICAS_CACHE.get(endpoint) or POLITICAS_CACHE.get(endpoint.rpartition('.')[0])
+    return politica.format_map(config) if politica else None
+
+
+def _aplicar_politica(respuesta):
+    if request.method not in ('GET', 'HEAD') or request.endpoint is None or 'Cache-Control' in respuesta.headers:
+        return respuesta
+    if 200 <= respuesta.status_code < 300 or respuesta.status_code == 304:
+        politica = politica_cache(request.endpoint, current_app.config)
+        if politica:
+            respuesta.headers['Cache-Control'] = politica
+    return respuesta
+
+
+def _codificacion():
+    """Mejor codificación aceptada por el cliente, o None"""
+    aceptadas = request.accept_encodings
+    if brotli is not None and aceptadas['br']:
+        return 'br'
+    if aceptadas['gzip']:
+        return 'gzip'
+    return None
+
+
+def _comprimir_cuerpo(cuerpo, codificacion, config):
+    if codificacion == 'br':
+        return brotli.compress(cuerpo, quality=config.get('COMPRESION_CALIDAD_BROTLI', 5))
+    return gzip.compress(cuerpo, compresslevel=config.get('COMPRESION_NIVEL', 6), mtime=0)
+
+
+def _comprimir(respuesta):
+    # 206 (rangos) y los streaming se envían tal cual
+    if (request.method == 'HEAD' or respuesta.status_code not in (200, 201, 202)
+            or 'Content-Encoding' in respuesta.headers
+            or not (respuesta.mimetype or '').startswith(_COMPRIMIBLES)
+            or (respuesta.is_streamed and not respuesta.direct_passthrough)):
+        return respuesta
+
+    # Los estáticos (send_file) se leen para comprimirlos: son ficheros pequeños
+    respuesta.direct_passthrough = False
+    respuesta.vary.add('Accept-Encoding')
+    config = current_app.config
+    cuerpo = respuesta.get_data()
+    codificacion = _codificacion()
+    if codificacion is None or len(cuerpo) < config.get('COMPRESION_MINIMO', 1024):
+        return respuesta
+
+    etag, debil = respuesta.get_etag()
+    clave = (etag, codificacion) if etag and not debil else None
+    comprimido = _comprimidos.get(clave) if clave else None
+    if comprimido is None:
+        comprimido = _comprimir_cuerpo(cuerpo, codificacion, config)
+        if clave:
+            with _lock:
+                if len(_comprimidos) >= _MAXIMO_COMPRIMIDOS:
+                    _comprimidos.clear()
+                _comprimidos[clave] = comprimido
+
+    respuesta.set_data(comprimido)
+    respuesta.headers['Content-Encoding'] = codificacion
+    if etag:
+        respuesta.set_etag(etag, weak=True)
+    return respuesta
+
+
+def _manifiesto(carpeta):
+    """Ruta relativa -> nombre con el hash de su contenido de cada fichero estático"""
+    manifiesto = {}
+    for raiz, _, ficheros in os.walk(carpeta):
+        for nombre in ficheros:
+            ruta = os.path.join(raiz, nombre)
+            with open(ruta, 'rb') as f:
+                resumen = hashlib.sha256(f.read()).hexdigest()[:12]
+            relativa = os.path.relpath(ruta, carpeta).replace(os.sep, '/')
+            base, extension = os.path.splitext(relativa)
+            manifiesto[relativa] = f'{base}.{resumen}{extension}'
+    return manifiesto
+
+
+def _url_estatica(endpoint, valores):
+    if endpoint == 'static' and valores.get('filename') in _estaticos['con_hash']:
+        valores['filename'] = _estaticos['con_hash'][valores['filename']]
+
+
+def _servir_estatico(filename):
+    original = _estaticos['originales'].get(filename)
+    if original is None:
+        return current_app.send_static_file(filename)
+    respuesta = send_from_directory(current_app.static_folder, original,
+                                    max_age=current_app.config.get('ESTATICOS_MAX_AGE', 31536000))
+    respuesta.cache_control.immutable = True
+    return respuesta
+
+
+def init_app(app):
+    """Registrar las políticas de caché, la compresión y los estáticos con hash"""
+    app.after_request(_aplicar_politica)
+    if app.config.get('COMPRESION_ACTIVA', True):
+        app.after_request(_comprimir)
+
+    # En desarrollo los ficheros cambian sin reiniciar: se sirven sin hash
+    if app.config.get('ESTATICOS_CON_HASH', True) and not app.debug and app.static_folder:
+        con_hash = _manifiesto(app.static_folder)
+        _estaticos.update(con_hash=con_hash, originales={v: k for k, v in con_hash.items()})
+        app.url_defaults(_url_estatica)
+        app.view_functions['static'] = _servir_estatico
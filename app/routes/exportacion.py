@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_login import login_required
+from app.services import exportacion
+from app.services import progreso as progreso_servicio
+
+exportacion_bp = Blueprint('exportacion', __name__)
+
+
+@exportacion_bp.route('/exportacion/progreso', methods=['GET'])
+@login_required
+def exportar_progreso():
+    """Descargar el historial de progreso (?formato=csv|parquet|arrow, ?desde=, ?hasta=, ?ruta_id=)"""
+    formato = request.args.get('formato', 'csv').lower()
+    if formato not in exportacion.FORMATOS:
+        return jsonify({'error': f"Formato no válido: {', '.join(exportacion.FORMATOS)}"}), 400
+    if not exportacion.disponible(formato):
+        return jsonify({'error': f'El formato {formato} necesita pyarrow'}), 501
+
+    fechas = {}
+    for parametro in ('desde', 'hasta'):
+        texto = request.args.get(parametro)
+        if texto:
+            try:
+                fechas[parametro] = progreso_servicio.leer_desde(texto)
+            except ValueError:
+                return jsonify({'error': f'{parametro} debe ser una fecha ISO 8601'}), 400
+
+    tipo, extension = exportacion.FORMATOS[formato]
+    generador = exportacion.exportar(formato, ruta_id=request.args.get('ruta_id', type=int),
+                                     lote=current_app.config['EXPORTACION_LOTE'], **fechas)
+    nombre = f"progreso-{datetime.utcnow():%Y%m%d-%H%M%S}.{extension}"
+    # stream_with_context mantiene la sesión abierta mientras se envía el cuerpo
+    return Response(stream_with_context(generador), mimetype=tipo,
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"',
+                             'X-Accel-Buffering': 'no'})
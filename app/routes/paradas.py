@@ -1,23 +1,76 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, abort, current_app, jsonify, request
 from app import db
 from app.models import Parada
+from app.services import catalogo, estadisticas, indice_paradas
 from flask_login import login_required
 
 paradas_bp = Blueprint('paradas', __name__)
 
 
+def respuesta_catalogo(cuerpo, etag):
+    """Respuesta JSON con ETag fuerte y soporte de If-None-Match (Cache-Control en app/respuestas.py)"""
+    respuesta = Response(cuerpo, mimetype='application/json')
+    respuesta.set_etag(etag)
+    return respuesta.make_conditional(request)
+
+
 @paradas_bp.route('/paradas', methods=['GET'])
 def obtener_paradas():
-    """Obtener todas las paradas (API pública)"""
-    paradas = Parada.query.order_by(Parada.orden).all()
-    return jsonify([parada.to_dict() for parada in paradas]), 200
+    """Obtener todas las paradas, o las de ?ruta_id= (API pública)"""
+    serializada = catalogo.lista_serializada(request.args.get('ruta_id', type=int))
+    if serializada is None:
+        abort(404)
+    return respuesta_catalogo(*serializada)
+
+
+def leer_posicion(datos):
+    """``(latitud, longitud)`` de ``lat``/``lon`` (números en grados), o None si faltan o no son válidas"""
+    try:
+        lat, lon = float(datos['lat']), float(datos['lon'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+@paradas_bp.route('/paradas/cercanas', methods=['GET'])
+def paradas_cercanas():
+    """Paradas a menos de ?radio= metros de ?lat= y ?lon= (?ruta_id= de una ruta), de la más cercana a la más lejana"""
+    posicion = leer_posicion(request.args)
+    if posicion is None:
+        return jsonify({'error': 'lat y lon son requeridos (grados decimales)'}), 400
+    
+    maximo = current_app.config.get('PARADAS_CERCANAS_RADIO_MAXIMO', 5000)
+    radio = request.args.get('radio', type=float)
+    if radio is None:
+        radio = current_app.config.get('PARADAS_CERCANAS_RADIO', 500)
+    if not 0 < radio <= maximo:
+        return jsonify({'error': f'radio debe estar entre 0 y {maximo} metros'}), 400
+    
+    indice = indice_paradas.obtener()
+    paradas = []
+    for distancia, parada_id in indice.cercanas(*posicion, radio, request.args.get('ruta_id', type=int)):
+        latitud, longitud = indice.posiciones[parada_id]
+        paradas.append({
+            'id': parada_id,
+            'ruta_id': indice.rutas[parada_id],
+            'nombre_corto': indice.nombres[parada_id],
+            'orden': indice.orden[parada_id],
+            'latitud': latitud,
+            'longitud': longitud,
+            'distancia': round(distancia, 1)
+        })
+    return jsonify({'radio': radio, 'paradas': paradas}), 200
 
 
 @paradas_bp.route('/paradas/<int:id>', methods=['GET'])
 def obtener_parada(id):
     """Obtener una parada específica"""
-    parada = Parada.query.get_or_404(id)
-    return jsonify(parada.to_dict()), 200
+    serializada = catalogo.parada_serializada(id)
+    if serializada is None:
+        abort(404)
+    return respuesta_catalogo(*serializada)
 
 
 @paradas_bp.route('/paradas', methods=['POST'])
@@ -35,7 +88,14 @@ def crear_parada():
         if campo not in data:
             return jsonify({'error': f'Campo requerido: {campo}'}), 400
     
+    # Sin ruta_id la parada se añade a la ruta por defecto
+    indice = indice_paradas.obtener()
+    ruta_id = data.get('ruta_id', indice.ruta_defecto)
+    if not indice.existe_ruta(ruta_id):
+        return jsonify({'error': 'Ruta no encontrada'}), 404
+    
     nueva_parada = Parada(
+        ruta_id=ruta_id,
         nombre=data['nombre'],
         nombre_corto=data.get('nombre_corto', data['nombre']),
         latitud=data['latitud'],
@@ -48,7 +108,10 @@ def crear_parada():
     
     try:
         db.session.add(nueva_parada)
+        estadisticas.reconstruir()
+        catalogo.incrementar_version()
         db.session.commit()
+        catalogo.invalidar()
         return jsonify(nueva_parada.to_dict()), 201
     except Exception as e:
         db.session.rollback()
@@ -84,7 +147,9 @@ def actualizar_parada(id):
         parada.imagen_url = data['imagen_url']
     
     try:
+        catalogo.incrementar_version()
         db.session.commit()
+        catalogo.invalidar()
         return jsonify(parada.to_dict()), 200
     except Exception as e:
         db.session.rollback()
@@ -99,7 +164,10 @@ def eliminar_parada(id):
     
     try:
         db.session.delete(parada)
+        estadisticas.reconstruir()
+        catalogo.incrementar_version()
         db.session.commit()
+        catalogo.invalidar()
         return jsonify({'mensaje': 'Parada eliminada correctamente'}), 200
     except Exception as e:
         db.session.rollback()
@@ -108,34 +176,13 @@ def eliminar_parada(id):
 
 @paradas_bp.route('/paradas/<int:id>/estadisticas', methods=['GET'])
 def estadisticas_parada(id):
-    """Obtener estadísticas de una parada específica"""
-    from app.models import Progreso
-    from sqlalchemy import func
-    
+    """Obtener estadísticas de una parada específica (de sus contadores agregados)"""
     parada = Parada.query.get_or_404(id)
-    
-    total_completados = Progreso.query.filter_by(
-        parada_id=id, 
-        estado='completada'
-    ).count()
-    
-    total_activos = Progreso.query.filter_by(
-        parada_id=id, 
-        estado='activa'
-    ).count()
-    
-    # Tiempo promedio
-    tiempo_promedio = db.session.query(
-        func.avg(Progreso.tiempo_empleado)
-    ).filter(
-        Progreso.parada_id == id,
-        Progreso.estado == 'completada',
-        Progreso.tiempo_empleado.isnot(None)
-    ).scalar()
+    contadores = estadisticas.obtener_parada(id)
     
     return jsonify({
         'parada': parada.to_dict(),
-        'total_completados': total_completados,
-        'total_activos': total_activos,
-        'tiempo_promedio_segundos': int(tiempo_promedio) if tiempo_promedio else 0
+        'total_completados': contadores.completados,
+        'total_activos': contadores.activos,
+        'tiempo_promedio_segundos': contadores.tiempo_total // contadores.tiempo_cuenta if contadores.tiempo_cuenta else 0
     }), 200
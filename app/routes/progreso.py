@@ -1,21 +1,35 @@
-from flask import Blueprint, jsonify, request
+from datetime import date, datetime
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from sqlalchemy import select
+
 from app import db
-from app.models import Progreso, Parada, Usuario
-from datetime import datetime
+from app.models import Progreso
+from app.routes.paradas import leer_posicion
+from app.services import analitica, cola_progreso, estadisticas, indice_paradas, ranking
+from app.services import progreso as progreso_servicio
 
 progreso_bp = Blueprint('progreso', __name__)
 
 
 @progreso_bp.route('/progreso/<int:usuario_id>', methods=['GET'])
 def obtener_progreso(usuario_id):
-    """Obtener el progreso completo de un usuario"""
-    usuario = Usuario.query.get_or_404(usuario_id)
-    progresos = Progreso.query.filter_by(usuario_id=usuario_id).join(Parada).order_by(Parada.orden).all()
+    """Obtener el progreso de un usuario con los datos de cada parada (?since= solo los cambios)"""
+    try:
+        desde = progreso_servicio.leer_desde(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({'error': 'since debe ser una fecha ISO 8601'}), 400
+    
+    ahora = datetime.utcnow()
+    usuario, progresos = progreso_servicio.leer_progreso_publico(usuario_id, desde)
+    if usuario is None:
+        abort(404)
     
     return jsonify({
         'usuario_id': usuario_id,
-        'nombre_completo': f"{usuario.nombre} {usuario.apellido}",
-        'progreso': [p.to_dict() for p in progresos]
+        'nombre_completo': f"{usuario['nombre']} {usuario['apellido']}",
+        'progreso': progresos,
+        'actualizado_hasta': ahora.isoformat()
     }), 200
 
 
@@ -33,51 +47,46 @@ def completar_parada():
     if not usuario_id or not parada_id:
         return jsonify({'error': 'usuario_id y parada_id son requeridos'}), 400
     
-    # Obtener el progreso actual
-    progreso_actual = Progreso.query.filter_by(
-        usuario_id=usuario_id,
-        parada_id=parada_id
-    ).first()
-    
-    if not progreso_actual:
-        return jsonify({'error': 'Progreso no encontrado'}), 404
-    
-    if progreso_actual.estado == 'completada':
-        return jsonify({'mensaje': 'Esta parada ya fue completada'}), 200
-    
-    # Marcar como completada
-    progreso_actual.estado = 'completada'
-    progreso_actual.fecha_completado = datetime.utcnow()
-    
-    # Actualizar métricas opcionales
-    if 'puntuacion' in data:
-        progreso_actual.puntuacion = data['puntuacion']
-    if 'tiempo_empleado' in data:
-        progreso_actual.tiempo_empleado = data['tiempo_empleado']
-    if 'intentos' in data:
-        progreso_actual.intentos = data['intentos']
+    campo = progreso_servicio.metrica_invalida(data)
+    if campo:
+        return jsonify({'error': f'{campo} debe ser un entero'}), 400
+    
+    if cola_progreso.activo():
+        # Write-behind: se confirma en cuanto el evento está en la cola local
+        try:
+            evento = {campo: data[campo] for campo in progreso_servicio.METRICAS if campo in data}
+            evento.update(usuario_id=int(usuario_id), parada_id=int(parada_id))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'usuario_id y parada_id deben ser enteros'}), 400
+        
+        # Un evento sin progreso al que aplicarse no llega a la cola
+        existe = db.session.execute(
+            select(Progreso.id).where(Progreso.usuario_id == evento['usuario_id'],
+                                      Progreso.parada_id == evento['parada_id'])
+        ).first()
+        if existe is None:
+            return jsonify({'error': 'Progreso no encontrado'}), 404
+        
+        return jsonify({
+            'mensaje': 'Parada recibida, se aplicará en segundo plano',
+            'evento_id': cola_progreso.encolar('completar', evento),
+            'siguiente_parada_id': indice_paradas.obtener().siguiente(evento['parada_id'])
+        }), 202
     
     try:
-        # Activar la siguiente parada
-        parada_actual = Parada.query.get(parada_id)
-        siguiente_parada = Parada.query.filter(Parada.orden > parada_actual.orden).order_by(Parada.orden).first()
+        resultado, progreso_actual, siguiente_parada_id = progreso_servicio.completar(usuario_id, parada_id, data)
         
-        if siguiente_parada:
-            progreso_siguiente = Progreso.query.filter_by(
-                usuario_id=usuario_id,
-                parada_id=siguiente_parada.id
-            ).first()
-            
-            if progreso_siguiente and progreso_siguiente.estado == 'bloqueada':
-                progreso_siguiente.estado = 'activa'
-                progreso_siguiente.fecha_inicio = datetime.utcnow()
+        if resultado == 'no_encontrado':
+            return jsonify({'error': 'Progreso no encontrado'}), 404
+        if resultado == 'ya_completada':
+            return jsonify({'mensaje': 'Esta parada ya fue completada'}), 200
         
         db.session.commit()
         
         return jsonify({
             'mensaje': 'Parada completada correctamente',
             'progreso': progreso_actual.to_dict(),
-            'siguiente_parada_id': siguiente_parada.id if siguiente_parada else None
+            'siguiente_parada_id': siguiente_parada_id
         }), 200
         
     except Exception as e:
@@ -85,24 +94,104 @@ def completar_parada():
         return jsonify({'error': str(e)}), 500
 
 
+@progreso_bp.route('/progreso/sync', methods=['POST'])
+def sincronizar_progreso():
+    """Aplicar en una sola transacción varias paradas completadas sin conexión"""
+    data = request.get_json()
+    
+    if not data or not isinstance(data.get('completados'), list):
+        return jsonify({'error': 'Se requiere la lista completados'}), 400
+    
+    elementos = data['completados']
+    maximo = current_app.config.get('SYNC_MAX_ELEMENTOS', 500)
+    if len(elementos) > maximo:
+        return jsonify({'error': f'Máximo {maximo} elementos por sincronización'}), 400
+    
+    try:
+        resultados = progreso_servicio.aplicar_completados(elementos)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'mensaje': 'Sincronización completada',
+        'resultados': resultados
+    }), 200
+
+
+@progreso_bp.route('/progreso/checkin', methods=['POST'])
+def checkin():
+    """Comprobar si el dispositivo está dentro del radio de la parada activa del usuario (en ruta_id, si se indica)"""
+    data = request.get_json()
+    
+    if not data:
+        return jsonify({'error': 'No se proporcionaron datos'}), 400
+    
+    usuario_id = data.get('usuario_id')
+    parada_id = data.get('parada_id')
+    posicion = leer_posicion(data)
+    if not isinstance(usuario_id, int) or not isinstance(parada_id, (int, type(None))) or posicion is None:
+        return jsonify({'error': 'usuario_id, lat y lon son requeridos (parada_id opcional)'}), 400
+    
+    # Una lectura por índice de progreso; la distancia sale del índice en memoria
+    ruta_id = data['ruta_id'] if isinstance(data.get('ruta_id'), int) else None
+    filas = progreso_servicio.paradas_checkin(usuario_id, parada_id, ruta_id)
+    if not filas:
+        return jsonify({'error': 'El usuario no tiene ninguna parada activa'}), 404
+    if len(filas) > 1:
+        return jsonify({'error': 'El usuario tiene paradas activas en varias rutas: indica ruta_id'}), 400
+    fila = filas[0]
+    if fila.estado != 'activa':
+        return jsonify({'error': f'La parada {fila.parada_id} no es la activa ({fila.estado})'}), 409
+    
+    distancia = indice_paradas.obtener().distancia(fila.parada_id, *posicion)
+    if distancia is None:
+        abort(404)
+    radio = current_app.config.get('CHECKIN_RADIO', 50)
+    return jsonify({
+        'usuario_id': usuario_id,
+        'parada_id': fila.parada_id,
+        'en_rango': distancia <= radio,
+        'distancia': round(distancia, 1),
+        'radio': radio
+    }), 200
+
+
 @progreso_bp.route('/progreso/<int:id>', methods=['PUT'])
 def actualizar_progreso(id):
     """Actualizar un progreso específico"""
-    progreso = Progreso.query.get_or_404(id)
     data = request.get_json()
     
     if not data:
         return jsonify({'error': 'No se proporcionaron datos'}), 400
     
-    # Actualizar campos permitidos
-    if 'puntuacion' in data:
-        progreso.puntuacion = data['puntuacion']
-    if 'tiempo_empleado' in data:
-        progreso.tiempo_empleado = data['tiempo_empleado']
-    if 'intentos' in data:
-        progreso.intentos = data['intentos']
+    campo = progreso_servicio.metrica_invalida(data)
+    if campo:
+        return jsonify({'error': f'{campo} debe ser un entero'}), 400
+    
+    progreso = Progreso.query.get_or_404(id)
+    
+    # Con la revisión que vio la app, un reintento tras un timeout no pisa cambios posteriores
+    if 'revision' in data and data['revision'] != progreso.revision:
+        return jsonify({'error': 'El progreso cambió en el servidor', 'progreso': progreso.to_dict()}), 409
+    
+    if cola_progreso.activo():
+        evento = {campo: data[campo] for campo in progreso_servicio.METRICAS if campo in data}
+        evento['id'] = id
+        if 'revision' in data:
+            # Se vuelve a comprobar al aplicarlo: lo encolado antes puede cambiarla
+            evento['revision'] = data['revision']
+        return jsonify({
+            'mensaje': 'Progreso recibido, se aplicará en segundo plano',
+            'evento_id': cola_progreso.encolar('actualizar', evento)
+        }), 202
     
     try:
+        # Actualizar campos permitidos (y el ranking si ya está completada)
+        cambios = estadisticas.CambiosEstadisticas()
+        progreso_servicio.actualizar_metricas(progreso, data, cambios)
+        cambios.aplicar()
         db.session.commit()
         return jsonify(progreso.to_dict()), 200
     except Exception as e:
@@ -110,36 +199,54 @@ def actualizar_progreso(id):
         return jsonify({'error': str(e)}), 500
 
 
+@progreso_bp.route('/progreso/cola', methods=['GET'])
+def estado_cola():
+    """Estado de la cola write-behind (eventos pendientes y retraso)"""
+    return jsonify(cola_progreso.metricas()), 200
+
+
 @progreso_bp.route('/estadisticas', methods=['GET'])
 def estadisticas_generales():
     """Obtener estadísticas generales del sistema"""
-    from sqlalchemy import func
-    
-    total_usuarios = Usuario.query.count()
-    total_paradas = Parada.query.count()
-    total_completados = Progreso.query.filter_by(estado='completada').count()
-    total_activos = Progreso.query.filter_by(estado='activa').count()
-    
-    # Parada más completada
-    parada_popular = db.session.query(
-        Parada.nombre_corto,
-        func.count(Progreso.id).label('total')
-    ).join(Progreso).filter(
-        Progreso.estado == 'completada'
-    ).group_by(Parada.id).order_by(func.count(Progreso.id).desc()).first()
-    
-    # Usuarios que completaron todo
-    usuarios_completaron_todo = db.session.query(Usuario.id).join(Progreso).filter(
-        Progreso.estado == 'completada'
-    ).group_by(Usuario.id).having(
-        func.count(Progreso.id) == total_paradas
-    ).count()
-    
+    return jsonify(estadisticas.resumen(current_app.config['ESTADISTICAS_VENTANA_MS'] / 1000)), 200
+
+
+@progreso_bp.route('/estadisticas/embudo', methods=['GET'])
+def obtener_embudo():
+    """Embudo, tiempos por parada, intentos y carga horaria de cada ruta (?ruta_id= para una)"""
+    ruta_id = request.args.get('ruta_id', type=int)
+    if ruta_id is not None and not indice_paradas.obtener().existe_ruta(ruta_id):
+        abort(404)
+
+    instantanea = analitica.embudo(current_app.config['ANALITICA_TTL'])
+    if ruta_id is None:
+        return jsonify(instantanea), 200
     return jsonify({
-        'total_usuarios': total_usuarios,
-        'total_paradas': total_paradas,
-        'total_completados': total_completados,
-        'total_activos': total_activos,
-        'parada_mas_popular': parada_popular[0] if parada_popular else None,
-        'usuarios_completaron_todo': usuarios_completaron_todo
+        'generado': instantanea['generado'],
+        'rutas': [ruta for ruta in instantanea['rutas'] if ruta['ruta_id'] == ruta_id]
     }), 200
+
+
+@progreso_bp.route('/ranking', methods=['GET'])
+def obtener_ranking():
+    """Ranking por puntuación (?limit=, ?around=usuario_id; ?fecha=AAAA-MM-DD o ?parada_id= para las variantes)"""
+    maximo = current_app.config.get('RANKING_LIMITE_MAXIMO', 100)
+    limite = min(max(request.args.get('limit', type=int) or current_app.config.get('RANKING_LIMITE', 10), 1), maximo)
+    try:
+        fecha = date.fromisoformat(request.args['fecha']) if request.args.get('fecha') else None
+    except ValueError:
+        return jsonify({'error': 'fecha debe tener el formato AAAA-MM-DD'}), 400
+    parada_id = request.args.get('parada_id', type=int)
+    if parada_id is not None and not indice_paradas.obtener().existe(parada_id):
+        abort(404)
+    
+    clasificacion = ranking.clasificacion(fecha, parada_id, current_app.config.get('RANKING_TTL', 5))
+    datos = {'total': clasificacion.total}
+    around = request.args.get('around', type=int)
+    if around is None:
+        datos['ranking'] = clasificacion.primeros(limite)
+    else:
+        datos['usuario'], datos['ranking'] = clasificacion.alrededor(around, limite)
+        if datos['usuario'] is None:
+            return jsonify({'error': 'El usuario no tiene paradas completadas en este ranking'}), 404
+    return jsonify(datos), 200
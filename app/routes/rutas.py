@@ -0,0 +1,91 @@
+from flask import Blueprint, abort, current_app, jsonify, request
+from app import db
+from app.models import EstadisticaRuta, Ruta
+from app.routes.paradas import respuesta_catalogo
+from app.services import catalogo, estadisticas, indice_paradas
+from flask_login import login_required
+
+rutas_bp = Blueprint('rutas', __name__)
+
+
+@rutas_bp.route('/rutas', methods=['GET'])
+def obtener_rutas():
+    """Obtener todas las rutas (API pública)"""
+    return respuesta_catalogo(*catalogo.rutas_serializadas())
+
+
+@rutas_bp.route('/rutas/<int:id>', methods=['GET'])
+def obtener_ruta(id):
+    """Obtener una ruta específica"""
+    serializada = catalogo.ruta_serializada(id)
+    if serializada is None:
+        abort(404)
+    return respuesta_catalogo(*serializada)
+
+
+@rutas_bp.route('/rutas/<int:id>/paradas', methods=['GET'])
+def obtener_paradas_ruta(id):
+    """Obtener las paradas de una ruta en orden"""
+    serializada = catalogo.lista_serializada(id)
+    if serializada is None:
+        abort(404)
+    return respuesta_catalogo(*serializada)
+
+
+@rutas_bp.route('/rutas/<int:id>/estadisticas', methods=['GET'])
+def estadisticas_ruta(id):
+    """Obtener las estadísticas de una ruta"""
+    if not indice_paradas.obtener().existe_ruta(id):
+        abort(404)
+    return jsonify(estadisticas.resumen_ruta(id, current_app.config['ESTADISTICAS_VENTANA_MS'] / 1000)), 200
+
+
+@rutas_bp.route('/rutas', methods=['POST'])
+@login_required
+def crear_ruta():
+    """Crear una nueva ruta (requiere autenticación)"""
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': 'No se proporcionaron datos'}), 400
+
+    for campo in ('slug', 'nombre'):
+        if campo not in data:
+            return jsonify({'error': f'Campo requerido: {campo}'}), 400
+
+    nueva_ruta = Ruta(slug=data['slug'], nombre=data['nombre'], descripcion=data.get('descripcion'))
+
+    try:
+        db.session.add(nueva_ruta)
+        nueva_ruta.estadistica = EstadisticaRuta()
+        catalogo.incrementar_version()
+        db.session.commit()
+        catalogo.invalidar()
+        return jsonify(nueva_ruta.to_dict()), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@rutas_bp.route('/rutas/<int:id>', methods=['PUT'])
+@login_required
+def actualizar_ruta(id):
+    """Actualizar una ruta existente"""
+    ruta = Ruta.query.get_or_404(id)
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': 'No se proporcionaron datos'}), 400
+
+    for campo in ('slug', 'nombre', 'descripcion'):
+        if campo in data:
+            setattr(ruta, campo, data[campo])
+
+    try:
+        catalogo.incrementar_version()
+        db.session.commit()
+        catalogo.invalidar()
+        return jsonify(ruta.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
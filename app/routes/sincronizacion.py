@@ -0,0 +1,63 @@
+from flask import Blueprint, abort, current_app, jsonify, request
+from app import db
+from app.models import Usuario
+from app.services import sincronizacion
+
+sincronizacion_bp = Blueprint('sincronizacion', __name__)
+
+
+@sincronizacion_bp.route('/sync/changes', methods=['GET'])
+def obtener_cambios():
+    """Progresos de ?usuario_id= modificados después de la revisión ?since= (0 para todos)"""
+    usuario_id = request.args.get('usuario_id', type=int)
+    desde = request.args.get('since', 0, type=int)
+    if usuario_id is None:
+        return jsonify({'error': 'usuario_id es requerido'}), 400
+
+    revision, cambios = sincronizacion.cambios_desde(usuario_id, desde)
+    if revision is None:
+        abort(404)
+
+    return jsonify({
+        'usuario_id': usuario_id,
+        'revision': revision,
+        'cambios': cambios
+    }), 200
+
+
+@sincronizacion_bp.route('/sync/push', methods=['POST'])
+def enviar_cambios():
+    """Aplicar los cambios hechos sin conexión y devolver los del servidor desde ``since``"""
+    data = request.get_json()
+
+    if not data or not isinstance(data.get('usuario_id'), int) or not isinstance(data.get('cambios'), list):
+        return jsonify({'error': 'Se requieren usuario_id y la lista cambios'}), 400
+
+    elementos = data['cambios']
+    maximo = current_app.config.get('SYNC_MAX_ELEMENTOS', 500)
+    if len(elementos) > maximo:
+        return jsonify({'error': f'Máximo {maximo} elementos por sincronización'}), 400
+
+    desde = data.get('since')
+    if desde is not None and not isinstance(desde, int):
+        return jsonify({'error': 'since debe ser una revisión (entero)'}), 400
+
+    usuario = db.session.get(Usuario, data['usuario_id'])
+    if usuario is None:
+        abort(404)
+
+    try:
+        resultados = sincronizacion.aplicar_cambios(data['usuario_id'], elementos,
+                                                    current_app.config.get('SYNC_RESOLUCION', 'max'))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    respuesta = {'usuario_id': usuario.id, 'resultados': resultados}
+    if desde is None:
+        respuesta['revision'] = usuario.revision
+    else:
+        # Lo aplicado y lo que cambió en el servidor, en la misma respuesta
+        respuesta['revision'], respuesta['cambios'] = sincronizacion.cambios_desde(usuario.id, desde)
+    return jsonify(respuesta), 200
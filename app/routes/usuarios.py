@@ -1,16 +1,51 @@
-from flask import Blueprint, jsonify, request
-from app import db
-from app.models import Usuario, Progreso, Parada
+import logging
 from datetime import datetime
 
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context, url_for
+from app import db
+from app.models import Usuario
+from app.services import estadisticas, indice_paradas, paginacion, registro
+from app.services import progreso as progreso_servicio
+
 usuarios_bp = Blueprint('usuarios', __name__)
+logger = logging.getLogger(__name__)
 
 
 @usuarios_bp.route('/usuarios', methods=['GET'])
 def obtener_usuarios():
-    """Obtener todos los usuarios"""
-    usuarios = Usuario.query.order_by(Usuario.fecha_registro.desc()).all()
-    return jsonify([usuario.to_dict() for usuario in usuarios]), 200
+    """Listar usuarios por páginas (?cursor=, ?limit=, ?fields=) o en streaming (?stream=ndjson)"""
+    streaming = request.args.get('stream') == 'ndjson'
+    limite = request.args.get('limit', type=int)
+    if not streaming:
+        maximo = current_app.config.get('USUARIOS_LIMITE_MAXIMO', 1000)
+        limite = min(max(limite or current_app.config.get('USUARIOS_LIMITE', 100), 1), maximo)
+    
+    try:
+        campos = paginacion.validar_campos(request.args.get('fields'))
+        consulta = paginacion.consulta_usuarios(campos, request.args.get('cursor'), limite)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if streaming:
+        # Una línea JSON por usuario, leyendo del cursor de servidor por lotes
+        consulta = consulta.execution_options(yield_per=paginacion.LOTE_STREAMING)
+        
+        def generar():
+            for fila in db.session.execute(consulta):
+                yield current_app.json.dumps(paginacion.fila_a_dict(fila, campos)) + '\n'
+        
+        return Response(stream_with_context(generar()), mimetype='application/x-ndjson'), 200
+    
+    filas = db.session.execute(consulta).all()
+    respuesta = jsonify([paginacion.fila_a_dict(fila, campos) for fila in filas])
+    
+    # El cuerpo sigue siendo una lista; la página siguiente va en las cabeceras
+    siguiente = paginacion.siguiente_cursor(filas, limite)
+    if siguiente:
+        argumentos = dict(request.args, cursor=siguiente)
+        respuesta.headers['X-Next-Cursor'] = siguiente
+        respuesta.headers['Link'] = f'<{url_for("usuarios.obtener_usuarios", _external=True, **argumentos)}>; rel="next"'
+    return respuesta, 200
 
 
 @usuarios_bp.route('/usuarios/<int:id>', methods=['GET'])
@@ -32,69 +67,87 @@ def registrar_usuario():
     if 'nombre' not in data or 'apellido' not in data:
         return jsonify({'error': 'Nombre y apellido son requeridos'}), 400
     
-    # Lógica Inteligente: buscar si ya existe este usuario exacto en este dispositivo
-    nombre = data.get('nombre')
-    apellido = data.get('apellido')
-    device_id = data.get('device_id')
-    
-    usuario = Usuario.query.filter_by(
-        nombre=nombre, 
-        apellido=apellido, 
-        device_id=device_id
-    ).first()
-    
-    if not usuario:
-        # Si no existe, lo creamos
-        print(f"🆕 Creando nuevo usuario: {nombre}")
-        usuario = Usuario(
-            nombre=nombre,
-            apellido=apellido,
-            device_id=device_id
-        )
-        db.session.add(usuario)
-        db.session.flush()
-    else:
-        print(f"♻️ Recuperando usuario existente: {nombre}")
+    ruta_id = data.get('ruta_id')
+    if ruta_id is not None and not indice_paradas.obtener().existe_ruta(ruta_id):
+        return jsonify({'error': 'Ruta no encontrada'}), 404
     
+    # Lógica Inteligente: si ya existe este usuario exacto en este dispositivo se recupera
+    # (y si se indica otra ruta, se le crea el progreso en ella)
     try:
-        # Inicializar progreso solo si no tiene (por si se reseteó la BD)
-        progresos_existentes = Progreso.query.filter_by(usuario_id=usuario.id).count()
-        
-        if progresos_existentes == 0:
-            print(f"🔄 Inicializando progreso para usuario {usuario.id}...")
-            paradas = Parada.query.order_by(Parada.orden).all()
-            for parada in paradas:
-                estado = 'activa' if parada.orden == 1 else 'bloqueada'
-                progreso = Progreso(
-                    usuario_id=usuario.id,
-                    parada_id=parada.id,
-                    estado=estado,
-                    fecha_inicio=datetime.utcnow() if estado == 'activa' else None
-                )
-                db.session.add(progreso)
-            db.session.commit()
-            print(f"✅ Progreso verificado/creado para usuario {usuario.id}")
+        usuario, nuevo = registro.registrar([data], ruta_id)[0]
+        datos = usuario.to_dict()
+        db.session.commit()
+        logger.info("%s usuario %s: %s", '🆕 Creado nuevo' if nuevo else '♻️ Recuperado', datos['id'], datos['nombre'],
+                    extra={'usuario_id': datos['id'], 'nuevo': nuevo})
         
         return jsonify({
             'mensaje': 'Usuario procesado correctamente',
-            'usuario': usuario.to_dict()
+            'usuario': datos
         }), 200
         
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Error en registro: {str(e)}")
+        logger.exception("❌ Error en registro: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+@usuarios_bp.route('/usuarios/registro/lote', methods=['POST'])
+def registrar_grupo():
+    """Registrar un grupo completo (p. ej. una clase) en una sola transacción"""
+    data = request.get_json()
+    
+    if not data or not isinstance(data.get('usuarios'), list) or not data['usuarios']:
+        return jsonify({'error': 'Se requiere la lista usuarios'}), 400
+    
+    personas = data['usuarios']
+    maximo = current_app.config.get('REGISTRO_LOTE_MAXIMO', 100)
+    if len(personas) > maximo:
+        return jsonify({'error': f'Máximo {maximo} usuarios por lote'}), 400
+    
+    for indice, persona in enumerate(personas):
+        if not isinstance(persona, dict) or 'nombre' not in persona or 'apellido' not in persona:
+            return jsonify({'error': f'Nombre y apellido son requeridos (usuario {indice})'}), 400
+    
+    ruta_id = data.get('ruta_id')
+    if ruta_id is not None and not indice_paradas.obtener().existe_ruta(ruta_id):
+        return jsonify({'error': 'Ruta no encontrada'}), 404
+    
+    try:
+        registrados = registro.registrar(personas, ruta_id)
+        datos = [dict(usuario.to_dict(), nuevo=nuevo) for usuario, nuevo in registrados]
+        db.session.commit()
+        nuevos = sum(d['nuevo'] for d in datos)
+        logger.info("👥 Grupo registrado: %s nuevos de %s", nuevos, len(datos),
+                    extra={'nuevos': nuevos, 'total': len(datos)})
+        
+        return jsonify({
+            'mensaje': 'Usuarios procesados correctamente',
+            'usuarios': datos
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("❌ Error en registro de grupo: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
 @usuarios_bp.route('/usuarios/<int:id>/progreso', methods=['GET'])
 def obtener_progreso_usuario(id):
-    """Obtener el progreso completo de un usuario"""
-    usuario = Usuario.query.get_or_404(id)
-    progresos = Progreso.query.filter_by(usuario_id=id).join(Parada).order_by(Parada.orden).all()
+    """Obtener el progreso completo de un usuario con los datos de cada parada"""
+    try:
+        desde = progreso_servicio.leer_desde(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({'error': 'since debe ser una fecha ISO 8601'}), 400
+    
+    ahora = datetime.utcnow()
+    usuario, progresos = progreso_servicio.leer_progreso_publico(id, desde)
+    if usuario is None:
+        abort(404)
     
     return jsonify({
-        'usuario': usuario.to_dict(),
-        'progreso': [p.to_dict() for p in progresos]
+        'usuario': usuario,
+        'progreso': progresos,
+        'actualizado_hasta': ahora.isoformat()
     }), 200
 
 
@@ -104,7 +157,20 @@ def eliminar_usuario(id):
     usuario = Usuario.query.get_or_404(id)
     
     try:
+        cambios = estadisticas.CambiosEstadisticas()
+        cambios.usuarios -= 1
+        for progreso in usuario.progresos:
+            cambios.transicion(progreso.parada_id, progreso.estado, None)
+            if progreso.estado == 'completada':
+                cambios.cronometrar(progreso.parada_id, progreso.tiempo_empleado, None)
+        indice = indice_paradas.obtener()
+        for ruta_id in {progreso.ruta_id for progreso in usuario.progresos}:
+            cambios.rutas[ruta_id]['usuarios'] -= 1
+            if estadisticas.completo_ruta(usuario.progresos, ruta_id, indice.total_ruta(ruta_id)):
+                cambios.rutas[ruta_id]['usuarios_completaron_todo'] -= 1
+        
         db.session.delete(usuario)
+        cambios.aplicar()
         db.session.commit()
         return jsonify({'mensaje': 'Usuario eliminado correctamente'}), 200
     except Exception as e:
@@ -1,8 +1,11 @@
-from flask import Blueprint, render_template, current_app, request
+import time
+
+from flask import Blueprint, Response, abort, jsonify, render_template, current_app, request
 from flask_login import login_required
 from app import db
-from app.models import Usuario, Parada, Progreso
-from sqlalchemy import func
+from app.models import Parada
+from app.services import estadisticas, paginacion, panel
+from app.services import progreso as progreso_servicio
 
 web_bp = Blueprint('web', __name__)
 
@@ -10,52 +13,70 @@ web_bp = Blueprint('web', __name__)
 @web_bp.route('/')
 def index():
     """Página principal (pública)"""
-    total_usuarios = Usuario.query.count()
-    total_paradas = Parada.query.count()
-    total_completados = Progreso.query.filter_by(estado='completada').count()
+    resumen = estadisticas.resumen(current_app.config['ESTADISTICAS_VENTANA_MS'] / 1000)
     
     return render_template('index.html',
-                         total_usuarios=total_usuarios,
-                         total_paradas=total_paradas,
-                         total_completados=total_completados)
+                         total_usuarios=resumen['total_usuarios'],
+                         total_paradas=resumen['total_paradas'],
+                         total_completados=resumen['total_completados'])
 
 
 @web_bp.route('/dashboard')
 @login_required
 def dashboard():
     """Panel de control principal (requiere login)"""
+    datos = panel.datos(current_app.config['DASHBOARD_TTL'])
     
-    # Estadísticas generales
-    total_usuarios = Usuario.query.count()
-    total_paradas = Parada.query.count()
-    progreso_completado = Progreso.query.filter_by(estado='completada').count()
-    progreso_activo = Progreso.query.filter_by(estado='activa').count()
+    return render_template('dashboard.html',
+                         datos=datos,
+                         total_usuarios=datos['totales']['total_usuarios'],
+                         total_paradas=datos['totales']['total_paradas'],
+                         progreso_completado=datos['totales']['total_completados'],
+                         progreso_activo=datos['totales']['total_activos'],
+                         usuarios_recientes=datos['usuarios_recientes'],
+                         sse_disponible=request.environ.get('wsgi.multithread', False))
+
+
+@web_bp.route('/dashboard/datos')
+@login_required
+def dashboard_datos():
+    """Datos del panel en JSON (compartidos durante DASHBOARD_TTL segundos)"""
+    return jsonify(panel.datos(current_app.config['DASHBOARD_TTL'])), 200
+
+
+@web_bp.route('/dashboard/eventos')
+@login_required
+def dashboard_eventos():
+    """Cambios del panel en directo (Server-Sent Events)"""
+    config = current_app.config
+    # Un worker síncrono quedaría ocupado por la conexión: el panel consulta los datos periódicamente
+    if not request.environ.get('wsgi.multithread', False) or panel.suscriptores() >= config['DASHBOARD_SSE_MAXIMO']:
+        return Response('Actualizaciones en directo no disponibles\n', status=503, mimetype='text/plain',
+                        headers={'Retry-After': '30'})
     
-    # Usuarios recientes
-    usuarios_recientes = Usuario.query.order_by(Usuario.fecha_registro.desc()).limit(10).all()
+    duracion = config['DASHBOARD_SSE_DURACION']
+    codificar = current_app.json.dumps
     
-    # Estadísticas por parada
-    stats_paradas = db.session.query(
-        Parada.nombre_corto,
-        func.count(Progreso.id).label('total_completados')
-    ).join(Progreso).filter(
-        Progreso.estado == 'completada'
-    ).group_by(Parada.id).all()
+    def generar():
+        # El navegador se reconecta solo cuando se cierra la conexión
+        yield 'retry: 3000\n\n'
+        fin = time.monotonic() + duracion
+        with panel.Suscripcion() as suscripcion:
+            while time.monotonic() < fin:
+                cambios = suscripcion.esperar(timeout=min(15, max(fin - time.monotonic(), 0)))
+                if not cambios:
+                    yield ': ping\n\n'
+                for cambio in cambios:
+                    yield f'event: cambios\ndata: {codificar(cambio)}\n\n'
     
-    return render_template('dashboard.html',
-                         total_usuarios=total_usuarios,
-                         total_paradas=total_paradas,
-                         progreso_completado=progreso_completado,
-                         progreso_activo=progreso_activo,
-                         usuarios_recientes=usuarios_recientes,
-                         stats_paradas=stats_paradas)
+    return Response(generar(), mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
 
 
 @web_bp.route('/mapa')
 @login_required
 def mapa():
     """Mapa interactivo con todas las paradas"""
-    paradas = Parada.query.order_by(Parada.orden).all()
+    paradas = Parada.query.order_by(Parada.ruta_id, Parada.orden).all()
     api_key = current_app.config.get('GOOGLE_MAPS_API_KEY', '')
     
     return render_template('mapa.html', paradas=paradas, api_key=api_key)
@@ -64,21 +85,30 @@ def mapa():
 @web_bp.route('/usuarios')
 @login_required
 def usuarios():
-    """Lista de todos los usuarios"""
-    page = request.args.get('page', 1, type=int)
-    usuarios = Usuario.query.order_by(Usuario.fecha_registro.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    """Lista de todos los usuarios (paginada por cursor)"""
+    por_pagina = 20
+    cursor = request.args.get('cursor')
+    try:
+        consulta = paginacion.consulta_usuarios(paginacion.CAMPOS_USUARIO, cursor, por_pagina)
+    except ValueError:
+        cursor = None
+        consulta = paginacion.consulta_usuarios(paginacion.CAMPOS_USUARIO, None, por_pagina)
+    usuarios = db.session.execute(consulta).all()
     
-    return render_template('usuarios.html', usuarios=usuarios)
+    return render_template('usuarios.html',
+                         usuarios=usuarios,
+                         total=estadisticas.obtener_globales().total_usuarios,
+                         primera_pagina=cursor is None,
+                         siguiente_cursor=paginacion.siguiente_cursor(usuarios, por_pagina))
 
 
 @web_bp.route('/usuarios/<int:id>')
 @login_required
 def usuario_detalle(id):
     """Detalle de un usuario específico con su progreso"""
-    usuario = Usuario.query.get_or_404(id)
-    progresos = Progreso.query.filter_by(usuario_id=id).join(Parada).order_by(Parada.orden).all()
+    usuario, progresos = progreso_servicio.leer_progreso(id)
+    if usuario is None:
+        abort(404)
     
     return render_template('usuario_detalle.html', usuario=usuario, progresos=progresos)
 
@@ -87,5 +117,5 @@ def usuario_detalle(id):
 @login_required
 def admin():
     """Panel de administración para gestionar paradas"""
-    paradas = Parada.query.order_by(Parada.orden).all()
+    paradas = Parada.query.order_by(Parada.ruta_id, Parada.orden).all()
     return render_template('admin.html', paradas=paradas)
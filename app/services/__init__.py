@@ -0,0 +1 @@
+# Paquete de servicios
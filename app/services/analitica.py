@@ -0,0 +1,159 @@
+"""Embudo del recorrido y tiempos por parada calculados con NumPy.
+
+``embudo()`` lee de una vez las columnas del progreso que necesita (parada,
+estado, tiempo empleado, intentos y fecha de completado), las convierte en
+arrays y calcula todas las métricas con operaciones vectorizadas:
+
+- Embudo: usuarios que llegaron a cada parada (activa o completada), los que
+  la completaron, los que se quedaron entre esa parada y la anterior y la
+  tasa de paso.
+- Tiempo empleado por parada: percentiles 50, 75 y 90 de las completadas.
+- Distribución de intentos por parada (el último cubo es ``INTENTOS_MAXIMO`` o más).
+- Carga horaria: paradas completadas en cada hora del día (UTC) por ruta.
+
+El resultado es una instantánea que cada worker reutiliza durante
+``ANALITICA_TTL`` segundos; pasado ese tiempo la siguiente petición la vuelve a
+calcular y las que llegan a la vez esperan a ese mismo cálculo.
+"""
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select
+
+from app import db
+from app.coalescencia import VueloUnico
+from app.models import Progreso, Ruta
+from app.services import indice_paradas
+
+PERCENTILES = (50, 75, 90)
+INTENTOS_MAXIMO = 5
+HORAS = 24
+
+# Filas leídas por lote del cursor
+_LOTE = 10000
+
+_vuelos = VueloUnico()
+
+
+def _cargar():
+    """Columnas del progreso como arrays: parada, completada, alcanzada, tiempo, intentos, fecha"""
+    consulta = select(Progreso.parada_id, Progreso.estado, Progreso.tiempo_empleado,
+                      Progreso.intentos, Progreso.fecha_completado)
+    resultado = db.session.execute(consulta, execution_options={'yield_per': _LOTE})
+    trozos = []
+    for filas in resultado.partitions():
+        paradas, estados, tiempos, intentos, fechas = zip(*filas)
+        estados = np.array(estados, dtype=object)
+        trozos.append((
+            np.array(paradas, dtype=np.int64),
+            estados == 'completada',
+            (estados == 'completada') | (estados == 'activa'),
+            np.array(tiempos, dtype=float),  # None -> NaN
+            np.array(intentos, dtype=float),
+            np.array(fechas, dtype='datetime64[s]'),  # None -> NaT
+        ))
+    if not trozos:
+        return (np.empty(0, np.int64), np.empty(0, bool), np.empty(0, bool),
+                np.empty(0), np.empty(0), np.empty(0, 'datetime64[s]'))
+    return tuple(np.concatenate(columna) for columna in zip(*trozos))
+
+
+def _percentiles(grupos, valores, total):
+    """Percentiles de ``valores`` por grupo (``total`` grupos) con interpolación lineal
+
+    Se ordena una sola vez por (grupo, valor); cada grupo queda en un tramo
+    contiguo y cada percentil se lee por posición. Los grupos vacíos dan NaN.
+    """
+    orden = np.lexsort((valores, grupos))
+    valores = valores[orden]
+    cuantos = np.bincount(grupos, minlength=total)
+    inicios = np.concatenate(([0], np.cumsum(cuantos)[:-1]))
+    resultado = np.full((total, len(PERCENTILES)), np.nan)
+    con_datos = cuantos > 0
+    if not con_datos.any():
+        return resultado
+    for columna, percentil in enumerate(PERCENTILES):
+        posicion = inicios[con_datos] + (cuantos[con_datos] - 1) * percentil / 100
+        bajo = np.floor(posicion).astype(np.int64)
+        alto = np.ceil(posicion).astype(np.int64)
+        resultado[con_datos, columna] = valores[bajo] + (valores[alto] - valores[bajo]) * (posicion - bajo)
+    return resultado
+
+
+def _numero(valor):
+    return None if np.isnan(valor) else round(float(valor), 1)
+
+
+def _calcular():
+    indice = indice_paradas.obtener()
+    ids = np.array(indice.ids, dtype=np.int64)
+    total = len(ids)
+    parada_ids, completada, alcanzada, tiempos, intentos, fechas = _cargar()
+
+    # Posición de cada fila en el índice de paradas (ordenado por ruta y orden)
+    posicion_de = np.full(int(max(ids.max(initial=0), parada_ids.max(initial=0))) + 1, -1, dtype=np.int64)
+    posicion_de[ids] = np.arange(total)
+    grupos = posicion_de[parada_ids]
+    validas = grupos >= 0
+    grupos, completada, alcanzada = grupos[validas], completada[validas], alcanzada[validas]
+    tiempos, intentos, fechas = tiempos[validas], intentos[validas], fechas[validas]
+
+    inscritos = np.bincount(grupos, minlength=total)
+    alcanzaron = np.bincount(grupos[alcanzada], minlength=total)
+    completaron = np.bincount(grupos[completada], minlength=total)
+
+    con_tiempo = completada & ~np.isnan(tiempos)
+    percentiles = _percentiles(grupos[con_tiempo], tiempos[con_tiempo], total)
+
+    cubos = np.clip(np.nan_to_num(intentos[completada]), 0, INTENTOS_MAXIMO).astype(np.int64)
+    distribucion = np.bincount(grupos[completada] * (INTENTOS_MAXIMO + 1) + cubos,
+                               minlength=total * (INTENTOS_MAXIMO + 1)).reshape(total, INTENTOS_MAXIMO + 1)
+
+    # Carga horaria por ruta: (ruta, hora) aplanado en un solo bincount
+    rutas = list(indice.por_ruta)
+    longitudes = [len(indice.por_ruta[ruta_id]) for ruta_id in rutas]
+    ruta_de = np.repeat(np.arange(len(rutas)), longitudes)
+    con_fecha = completada & ~np.isnat(fechas)
+    horas = (fechas[con_fecha].astype(np.int64) // 3600) % HORAS
+    carga = np.bincount(ruta_de[grupos[con_fecha]] * HORAS + horas,
+                        minlength=len(rutas) * HORAS).reshape(len(rutas), HORAS)
+
+    nombres = dict(db.session.execute(select(Ruta.id, Ruta.nombre)).all())
+    resultado = []
+    primera = 0
+    for numero, ruta_id in enumerate(rutas):
+        # Las paradas de la ruta son un tramo contiguo del índice
+        usuarios = int(inscritos[primera]) if longitudes[numero] else 0
+        anteriores = usuarios
+        paradas = []
+        for posicion in range(primera, primera + longitudes[numero]):
+            parada_id = indice.ids[posicion]
+            completan = int(completaron[posicion])
+            paradas.append({
+                'parada_id': parada_id,
+                'orden': indice.orden[parada_id],
+                'nombre_corto': indice.nombres[parada_id],
+                'alcanzaron': int(alcanzaron[posicion]),
+                'completaron': completan,
+                'abandono': anteriores - completan,
+                'tasa_paso': round(completan / anteriores, 3) if anteriores else None,
+                'tiempo': {f'p{percentil}': _numero(valor)
+                           for percentil, valor in zip(PERCENTILES, percentiles[posicion])},
+                'intentos': distribucion[posicion].tolist(),
+            })
+            anteriores = completan
+        primera += longitudes[numero]
+        resultado.append({
+            'ruta_id': ruta_id,
+            'nombre': nombres.get(ruta_id),
+            'usuarios': usuarios,
+            'paradas': paradas,
+            'carga_horaria': carga[numero].tolist(),
+        })
+
+    return {'generado': datetime.utcnow(), 'rutas': resultado}
+
+
+def embudo(ttl=0.0):
+    """Instantánea de las métricas de todas las rutas (compartida: no modificar)"""
+    return _vuelos.hacer('embudo', _calcular, ttl)
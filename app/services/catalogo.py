@@ -0,0 +1,118 @@
+"""Caché en memoria del catálogo de rutas y paradas.
+
+El catálogo apenas cambia, así que las lecturas públicas se sirven desde
+JSON ya serializado: el listado completo, el de cada ruta y cada parada o
+ruta sueltas. La caché se identifica con un contador de versión
+guardado en ``contadores_version`` que las rutas de administración
+incrementan; cada proceso lo vuelve a consultar como mucho cada
+``CATALOGO_TTL_VERSION`` segundos para enterarse de cambios hechos por
+otros workers.
+"""
+import hashlib
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import update
+
+from app import db
+from app.models import ContadorVersion, Parada, Ruta
+
+NOMBRE_VERSION = 'catalogo'
+
+# Reentrante: en el servidor ASGI (asgi.py) las peticiones comparten hilo y
+# una puede ceder el control esperando a la base de datos con el lock tomado
+_lock = threading.RLock()
+_estado = {
+    'version': None,       # Versión comprobada en la base de datos
+    'comprobado': 0.0,     # Momento de la última comprobación
+    'cache_version': None, # Versión con la que se serializó la caché
+    'lista': None,         # (cuerpo, etag) de /paradas
+    'paradas': {},         # id -> (cuerpo, etag) de /paradas/<id>
+    'rutas': None,         # (cuerpo, etag) de /rutas
+    'ruta': {},            # id -> (cuerpo, etag) de /rutas/<id>
+    'paradas_ruta': {},    # id de ruta -> (cuerpo, etag) de /rutas/<id>/paradas
+}
+
+
+def _serializar(datos):
+    cuerpo = current_app.json.dumps(datos).encode('utf-8')
+    return cuerpo, hashlib.sha256(cuerpo).hexdigest()[:32]
+
+
+def incrementar_version():
+    """Incrementar la versión del catálogo dentro de la transacción actual"""
+    tabla = ContadorVersion.__table__
+    resultado = db.session.execute(
+        update(tabla)
+        .where(tabla.c.nombre == NOMBRE_VERSION)
+        .values(version=tabla.c.version + 1)
+    )
+    if resultado.rowcount != 1:
+        db.session.add(ContadorVersion(nombre=NOMBRE_VERSION, version=1))
+
+
+def invalidar():
+    """Forzar la comprobación de versión en la siguiente lectura (tras el commit)"""
+    with _lock:
+        _estado['comprobado'] = 0.0
+
+
+def version_actual():
+    """Versión del catálogo, consultando la base de datos como mucho cada TTL"""
+    ttl = current_app.config.get('CATALOGO_TTL_VERSION', 5)
+    ahora = time.monotonic()
+    if _estado['version'] is not None and ahora - _estado['comprobado'] < ttl:
+        return _estado['version']
+    
+    version = db.session.query(ContadorVersion.version).filter_by(
+        nombre=NOMBRE_VERSION
+    ).scalar() or 0
+    with _lock:
+        _estado['version'] = version
+        _estado['comprobado'] = ahora
+    return version
+
+
+def _cargar():
+    """Devolver el estado de la caché, regenerándolo si la versión cambió"""
+    version = version_actual()
+    if _estado['cache_version'] == version:
+        return _estado
+    
+    with _lock:
+        if _estado['cache_version'] != version:
+            rutas = [ruta.to_dict() for ruta in Ruta.query.order_by(Ruta.id).all()]
+            datos = [parada.to_dict() for parada in Parada.query.order_by(Parada.ruta_id, Parada.orden).all()]
+            por_ruta = {ruta['id']: [] for ruta in rutas}
+            for d in datos:
+                por_ruta.setdefault(d['ruta_id'], []).append(d)
+            _estado['lista'] = _serializar(datos)
+            _estado['paradas'] = {d['id']: _serializar(d) for d in datos}
+            _estado['rutas'] = _serializar(rutas)
+            _estado['ruta'] = {ruta['id']: _serializar(ruta) for ruta in rutas}
+            _estado['paradas_ruta'] = {ruta_id: _serializar(lista) for ruta_id, lista in por_ruta.items()}
+            _estado['cache_version'] = version
+    return _estado
+
+
+def lista_serializada(ruta_id=None):
+    """(cuerpo, etag) del listado completo de paradas o del de una ruta (None si no existe)"""
+    if ruta_id is None:
+        return _cargar()['lista']
+    return _cargar()['paradas_ruta'].get(ruta_id)
+
+
+def parada_serializada(parada_id):
+    """(cuerpo, etag) de una parada, o None si no existe"""
+    return _cargar()['paradas'].get(parada_id)
+
+
+def rutas_serializadas():
+    """(cuerpo, etag) del listado de rutas"""
+    return _cargar()['rutas']
+
+
+def ruta_serializada(ruta_id):
+    """(cuerpo, etag) de una ruta, o None si no existe"""
+    return _cargar()['ruta'].get(ruta_id)
@@ -0,0 +1,313 @@
+"""Cola local de eventos de progreso para el modo write-behind
+
+Con ``PROGRESO_WRITE_BEHIND`` activado, las rutas de progreso no escriben en
+la base de datos principal: guardan el evento en un fichero SQLite local
+(modo WAL, ``synchronous=FULL``) y responden ``202`` en cuanto está en disco.
+Un hilo por proceso reclama lotes de eventos, los aplica en una sola
+transacción de la base de datos principal y solo entonces los borra.
+
+Solo un proceso vacía la cola a la vez (el reclamo de un lote bloquea a los
+demás hasta que termina o caduca), así que los eventos se aplican en orden.
+La entrega es al menos una vez: si el proceso muere entre el commit y el
+borrado, el lote se vuelve a aplicar cuando caduca el reclamo. Completar una
+parada ya completada no cambia nada y las actualizaciones escriben los
+mismos valores, así que repetir un lote es inocuo.
+
+Si un lote falla por sus datos (no por la conexión), se vuelve a aplicar
+evento a evento y los que siguen fallando pasan a ``eventos_fallidos`` con
+su error, para que un evento erróneo no bloquee la cola. Los errores de
+conexión o de bloqueo liberan el lote para reintentarlo más tarde. Una
+actualización con ``revision`` se vuelve a comprobar al aplicarla: si el
+progreso cambió desde que se encoló, también acaba en ``eventos_fallidos``.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from app import db
+from app.models import Progreso
+from app.services import progreso as progreso_servicio
+from app.services.estadisticas import CambiosEstadisticas
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_local = threading.local()
+_estado = {
+    'app': None,
+    'ruta': None,
+    'pid': None,
+    'hilo': None,
+    'procesados': 0,
+    'ultimo_vaciado': None,
+    'errores_seguidos': 0
+}
+
+_ESQUEMA = (
+    """CREATE TABLE IF NOT EXISTS eventos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo TEXT NOT NULL,
+        datos TEXT NOT NULL,
+        creado REAL NOT NULL,
+        reclamado REAL,
+        reclamado_por TEXT
+    )""",
+    'CREATE INDEX IF NOT EXISTS ix_eventos_reclamado ON eventos (reclamado)',
+    """CREATE TABLE IF NOT EXISTS eventos_fallidos (
+        id INTEGER PRIMARY KEY,
+        tipo TEXT NOT NULL,
+        datos TEXT NOT NULL,
+        creado REAL NOT NULL,
+        fallido REAL NOT NULL,
+        error TEXT
+    )"""
+)
+
+
+def init_app(app):
+    """Registrar la ruta de la cola y arrancar el vaciado en cada proceso si el modo está activo"""
+    _estado['app'] = app
+    _estado['ruta'] = app.config.get('PROGRESO_COLA_RUTA') or \
+        os.path.join(app.instance_path, 'cola_progreso.db')
+    if app.config.get('PROGRESO_WRITE_BEHIND'):
+        # Con gunicorn los hilos no sobreviven al fork: se arranca en la primera petición
+        app.before_request(asegurar_hilo)
+
+
+def activo():
+    """Si las escrituras de progreso van a la cola en lugar de a la base de datos"""
+    return bool(current_app.config.get('PROGRESO_WRITE_BEHIND'))
+
+
+def _conexion():
+    """Conexión a la cola propia de cada hilo (y de cada proceso tras un fork)"""
+    conexion = getattr(_local, 'conexion', None)
+    if conexion is None or _local.pid != os.getpid():
+        conexion = sqlite3.connect(_estado['ruta'], timeout=30, isolation_level=None)
+        conexion.execute('PRAGMA journal_mode=WAL')
+        conexion.execute('PRAGMA synchronous=FULL')
+        for sentencia in _ESQUEMA:
+            conexion.execute(sentencia)
+        _local.conexion, _local.pid = conexion, os.getpid()
+    return conexion
+
+
+def encolar(tipo, datos):
+    """Guardar un evento en la cola; devuelve su id cuando ya está en disco"""
+    cursor = _conexion().execute(
+        'INSERT INTO eventos (tipo, datos, creado) VALUES (?, ?, ?)',
+        (tipo, json.dumps(datos), time.time())
+    )
+    return cursor.lastrowid
+
+
+def _reclamar(limite, caducidad, propietario):
+    """Reservar los eventos más antiguos si ningún otro proceso tiene un lote en curso"""
+    conexion = _conexion()
+    ahora = time.time()
+    conexion.execute('BEGIN IMMEDIATE')
+    try:
+        en_curso = conexion.execute(
+            'SELECT 1 FROM eventos WHERE reclamado >= ? LIMIT 1', (ahora - caducidad,)
+        ).fetchone()
+        filas = [] if en_curso else conexion.execute(
+            'SELECT id, tipo, datos FROM eventos ORDER BY id LIMIT ?', (limite,)
+        ).fetchall()
+        if filas:
+            conexion.executemany(
+                'UPDATE eventos SET reclamado = ?, reclamado_por = ? WHERE id = ?',
+                [(ahora, propietario, fila[0]) for fila in filas]
+            )
+        conexion.execute('COMMIT')
+    except Exception:
+        conexion.execute('ROLLBACK')
+        raise
+    return [(fila[0], fila[1], json.loads(fila[2])) for fila in filas]
+
+
+def _terminar(ids, propietario, borrar):
+    """Borrar (aplicados) o liberar (fallidos) los eventos de un lote propio"""
+    marcas = ','.join('?' * len(ids))
+    if borrar:
+        sentencia = f'DELETE FROM eventos WHERE reclamado_por = ? AND id IN ({marcas})'
+    else:
+        sentencia = f'UPDATE eventos SET reclamado = NULL, reclamado_por = NULL WHERE reclamado_por = ? AND id IN ({marcas})'
+    _conexion().execute(sentencia, [propietario, *ids])
+
+
+def _aplicar_tramo(tipo, eventos):
+    """Aplicar en la sesión actual eventos consecutivos del mismo tipo"""
+    if tipo == 'completar':
+        for resultado in progreso_servicio.aplicar_completados(eventos):
+            if resultado['resultado'] == 'invalido':
+                raise ValueError(f"Evento no válido: {resultado['error']}")
+    elif tipo == 'actualizar':
+        # Varias actualizaciones del mismo progreso se combinan (gana la última)
+        progresos = {p.id: p for p in Progreso.query.filter(Progreso.id.in_({e['id'] for e in eventos})).all()}
+        cambios = {}
+        for evento in eventos:
+            campo = progreso_servicio.metrica_invalida(evento)
+            if campo:
+                raise ValueError(f'Evento no válido: {campo} debe ser un entero')
+            progreso = progresos.get(evento['id'])
+            if progreso is None:
+                continue
+            datos = {campo: evento[campo] for campo in progreso_servicio.METRICAS if campo in evento}
+            previos = cambios.setdefault(evento['id'], {})
+            # La revisión que vio la app deja de valer si el progreso cambió (también en este
+            # tramo); reaplicar los mismos valores, como al repetir un lote, no es un conflicto
+            if ('revision' in evento and (previos or evento['revision'] != progreso.revision)
+                    and any(previos.get(campo, getattr(progreso, campo)) != valor for campo, valor in datos.items())):
+                raise ValueError('Evento no válido: el progreso cambió en el servidor')
+            previos.update(datos)
+        contadores = CambiosEstadisticas()
+        for progreso_id, datos in cambios.items():
+            progreso_servicio.actualizar_metricas(progresos[progreso_id], datos, contadores)
+        contadores.aplicar()
+    else:
+        raise ValueError(f'Tipo de evento desconocido: {tipo}')
+
+
+def _aplicar(eventos):
+    """Aplicar los eventos en orden; se agrupan solo los consecutivos del mismo tipo"""
+    tramo, tipo_tramo = [], None
+    for _, tipo, datos in eventos:
+        if tramo and tipo != tipo_tramo:
+            _aplicar_tramo(tipo_tramo, tramo)
+            tramo = []
+        tramo.append(datos)
+        tipo_tramo = tipo
+    _aplicar_tramo(tipo_tramo, tramo)
+
+
+def _transitorio(error):
+    """Errores de conexión o de bloqueo: el evento no tiene la culpa y se reintenta"""
+    return isinstance(error, (OperationalError, InterfaceError)) or getattr(error, 'connection_invalidated', False)
+
+
+def _apartar(evento_id, propietario, error):
+    """Mover un evento propio a ``eventos_fallidos`` con su error"""
+    conexion = _conexion()
+    conexion.execute('BEGIN IMMEDIATE')
+    try:
+        conexion.execute(
+            'INSERT OR REPLACE INTO eventos_fallidos (id, tipo, datos, creado, fallido, error) '
+            'SELECT id, tipo, datos, creado, ?, ? FROM eventos WHERE id = ? AND reclamado_por = ?',
+            (time.time(), str(error), evento_id, propietario)
+        )
+        conexion.execute('DELETE FROM eventos WHERE id = ? AND reclamado_por = ?', (evento_id, propietario))
+        conexion.execute('COMMIT')
+    except Exception:
+        conexion.execute('ROLLBACK')
+        raise
+
+
+def _vaciar_uno_a_uno(eventos, propietario):
+    """Aplicar cada evento en su propia transacción; los que fallan se apartan"""
+    aplicados = 0
+    for posicion, (evento_id, tipo, datos) in enumerate(eventos):
+        try:
+            _aplicar_tramo(tipo, [datos])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if _transitorio(e):
+                _terminar([fila[0] for fila in eventos[posicion:]], propietario, borrar=False)
+                raise
+            logger.error("❌ Evento %s de la cola apartado en eventos_fallidos: %s", evento_id, e)
+            _apartar(evento_id, propietario, e)
+            continue
+        _terminar([evento_id], propietario, borrar=True)
+        aplicados += 1
+    return aplicados
+
+
+def vaciar(app, limite=None):
+    """Aplicar un lote de eventos pendientes; devuelve cuántos salieron de la cola
+
+    El lote se aplica en una transacción. Si falla por los datos de algún
+    evento se repite evento a evento (ver ``_vaciar_uno_a_uno``).
+    """
+    propietario = uuid.uuid4().hex
+    eventos = _reclamar(limite or app.config.get('PROGRESO_COLA_LOTE', 500),
+                        app.config.get('PROGRESO_COLA_CADUCIDAD', 60), propietario)
+    if not eventos:
+        return 0
+    ids = [evento_id for evento_id, _, _ in eventos]
+
+    with app.app_context():
+        try:
+            _aplicar(eventos)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if _transitorio(e):
+                _terminar(ids, propietario, borrar=False)
+                raise
+            logger.warning("⚠️ Lote de la cola con errores (%s): se aplica evento a evento", e)
+            aplicados = _vaciar_uno_a_uno(eventos, propietario)
+        else:
+            _terminar(ids, propietario, borrar=True)
+            aplicados = len(ids)
+
+    _estado['procesados'] += aplicados
+    _estado['ultimo_vaciado'] = datetime.utcnow()
+    return len(ids)
+
+
+def _bucle(app):
+    """Vaciar la cola continuamente; espera más cuanto más seguidos sean los errores"""
+    intervalo = app.config.get('PROGRESO_COLA_INTERVALO', 0.5)
+    espera = intervalo
+    while True:
+        try:
+            aplicados = vaciar(app)
+            _estado['errores_seguidos'] = 0
+            espera = 0 if aplicados else intervalo
+        except Exception as e:
+            # El texto del error solo va al log: /api/progreso/cola es público
+            _estado['errores_seguidos'] += 1
+            logger.exception("❌ Error vaciando la cola de progreso: %s", e)
+            espera = min(max(espera, intervalo) * 2, 30)
+        time.sleep(espera)
+
+
+def asegurar_hilo():
+    """Arrancar el hilo de vaciado de este proceso si todavía no existe"""
+    hilo = _estado['hilo']
+    if _estado['pid'] == os.getpid() and hilo is not None and hilo.is_alive():
+        return
+    with _lock:
+        hilo = _estado['hilo']
+        if _estado['pid'] == os.getpid() and hilo is not None and hilo.is_alive():
+            return
+        hilo = threading.Thread(target=_bucle, args=(_estado['app'],),
+                                name='cola-progreso', daemon=True)
+        _estado.update(pid=os.getpid(), hilo=hilo)
+        hilo.start()
+
+
+def metricas():
+    """Tamaño y retraso de la cola (antigüedad del evento pendiente más viejo), sin detalles de errores"""
+    if not activo() and not os.path.exists(_estado['ruta']):
+        return {'activo': False, 'pendientes': 0, 'retraso_segundos': 0.0}
+
+    pendientes, mas_antiguo = _conexion().execute('SELECT COUNT(*), MIN(creado) FROM eventos').fetchone()
+    fallidos = _conexion().execute('SELECT COUNT(*) FROM eventos_fallidos').fetchone()[0]
+    return {
+        'activo': activo(),
+        'pendientes': pendientes,
+        'fallidos': fallidos,
+        'retraso_segundos': round(time.time() - mas_antiguo, 3) if mas_antiguo else 0.0,
+        'procesados_proceso': _estado['procesados'],
+        'ultimo_vaciado': _estado['ultimo_vaciado'].isoformat() if _estado['ultimo_vaciado'] else None,
+        'errores_seguidos': _estado['errores_seguidos']
+    }
@@ -0,0 +1,305 @@
+"""Contadores agregados de progreso.
+
+Las rutas de estadísticas leen de las tablas ``estadisticas_globales``,
+``estadisticas_rutas`` y ``estadisticas_paradas`` en lugar de recorrer
+``progreso`` y ``usuarios``.
+Cada escritura que cambia el estado de un progreso acumula sus variaciones
+en un ``CambiosEstadisticas`` y las aplica en la misma transacción.
+Los contadores los crea ``flask seed`` (o ``flask estadisticas
+reconstruir``); las lecturas no escriben y, si faltan, responden con ceros.
+"""
+import logging
+from collections import defaultdict
+
+from sqlalchemy import bindparam, func, update
+
+from app import db
+from app.coalescencia import VueloUnico
+from app.models import EstadisticaGlobal, EstadisticaParada, EstadisticaRuta, Parada, Progreso, Ruta, Usuario
+from app.services import indice_paradas, ranking
+
+logger = logging.getLogger(__name__)
+
+ID_GLOBAL = 1
+
+_vuelos = VueloUnico()
+
+# Estado de progreso -> contador de EstadisticaParada que lo refleja
+_CONTADOR_ESTADO = {
+    'completada': 'completados',
+    'activa': 'activos',
+}
+
+
+class CambiosEstadisticas:
+    """Acumula variaciones de los contadores para aplicarlas de una sola vez"""
+    
+    def __init__(self):
+        self.usuarios = 0
+        # Por ruta: usuarios con progreso en ella y usuarios que la completaron entera
+        self.rutas = defaultdict(lambda: {'usuarios': 0, 'usuarios_completaron_todo': 0})
+        self.paradas = defaultdict(lambda: {'completados': 0, 'activos': 0, 'tiempo_total': 0, 'tiempo_cuenta': 0})
+        # (usuario_id, fecha) -> variación de [puntuacion, tiempo_empleado, completadas]
+        self.puntuaciones = defaultdict(lambda: [0, 0, 0])
+    
+    def transicion(self, parada_id, anterior, nuevo):
+        """Registrar el paso de un progreso del estado ``anterior`` a ``nuevo``
+
+        ``None`` representa un progreso que se crea o se elimina.
+        """
+        if anterior == nuevo:
+            return
+        if anterior in _CONTADOR_ESTADO:
+            self.paradas[parada_id][_CONTADOR_ESTADO[anterior]] -= 1
+        if nuevo in _CONTADOR_ESTADO:
+            self.paradas[parada_id][_CONTADOR_ESTADO[nuevo]] += 1
+    
+    def cronometrar(self, parada_id, anterior, nuevo):
+        """Registrar el cambio del ``tiempo_empleado`` de un progreso completado
+
+        ``None`` es un progreso sin tiempo, o que deja de contar (se elimina).
+        """
+        if anterior == nuevo:
+            return
+        contadores = self.paradas[parada_id]
+        if anterior is not None:
+            contadores['tiempo_total'] -= int(anterior)
+            contadores['tiempo_cuenta'] -= 1
+        if nuevo is not None:
+            contadores['tiempo_total'] += int(nuevo)
+            contadores['tiempo_cuenta'] += 1
+    
+    def puntuar(self, usuario_id, fecha_completado, puntuacion=0, tiempo_empleado=0, completadas=0):
+        """Registrar una variación de los totales del ranking de un usuario
+
+        ``fecha_completado`` es la de la parada, para el ranking diario.
+        """
+        total = self.puntuaciones[(usuario_id, fecha_completado.date() if fecha_completado else None)]
+        for i, valor in enumerate((puntuacion, tiempo_empleado, completadas)):
+            total[i] += int(valor or 0)
+    
+    def vacio(self):
+        return not (self.usuarios or any(any(c.values()) for c in self.rutas.values()) or
+                    any(any(c.values()) for c in self.paradas.values()))
+    
+    def aplicar(self):
+        """Aplicar las variaciones en la transacción actual"""
+        if self.puntuaciones:
+            ranking.aplicar(self.puntuaciones)
+        if self.vacio():
+            return
+        # Las peticiones de este proceso no reutilizan el resumen anterior
+        _vuelos.olvidar()
+        
+        paradas = [
+            {'p_id': parada_id, 'd_completados': c['completados'], 'd_activos': c['activos'],
+             'd_tiempo_total': c['tiempo_total'], 'd_tiempo_cuenta': c['tiempo_cuenta']}
+            for parada_id, c in self.paradas.items() if any(c.values())
+        ]
+        # Las variaciones de las paradas se suman a las de su ruta
+        rutas = {ruta_id: dict(c, completados=0, activos=0) for ruta_id, c in self.rutas.items()}
+        indice = indice_paradas.obtener()
+        for p in paradas:
+            ruta = rutas.setdefault(indice.rutas.get(p['p_id']),
+                                    {'usuarios': 0, 'usuarios_completaron_todo': 0, 'completados': 0, 'activos': 0})
+            ruta['completados'] += p['d_completados']
+            ruta['activos'] += p['d_activos']
+        rutas.pop(None, None)
+        
+        tabla_global = EstadisticaGlobal.__table__
+        resultado = db.session.execute(
+            update(tabla_global)
+            .where(tabla_global.c.id == ID_GLOBAL)
+            .values(
+                total_usuarios=tabla_global.c.total_usuarios + self.usuarios,
+                total_completados=tabla_global.c.total_completados + sum(p['d_completados'] for p in paradas),
+                total_activos=tabla_global.c.total_activos + sum(p['d_activos'] for p in paradas),
+                usuarios_completaron_todo=tabla_global.c.usuarios_completaron_todo + sum(
+                    c['usuarios_completaron_todo'] for c in self.rutas.values())
+            )
+        )
+        
+        # Si todavía no existen los contadores se calculan desde cero,
+        # lo que ya incluye los cambios de esta transacción
+        if resultado.rowcount != 1:
+            reconstruir()
+            return
+        
+        if paradas:
+            tabla = EstadisticaParada.__table__
+            db.session.execute(
+                update(tabla)
+                .where(tabla.c.parada_id == bindparam('p_id'))
+                .values(
+                    completados=tabla.c.completados + bindparam('d_completados'),
+                    activos=tabla.c.activos + bindparam('d_activos'),
+                    tiempo_total=tabla.c.tiempo_total + bindparam('d_tiempo_total'),
+                    tiempo_cuenta=tabla.c.tiempo_cuenta + bindparam('d_tiempo_cuenta')
+                ),
+                paradas
+            )
+        rutas = [
+            {'r_id': ruta_id, 'd_usuarios': c['usuarios'], 'd_completados': c['completados'],
+             'd_activos': c['activos'], 'd_completaron_todo': c['usuarios_completaron_todo']}
+            for ruta_id, c in rutas.items() if any(c.values())
+        ]
+        if rutas:
+            tabla = EstadisticaRuta.__table__
+            db.session.execute(
+                update(tabla)
+                .where(tabla.c.ruta_id == bindparam('r_id'))
+                .values(
+                    usuarios=tabla.c.usuarios + bindparam('d_usuarios'),
+                    total_completados=tabla.c.total_completados + bindparam('d_completados'),
+                    total_activos=tabla.c.total_activos + bindparam('d_activos'),
+                    usuarios_completaron_todo=tabla.c.usuarios_completaron_todo + bindparam('d_completaron_todo')
+                ),
+                rutas
+            )
+
+
+def completo_ruta(progresos, ruta_id, total_paradas):
+    """Indica si ``progresos`` (los de un usuario, ya cargados) completan todas las paradas de la ruta"""
+    completadas = sum(1 for p in progresos if p.ruta_id == ruta_id and p.estado == 'completada')
+    return total_paradas > 0 and completadas == total_paradas
+
+
+def reconstruir():
+    """Recalcular todos los contadores a partir de las tablas de origen"""
+    _vuelos.olvidar()
+    db.session.flush()
+    paradas_ruta = dict(db.session.query(Parada.ruta_id, func.count(Parada.id)).group_by(Parada.ruta_id).all())
+    
+    por_parada = defaultdict(lambda: {'completados': 0, 'activos': 0})
+    filas = db.session.query(
+        Progreso.parada_id, Progreso.estado, func.count(Progreso.id)
+    ).filter(
+        Progreso.estado.in_(list(_CONTADOR_ESTADO))
+    ).group_by(Progreso.parada_id, Progreso.estado).all()
+    for parada_id, estado, total in filas:
+        por_parada[parada_id][_CONTADOR_ESTADO[estado]] = total
+    
+    # Suma y número de tiempos de los completados, para la media por parada
+    tiempos = {
+        parada_id: {'tiempo_total': int(total or 0), 'tiempo_cuenta': cuenta}
+        for parada_id, total, cuenta in db.session.query(
+            Progreso.parada_id, func.sum(Progreso.tiempo_empleado), func.count(Progreso.tiempo_empleado)
+        ).filter(
+            Progreso.estado == 'completada'
+        ).group_by(Progreso.parada_id).all()
+    }
+    
+    usuarios_ruta = dict(db.session.query(
+        Progreso.ruta_id, func.count(Progreso.usuario_id.distinct())
+    ).group_by(Progreso.ruta_id).all())
+    
+    completaron_todo = defaultdict(int)
+    filas = db.session.query(Progreso.ruta_id, func.count(Progreso.id)).filter(
+        Progreso.estado == 'completada'
+    ).group_by(Progreso.ruta_id, Progreso.usuario_id).all()
+    for ruta_id, completadas in filas:
+        if completadas == paradas_ruta.get(ruta_id):
+            completaron_todo[ruta_id] += 1
+    
+    EstadisticaParada.query.delete()
+    EstadisticaRuta.query.delete()
+    EstadisticaGlobal.query.delete()
+    por_ruta = defaultdict(lambda: {'completados': 0, 'activos': 0})
+    for parada_id, ruta_id in db.session.query(Parada.id, Parada.ruta_id).all():
+        db.session.add(EstadisticaParada(parada_id=parada_id, **por_parada[parada_id], **tiempos.get(parada_id, {})))
+        for contador, valor in por_parada[parada_id].items():
+            por_ruta[ruta_id][contador] += valor
+    for (ruta_id,) in db.session.query(Ruta.id).all():
+        db.session.add(EstadisticaRuta(
+            ruta_id=ruta_id,
+            usuarios=usuarios_ruta.get(ruta_id, 0),
+            total_completados=por_ruta[ruta_id]['completados'],
+            total_activos=por_ruta[ruta_id]['activos'],
+            usuarios_completaron_todo=completaron_todo[ruta_id]
+        ))
+    db.session.add(EstadisticaGlobal(
+        id=ID_GLOBAL,
+        total_usuarios=Usuario.query.count(),
+        total_completados=sum(c['completados'] for c in por_parada.values()),
+        total_activos=sum(c['activos'] for c in por_parada.values()),
+        usuarios_completaron_todo=sum(completaron_todo.values())
+    ))
+    db.session.flush()
+
+
+def _sin_calcular(modelo, **clave):
+    """Contadores a cero fuera de la sesión, para cuando todavía no se han calculado"""
+    logger.warning("⚠️ Faltan los contadores de %s: ejecuta `flask seed` o `flask estadisticas reconstruir`",
+                   modelo.__tablename__, extra={'tabla': modelo.__tablename__})
+    contadores = [c.name for c in modelo.__table__.columns if not c.primary_key]
+    return modelo(**clave, **dict.fromkeys(contadores, 0))
+
+
+def obtener_parada(parada_id):
+    """Contadores de una parada (solo lectura: a cero si todavía no existen)"""
+    return db.session.get(EstadisticaParada, parada_id) or _sin_calcular(EstadisticaParada, parada_id=parada_id)
+
+
+def obtener_globales():
+    """Fila de contadores globales (solo lectura: a cero si todavía no existe)"""
+    return db.session.get(EstadisticaGlobal, ID_GLOBAL) or _sin_calcular(EstadisticaGlobal, id=ID_GLOBAL)
+
+
+def completados_por_parada():
+    """Lista de (nombre_corto, completados) de las paradas con alguna completada"""
+    return db.session.query(
+        Parada.nombre_corto, EstadisticaParada.completados
+    ).join(EstadisticaParada).filter(
+        EstadisticaParada.completados > 0
+    ).order_by(Parada.orden).all()
+
+
+def parada_mas_popular(ruta_id=None):
+    """Nombre corto de la parada con más completados (de la ruta, si se indica), o None"""
+    consulta = db.session.query(Parada.nombre_corto).join(EstadisticaParada).filter(
+        EstadisticaParada.completados > 0
+    )
+    if ruta_id is not None:
+        consulta = consulta.filter(Parada.ruta_id == ruta_id)
+    fila = consulta.order_by(EstadisticaParada.completados.desc(), Parada.orden).first()
+    return fila[0] if fila else None
+
+
+def _calcular_resumen():
+    globales = obtener_globales()
+    return {
+        'total_usuarios': globales.total_usuarios,
+        'total_paradas': indice_paradas.obtener().total,
+        'total_completados': globales.total_completados,
+        'total_activos': globales.total_activos,
+        'parada_mas_popular': parada_mas_popular(),
+        'usuarios_completaron_todo': globales.usuarios_completaron_todo
+    }
+
+
+def resumen(ventana=0.0):
+    """Estadísticas públicas como diccionario (no modificar: se comparte)
+
+    Las peticiones simultáneas comparten un único cálculo y, con ``ventana``
+    (segundos), reutilizan el último durante ese tiempo. Los cambios hechos en
+    este proceso lo descartan; los de otros workers se ven al cerrar la ventana.
+    """
+    return _vuelos.hacer('resumen', _calcular_resumen, ventana)
+
+
+def _calcular_resumen_ruta(ruta_id):
+    contadores = db.session.get(EstadisticaRuta, ruta_id) or _sin_calcular(EstadisticaRuta, ruta_id=ruta_id)
+    return {
+        'ruta_id': ruta_id,
+        'total_usuarios': contadores.usuarios,
+        'total_paradas': indice_paradas.obtener().total_ruta(ruta_id),
+        'total_completados': contadores.total_completados,
+        'total_activos': contadores.total_activos,
+        'parada_mas_popular': parada_mas_popular(ruta_id),
+        'usuarios_completaron_todo': contadores.usuarios_completaron_todo
+    }
+
+
+def resumen_ruta(ruta_id, ventana=0.0):
+    """Estadísticas de una ruta existente, compartidas igual que ``resumen``"""
+    return _vuelos.hacer(('ruta', ruta_id), lambda: _calcular_resumen_ruta(ruta_id), ventana)
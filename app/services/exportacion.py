@@ -0,0 +1,160 @@
+"""Exportación del historial de progreso para análisis.
+
+Recorre el join ``usuarios ⋈ progreso ⋈ paradas`` con un cursor del lado del
+servidor (``yield_per``: en PostgreSQL un cursor con nombre) y lo convierte a
+bytes lote a lote, sin hidratar instancias del ORM. La memoria depende de
+``EXPORTACION_LOTE`` y no del número de filas, y el mismo generador sirve para
+la respuesta HTTP y para escribir el fichero desde la consola.
+
+Formatos:
+
+- ``csv``: una fila por progreso, fechas en ISO 8601.
+- ``parquet``: un row group por lote.
+- ``arrow``: formato de streaming de Arrow IPC.
+
+Parquet y Arrow necesitan ``pyarrow`` (``requirements-analitica.txt``).
+``desde`` y ``hasta`` filtran por la fecha de registro del usuario
+(``[desde, hasta)``), así que cada fichero contiene cohortes completas.
+"""
+import csv
+import io
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Parada, Progreso, Usuario
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Columnas exportadas: (nombre, columna, tipo)
+COLUMNAS = (
+    ('usuario_id', Usuario.id, 'entero'),
+    ('fecha_registro', Usuario.fecha_registro, 'fecha'),
+    ('ruta_id', Progreso.ruta_id, 'entero'),
+    ('parada_id', Progreso.parada_id, 'entero'),
+    ('orden', Parada.orden, 'entero'),
+    ('parada', Parada.nombre_corto, 'texto'),
+    ('estado', Progreso.estado, 'texto'),
+    ('fecha_inicio', Progreso.fecha_inicio, 'fecha'),
+    ('fecha_completado', Progreso.fecha_completado, 'fecha'),
+    ('puntuacion', Progreso.puntuacion, 'entero'),
+    ('tiempo_empleado', Progreso.tiempo_empleado, 'entero'),
+    ('intentos', Progreso.intentos, 'entero'),
+)
+
+# Formato: (tipo MIME, extensión)
+FORMATOS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+def disponible(formato):
+    """True si ``formato`` existe y sus dependencias están instaladas"""
+    return formato == 'csv' or (formato in FORMATOS and pyarrow is not None)
+
+
+def consulta(desde=None, hasta=None, ruta_id=None):
+    """SELECT del historial en el orden de exportación (cohorte, usuario, ruta, parada)"""
+    consulta = (
+        select(*(columna for _, columna, _ in COLUMNAS))
+        .select_from(Usuario)
+        .join(Progreso, Progreso.usuario_id == Usuario.id)
+        .join(Parada, Parada.id == Progreso.parada_id)
+        .order_by(Usuario.fecha_registro, Usuario.id, Progreso.ruta_id, Parada.orden)
+    )
+    if desde is not None:
+        consulta = consulta.where(Usuario.fecha_registro >= desde)
+    if hasta is not None:
+        consulta = consulta.where(Usuario.fecha_registro < hasta)
+    if ruta_id is not None:
+        consulta = consulta.where(Progreso.ruta_id == ruta_id)
+    return consulta
+
+
+def lotes(consulta, lote):
+    """Filas de ``consulta`` en listas de hasta ``lote`` filas leídas con un cursor del servidor"""
+    resultado = db.session.execute(consulta, execution_options={'yield_per': lote})
+    try:
+        yield from resultado.partitions()
+    finally:
+        resultado.close()
+
+
+def _csv(lotes):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator='\n')
+    escritor.writerow([nombre for nombre, _, _ in COLUMNAS])
+    for filas in lotes:
+        escritor.writerows(
+            [valor.isoformat() if hasattr(valor, 'isoformat') else valor for valor in fila]
+            for fila in filas
+        )
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _Tubo:
+    """Fichero de solo escritura que entrega lo escrito a trozos (pyarrow lo envuelve)"""
+
+    def __init__(self):
+        self.trozos = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        self.trozos.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self):
+        datos = b''.join(self.trozos)
+        self.trozos.clear()
+        return datos
+
+
+def _esquema():
+    tipos = {'entero': pyarrow.int64(), 'fecha': pyarrow.timestamp('us'), 'texto': pyarrow.string()}
+    return pyarrow.schema([(nombre, tipos[tipo]) for nombre, _, tipo in COLUMNAS])
+
+
+def _arrow(lotes, formato):
+    esquema = _esquema()
+    tubo = _Tubo()
+    if formato == 'parquet':
+        escritor = pyarrow.parquet.ParquetWriter(tubo, esquema, compression='zstd')
+    else:
+        escritor = pyarrow.ipc.new_stream(tubo, esquema)
+    for filas in lotes:
+        columnas = list(zip(*filas))
+        escritor.write_batch(pyarrow.record_batch(
+            [pyarrow.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)],
+            schema=esquema,
+        ))
+        yield tubo.vaciar()
+    escritor.close()
+    yield tubo.vaciar()
+
+
+def exportar(formato, desde=None, hasta=None, ruta_id=None, lote=5000):
+    """Generador de bytes con el historial en ``formato`` (ver ``disponible``)"""
+    filas = lotes(consulta(desde, hasta, ruta_id), lote)
+    if formato == 'csv':
+        return _csv(filas)
+    return _arrow(filas, formato)
@@ -0,0 +1,157 @@
+"""Índice en memoria de las rutas y del orden y la posición de sus paradas.
+
+Evita consultar las tablas ``rutas`` y ``paradas`` en cada parada completada
+o registro solo para conocer la ruta, la siguiente parada o el total de la
+ruta, y en cada búsqueda por cercanía. Todas las consultas son búsquedas en
+diccionarios, sin importar cuántas rutas haya. Se reconstruye cuando cambia la versión del catálogo (ver
+``app.services.catalogo``), tanto por cambios hechos en este proceso como en
+otros workers.
+
+Para las búsquedas por posición las paradas se reparten en una rejilla de
+celdas de ``CELDA_METROS``: una búsqueda solo mide la distancia a las
+paradas de las celdas que toca el círculo pedido.
+"""
+import math
+import threading
+from collections import defaultdict
+
+from app import db
+from app.models import Parada, Ruta
+from app.services import catalogo
+
+RADIO_TIERRA_METROS = 6371000.0
+METROS_POR_GRADO = math.pi * RADIO_TIERRA_METROS / 180
+
+# Lado de las celdas de la rejilla (en latitud; en longitud se ajusta a la
+# latitud media de las paradas)
+CELDA_METROS = 250.0
+
+
+def distancia_metros(lat1, lon1, lat2, lon2):
+    """Distancia en metros entre dos puntos (fórmula del semiverseno)"""
+    fi1, fi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((fi2 - fi1) / 2) ** 2
+         + math.cos(fi1) * math.cos(fi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * RADIO_TIERRA_METROS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class IndiceParadas:
+    """Instantánea inmutable de las rutas y del orden y la posición de las paradas
+    
+    ``filas`` son tuplas ``(id, ruta_id, orden, nombre_corto, latitud, longitud)``
+    ordenadas por ruta y orden; ``rutas`` son los ids de todas las rutas, la
+    primera es la ruta por defecto.
+    """
+    
+    def __init__(self, version, filas, rutas=()):
+        self.version = version
+        self.ids = tuple(fila[0] for fila in filas)
+        self.rutas = {fila[0]: fila[1] for fila in filas}
+        self.orden = {fila[0]: fila[2] for fila in filas}
+        self.nombres = {fila[0]: fila[3] for fila in filas}
+        self.posiciones = {fila[0]: (fila[4], fila[5]) for fila in filas}
+        self.total = len(self.ids)
+        
+        por_ruta = {ruta_id: [] for ruta_id in rutas}
+        for fila in filas:
+            por_ruta.setdefault(fila[1], []).append(fila[0])
+        self.por_ruta = {ruta_id: tuple(ids) for ruta_id, ids in por_ruta.items()}
+        self.ruta_defecto = next(iter(self.por_ruta), None)
+        self.siguientes = {}
+        for ids in self.por_ruta.values():
+            self.siguientes.update(zip(ids, ids[1:]))
+        
+        latitud_media = sum(lat for lat, _ in self.posiciones.values()) / self.total if self.total else 0.0
+        self.celda_lat = CELDA_METROS / METROS_POR_GRADO
+        self.celda_lon = self.celda_lat / max(math.cos(math.radians(latitud_media)), 0.01)
+        celdas = defaultdict(list)
+        for parada_id, (lat, lon) in self.posiciones.items():
+            celdas[self._celda(lat, lon)].append((parada_id, lat, lon))
+        self.celdas = {celda: tuple(paradas) for celda, paradas in celdas.items()}
+    
+    def existe_ruta(self, ruta_id):
+        return ruta_id in self.por_ruta
+    
+    def paradas_ruta(self, ruta_id):
+        """Ids de las paradas de la ruta en orden (vacío si no existe)"""
+        return self.por_ruta.get(ruta_id, ())
+    
+    def total_ruta(self, ruta_id):
+        return len(self.por_ruta.get(ruta_id, ()))
+    
+    def primera(self, ruta_id):
+        """Id de la primera parada de la ruta, o None"""
+        ids = self.por_ruta.get(ruta_id)
+        return ids[0] if ids else None
+    
+    def existe(self, parada_id):
+        return parada_id in self.orden
+    
+    def siguiente(self, parada_id):
+        """Id de la parada posterior a ``parada_id`` en su ruta, o None si es la última"""
+        return self.siguientes.get(parada_id)
+    
+    def _celda(self, lat, lon):
+        return math.floor(lat / self.celda_lat), math.floor(lon / self.celda_lon)
+    
+    def distancia(self, parada_id, lat, lon):
+        """Metros entre la parada y el punto, o None si la parada no existe"""
+        posicion = self.posiciones.get(parada_id)
+        if posicion is None:
+            return None
+        return distancia_metros(lat, lon, *posicion)
+    
+    def cercanas(self, lat, lon, radio, ruta_id=None):
+        """Paradas a ``radio`` metros o menos del punto como ``(distancia, id)``, de la más cercana a la más lejana
+        
+        Con ``ruta_id`` solo se devuelven las paradas de esa ruta.
+        """
+        radio_lat = radio / METROS_POR_GRADO
+        # Grados de longitud del radio en el paralelo más alejado del ecuador que toca el círculo
+        coseno = math.cos(math.radians(min(abs(lat) + radio_lat, 90.0)))
+        fila, columna = self._celda(lat, lon)
+        filas = math.ceil(radio_lat / self.celda_lat)
+        columnas = math.ceil(radio_lat / max(coseno, 1e-9) / self.celda_lon)
+        
+        if (2 * filas + 1) * (2 * columnas + 1) >= len(self.celdas):
+            # El círculo toca más celdas de las que hay ocupadas: se recorren estas
+            candidatas = (parada for paradas in self.celdas.values() for parada in paradas)
+        else:
+            candidatas = (parada
+                          for f in range(fila - filas, fila + filas + 1)
+                          for c in range(columna - columnas, columna + columnas + 1)
+                          for parada in self.celdas.get((f, c), ()))
+        
+        resultado = []
+        for parada_id, parada_lat, parada_lon in candidatas:
+            if ruta_id is not None and self.rutas[parada_id] != ruta_id:
+                continue
+            distancia = distancia_metros(lat, lon, parada_lat, parada_lon)
+            if distancia <= radio:
+                resultado.append((distancia, parada_id))
+        resultado.sort()
+        return resultado
+
+
+# Reentrante: en el servidor ASGI (asgi.py) las peticiones comparten hilo y
+# una puede ceder el control esperando a la base de datos con el lock tomado
+_lock = threading.RLock()
+_indice = None
+
+
+def obtener():
+    """Índice vigente, reconstruido si la versión del catálogo cambió"""
+    global _indice
+    version = catalogo.version_actual()
+    indice = _indice
+    if indice is not None and indice.version == version:
+        return indice
+    
+    with _lock:
+        if _indice is None or _indice.version != version:
+            filas = db.session.query(
+                Parada.id, Parada.ruta_id, Parada.orden, Parada.nombre_corto, Parada.latitud, Parada.longitud
+            ).order_by(Parada.ruta_id, Parada.orden).all()
+            rutas = [ruta_id for (ruta_id,) in db.session.query(Ruta.id).order_by(Ruta.id)]
+            _indice = IndiceParadas(version, [tuple(fila) for fila in filas], rutas)
+        return _indice
@@ -0,0 +1,82 @@
+"""Paginación por clave (keyset) del listado de usuarios.
+
+Los usuarios se ordenan por ``(fecha_registro, id)`` descendente y cada
+página continúa a partir del último par devuelto, codificado en un cursor
+opaco. Así cada página cuesta lo mismo sin importar lo lejos que esté,
+a diferencia de ``OFFSET``.
+"""
+import base64
+from datetime import datetime
+
+from sqlalchemy import select, tuple_
+
+from app.models import Usuario
+from app.serializacion import columnas
+
+# Columnas que se pueden pedir con ?fields=
+CAMPOS_USUARIO = Usuario.CAMPOS_PUBLICOS
+
+# Columnas que forman la clave de ordenación
+_CLAVE = ('fecha_registro', 'id')
+
+# Filas que se traen del cursor de servidor en cada lote en modo streaming
+LOTE_STREAMING = 1000
+
+
+def codificar_cursor(fecha_registro, usuario_id):
+    """Cursor opaco que apunta justo después de (fecha_registro, id)"""
+    texto = f"{fecha_registro.isoformat()}|{usuario_id}"
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """(fecha_registro, id) de un cursor; lanza ValueError si no es válido"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        texto = base64.urlsafe_b64decode(cursor + relleno).decode('utf-8')
+        fecha, usuario_id = texto.rsplit('|', 1)
+        return datetime.fromisoformat(fecha), int(usuario_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Cursor no válido') from e
+
+
+def validar_campos(fields):
+    """Lista de campos a partir del parámetro ``fields`` (todos si viene vacío)"""
+    if not fields:
+        return list(CAMPOS_USUARIO)
+    campos = [c.strip() for c in fields.split(',') if c.strip()]
+    desconocidos = [c for c in campos if c not in CAMPOS_USUARIO]
+    if desconocidos:
+        raise ValueError(f"Campos no válidos: {', '.join(desconocidos)}")
+    return list(dict.fromkeys(campos))
+
+
+def consulta_usuarios(campos, cursor=None, limite=None):
+    """SELECT de solo las columnas pedidas (más la clave), en orden de keyset"""
+    consulta = select(*columnas(Usuario, list(dict.fromkeys(list(campos) + list(_CLAVE))))).order_by(
+        Usuario.fecha_registro.desc(), Usuario.id.desc()
+    )
+    if cursor:
+        fecha, usuario_id = decodificar_cursor(cursor)
+        consulta = consulta.where(
+            tuple_(Usuario.fecha_registro, Usuario.id) < tuple_(fecha, usuario_id)
+        )
+    if limite is not None:
+        consulta = consulta.limit(limite)
+    return consulta
+
+
+def siguiente_cursor(filas, limite):
+    """Cursor de la página siguiente, o None si esta era la última"""
+    if limite is None or len(filas) < limite:
+        return None
+    ultima = filas[-1]
+    return codificar_cursor(ultima.fecha_registro, ultima.id)
+
+
+def fila_a_dict(fila, campos):
+    """Diccionario de una fila de ``consulta_usuarios`` con los campos pedidos
+
+    Las fechas se quedan como ``datetime``: el proveedor JSON las escribe en ISO 8601.
+    """
+    return {campo: getattr(fila, campo) for campo in campos}
@@ -0,0 +1,180 @@
+"""Datos del panel de control y difusión de sus cambios en directo.
+
+``datos()`` reúne los totales, los últimos registros y los completados por
+parada. Se calcula una vez para todos los administradores que lo piden a la
+vez y se reutiliza durante ``DASHBOARD_TTL`` segundos.
+
+Para las actualizaciones en directo (Server-Sent Events) cada worker tiene un
+único hilo que, mientras haya alguien conectado, lee cada
+``DASHBOARD_INTERVALO`` segundos los contadores de ``estadisticas_globales`` y
+``estadisticas_paradas`` y los usuarios con id mayor que el último visto: no
+son agregados, sino lecturas de filas sueltas por clave primaria. Si algo
+cambió publica solo la diferencia (usuarios nuevos y paradas cuyo contador
+cambió, con los totales actuales) a todas las conexiones del worker.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import func, select
+
+from app import db
+from app.coalescencia import VueloUnico
+from app.models import EstadisticaParada, Parada, Usuario
+from app.services import estadisticas, indice_paradas
+
+logger = logging.getLogger(__name__)
+
+RECIENTES = 10
+
+# Cambios guardados para las conexiones que tardan en leerlos
+_MAXIMO_CAMBIOS = 100
+
+_vuelos = VueloUnico()
+_condicion = threading.Condition()
+_estado = {
+    'app': None,
+    'pid': None,
+    'hilo': None,
+    'suscriptores': 0,
+    'secuencia': 0,
+    'cambios': deque(maxlen=_MAXIMO_CAMBIOS)
+}
+
+
+def init_app(app):
+    """Guardar la aplicación para el hilo de difusión"""
+    _estado['app'] = app
+
+
+def _usuario(fila):
+    return {'id': fila.id, 'nombre': fila.nombre, 'apellido': fila.apellido, 'fecha_registro': fila.fecha_registro}
+
+
+def _totales():
+    globales = estadisticas.obtener_globales()
+    return {
+        'total_usuarios': globales.total_usuarios,
+        'total_paradas': indice_paradas.obtener().total,
+        'total_completados': globales.total_completados,
+        'total_activos': globales.total_activos
+    }
+
+
+def _calcular():
+    recientes = db.session.execute(
+        select(Usuario.id, Usuario.nombre, Usuario.apellido, Usuario.fecha_registro)
+        .order_by(Usuario.fecha_registro.desc()).limit(RECIENTES)
+    ).all()
+    paradas = db.session.execute(
+        select(Parada.id, Parada.nombre_corto, EstadisticaParada.completados)
+        .outerjoin(EstadisticaParada).order_by(Parada.ruta_id, Parada.orden)
+    ).all()
+    return {
+        'totales': _totales(),
+        'usuarios_recientes': [_usuario(fila) for fila in recientes],
+        'paradas': [{'id': parada_id, 'nombre_corto': nombre, 'completados': completados or 0}
+                    for parada_id, nombre, completados in paradas]
+    }
+
+
+def datos(ventana=0.0):
+    """Datos del panel (compartidos: no modificar)"""
+    return _vuelos.hacer('panel', _calcular, ventana)
+
+
+def _leer_contadores(ultimo_usuario_id):
+    """Totales, completados por parada, usuarios con id mayor que ``ultimo_usuario_id`` y el nuevo último id
+
+    Sin ``ultimo_usuario_id`` (al arrancar) no se devuelven usuarios, solo el último id.
+    """
+    totales = _totales()
+    paradas = dict(db.session.execute(select(EstadisticaParada.parada_id, EstadisticaParada.completados)).all())
+    if ultimo_usuario_id is None:
+        return totales, paradas, [], db.session.scalar(select(func.max(Usuario.id))) or 0
+    nuevos = db.session.execute(
+        select(Usuario.id, Usuario.nombre, Usuario.apellido, Usuario.fecha_registro)
+        .where(Usuario.id > ultimo_usuario_id).order_by(Usuario.id).limit(RECIENTES)
+    ).all()
+    return totales, paradas, nuevos, max([ultimo_usuario_id, *(fila.id for fila in nuevos)])
+
+
+def _publicar(cambio):
+    with _condicion:
+        _estado['secuencia'] += 1
+        _estado['cambios'].append((_estado['secuencia'], cambio))
+        _condicion.notify_all()
+
+
+def _bucle(app):
+    """Leer los contadores mientras haya suscriptores y publicar lo que cambie"""
+    intervalo = app.config.get('DASHBOARD_INTERVALO', 1.0)
+    anteriores = None
+    ultimo_usuario_id = None
+    while True:
+        with _condicion:
+            if not _estado['suscriptores']:
+                _estado['hilo'] = None
+                return
+        try:
+            with app.app_context():
+                totales, paradas, nuevos, ultimo_usuario_id = _leer_contadores(ultimo_usuario_id)
+        except Exception as e:
+            logger.exception("❌ Error leyendo los contadores del panel: %s", e)
+            time.sleep(min(intervalo * 5, 30))
+            continue
+
+        if anteriores is not None:
+            totales_antes, paradas_antes = anteriores
+            cambio = {}
+            if nuevos:
+                cambio['usuarios_nuevos'] = [_usuario(fila) for fila in nuevos]
+            paradas_cambiadas = {parada_id: completados for parada_id, completados in paradas.items()
+                                 if paradas_antes.get(parada_id) != completados}
+            if paradas_cambiadas:
+                cambio['paradas'] = paradas_cambiadas
+            if cambio or totales != totales_antes:
+                cambio['totales'] = totales
+                _publicar(cambio)
+        anteriores = (totales, paradas)
+        time.sleep(intervalo)
+
+
+def _asegurar_hilo():
+    """Arrancar el hilo de este proceso si no está en marcha (llamar con ``_condicion``)"""
+    hilo = _estado['hilo']
+    if _estado['pid'] == os.getpid() and hilo is not None and hilo.is_alive():
+        return
+    hilo = threading.Thread(target=_bucle, args=(_estado['app'],), name='panel-difusion', daemon=True)
+    _estado.update(pid=os.getpid(), hilo=hilo)
+    hilo.start()
+
+
+class Suscripcion:
+    """Conexión que recibe los cambios publicados a partir de su alta"""
+
+    def __enter__(self):
+        with _condicion:
+            _estado['suscriptores'] += 1
+            self.ultima = _estado['secuencia']
+            _asegurar_hilo()
+        return self
+
+    def __exit__(self, *_):
+        with _condicion:
+            _estado['suscriptores'] -= 1
+
+    def esperar(self, timeout):
+        """Cambios publicados desde la última llamada (lista vacía si no hay en ``timeout`` segundos)"""
+        with _condicion:
+            _condicion.wait_for(lambda: _estado['secuencia'] > self.ultima, timeout)
+            cambios = [cambio for secuencia, cambio in _estado['cambios'] if secuencia > self.ultima]
+            self.ultima = _estado['secuencia']
+        return cambios
+
+
+def suscriptores():
+    """Conexiones abiertas en este proceso"""
+    return _estado['suscriptores']
@@ -0,0 +1,250 @@
+"""Reglas de avance del recorrido compartidas por las rutas de progreso"""
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, select
+from sqlalchemy.orm import contains_eager
+
+from app import db
+from app.models import Parada, Progreso, Usuario
+from app.serializacion import columnas, fila_a_dict
+from app.services import estadisticas, indice_paradas
+from app.services.estadisticas import CambiosEstadisticas
+
+METRICAS = ('puntuacion', 'tiempo_empleado', 'intentos')
+
+
+def metrica_invalida(datos):
+    """Primer campo de ``METRICAS`` cuyo valor no es un entero (o None), si lo hay"""
+    for campo in METRICAS:
+        valor = datos.get(campo)
+        if valor is not None and (isinstance(valor, bool) or not isinstance(valor, int)):
+            return campo
+    return None
+
+
+def marcar_completada(progreso, datos, cambios, ahora=None):
+    """Marcar un progreso como completado copiando las métricas enviadas"""
+    cambios.transicion(progreso.parada_id, progreso.estado, 'completada')
+    progreso.estado = 'completada'
+    progreso.fecha_completado = ahora or datetime.utcnow()
+    
+    for campo in METRICAS:
+        if campo in datos:
+            setattr(progreso, campo, datos[campo])
+    cambios.cronometrar(progreso.parada_id, None, progreso.tiempo_empleado)
+    cambios.puntuar(progreso.usuario_id, progreso.fecha_completado,
+                    progreso.puntuacion, progreso.tiempo_empleado, 1)
+
+
+def actualizar_metricas(progreso, datos, cambios):
+    """Copiar las métricas enviadas; si el progreso está completado, el ranking recibe la diferencia"""
+    anteriores = (progreso.puntuacion, progreso.tiempo_empleado)
+    for campo in METRICAS:
+        if campo in datos:
+            setattr(progreso, campo, datos[campo])
+    if progreso.estado == 'completada':
+        cambios.cronometrar(progreso.parada_id, anteriores[1], progreso.tiempo_empleado)
+        cambios.puntuar(progreso.usuario_id, progreso.fecha_completado,
+                        int(progreso.puntuacion or 0) - int(anteriores[0] or 0),
+                        int(progreso.tiempo_empleado or 0) - int(anteriores[1] or 0))
+
+
+def activar(progreso, cambios, ahora=None):
+    """Desbloquear un progreso si todavía está bloqueado"""
+    if progreso and progreso.estado == 'bloqueada':
+        cambios.transicion(progreso.parada_id, 'bloqueada', 'activa')
+        progreso.estado = 'activa'
+        progreso.fecha_inicio = ahora or datetime.utcnow()
+
+
+def completar(usuario_id, parada_id, datos):
+    """Completar una parada y desbloquear la siguiente en la transacción actual
+
+    Devuelve ``(resultado, progreso, siguiente_parada_id)`` con resultado
+    ``completada``, ``ya_completada`` o ``no_encontrado``. No hace commit.
+    """
+    progreso = Progreso.query.filter_by(usuario_id=usuario_id, parada_id=parada_id).first()
+    if progreso is None:
+        return 'no_encontrado', None, None
+    if progreso.estado == 'completada':
+        return 'ya_completada', progreso, None
+    
+    # El resto de la ruta en una consulta: de ahí salen la siguiente parada y si la completa entera
+    progresos = Progreso.query.filter_by(usuario_id=usuario_id, ruta_id=progreso.ruta_id).all()
+    cambios = CambiosEstadisticas()
+    marcar_completada(progreso, datos, cambios)
+    
+    indice = indice_paradas.obtener()
+    siguiente_parada_id = indice.siguiente(parada_id)
+    if siguiente_parada_id:
+        activar(next((p for p in progresos if p.parada_id == siguiente_parada_id), None), cambios)
+    
+    if estadisticas.completo_ruta(progresos, progreso.ruta_id, indice.total_ruta(progreso.ruta_id)):
+        cambios.rutas[progreso.ruta_id]['usuarios_completaron_todo'] += 1
+    cambios.aplicar()
+    return 'completada', progreso, siguiente_parada_id
+
+
+def paradas_checkin(usuario_id, parada_id=None, ruta_id=None):
+    """Filas ``(parada_id, estado)`` del progreso contra el que se hace un check-in
+
+    Con ``parada_id``, esa parada; si no, las activas del usuario (de
+    ``ruta_id``, si se indica). Devuelve como mucho dos, ordenadas por ruta:
+    hay una parada activa por ruta, así que con dos no se sabe en cuál está.
+    """
+    consulta = select(Progreso.parada_id, Progreso.estado).where(Progreso.usuario_id == usuario_id)
+    if parada_id is not None:
+        consulta = consulta.where(Progreso.parada_id == parada_id)
+    else:
+        consulta = consulta.where(Progreso.estado == 'activa')
+        if ruta_id is not None:
+            consulta = consulta.where(Progreso.ruta_id == ruta_id)
+    return db.session.execute(consulta.order_by(Progreso.ruta_id, Progreso.parada_id).limit(2)).all()
+
+
+def aplicar_completados(elementos):
+    """Aplicar en memoria una lista ordenada de paradas completadas
+
+    Carga todos los progresos de los usuarios implicados en una consulta,
+    toma el orden de las paradas del índice en memoria, aplica la cadena de desbloqueo y acumula los
+    contadores. No hace commit. Devuelve un resultado por elemento; repetir
+    un elemento ya aplicado devuelve ``ya_completada`` sin modificar nada.
+    """
+    resultados = []
+    validos = []
+    for indice, elemento in enumerate(elementos):
+        resultado = {'indice': indice}
+        resultados.append(resultado)
+        
+        if not isinstance(elemento, dict):
+            resultado.update(resultado='invalido', error='Formato no válido')
+            continue
+        usuario_id = elemento.get('usuario_id')
+        parada_id = elemento.get('parada_id')
+        resultado.update(usuario_id=usuario_id, parada_id=parada_id)
+        if not isinstance(usuario_id, int) or not isinstance(parada_id, int):
+            resultado.update(resultado='invalido', error='usuario_id y parada_id son requeridos')
+            continue
+        campo = metrica_invalida(elemento)
+        if campo:
+            resultado.update(resultado='invalido', error=f'{campo} debe ser un entero')
+            continue
+        validos.append((resultado, elemento))
+    
+    if not validos:
+        return resultados
+    
+    usuario_ids = {resultado['usuario_id'] for resultado, _ in validos}
+    progresos = {}
+    por_usuario = defaultdict(list)
+    for p in Progreso.query.filter(Progreso.usuario_id.in_(usuario_ids)).all():
+        progresos[(p.usuario_id, p.parada_id)] = p
+        por_usuario[p.usuario_id].append(p)
+    indice = indice_paradas.obtener()
+    
+    def completadas(usuario_id, ruta_id):
+        return sum(1 for p in por_usuario[usuario_id] if p.ruta_id == ruta_id and p.estado == 'completada')
+    
+    completadas_antes = {
+        (usuario_id, ruta_id): completadas(usuario_id, ruta_id)
+        for usuario_id, ruta_id in {(p.usuario_id, p.ruta_id) for p in progresos.values()}
+    }
+    
+    cambios = CambiosEstadisticas()
+    ahora = datetime.utcnow()
+    for resultado, elemento in validos:
+        usuario_id = resultado['usuario_id']
+        parada_id = resultado['parada_id']
+        progreso = progresos.get((usuario_id, parada_id))
+        
+        if progreso is None:
+            resultado['resultado'] = 'no_encontrado'
+            continue
+        if progreso.estado == 'completada':
+            resultado['resultado'] = 'ya_completada'
+            continue
+        
+        marcar_completada(progreso, elemento, cambios, ahora)
+        siguiente_id = indice.siguiente(parada_id)
+        if siguiente_id:
+            activar(progresos.get((usuario_id, siguiente_id)), cambios, ahora)
+        resultado.update(resultado='completada', siguiente_parada_id=siguiente_id)
+    
+    for (usuario_id, ruta_id), antes in completadas_antes.items():
+        total = indice.total_ruta(ruta_id)
+        if total and antes < total <= completadas(usuario_id, ruta_id):
+            cambios.rutas[ruta_id]['usuarios_completaron_todo'] += 1
+    cambios.aplicar()
+    
+    return resultados
+
+
+def leer_desde(texto):
+    """Fecha del parámetro ``since`` (ISO 8601) en UTC sin zona; lanza ValueError si no es válida"""
+    fecha = datetime.fromisoformat(texto.strip())
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+
+def leer_progreso(usuario_id, desde=None):
+    """Usuario y sus progresos (con la parada ya cargada) en una sola consulta
+
+    Devuelve ``(usuario, progresos)`` ordenados por ruta y orden de las paradas, o
+    ``(None, [])`` si el usuario no existe. Con ``desde`` solo se incluyen los
+    progresos modificados después de esa fecha; el filtro va en el JOIN para
+    que el usuario se devuelva aunque no haya cambios.
+    """
+    condicion = Progreso.usuario_id == Usuario.id
+    if desde is not None:
+        condicion = and_(condicion, Progreso.fecha_actualizacion > desde)
+    
+    consulta = (
+        select(Usuario, Progreso)
+        .outerjoin(Progreso, condicion)
+        .outerjoin(Parada, Parada.id == Progreso.parada_id)
+        .options(contains_eager(Progreso.parada))
+        .where(Usuario.id == usuario_id)
+        .order_by(Parada.ruta_id, Parada.orden)
+    )
+    filas = db.session.execute(consulta).all()
+    if not filas:
+        return None, []
+    return filas[0][0], [progreso for _, progreso in filas if progreso is not None]
+
+
+def leer_progreso_publico(usuario_id, desde=None):
+    """Lo mismo que ``leer_progreso`` pero como diccionarios, sin hidratar el ORM
+
+    Un SELECT de las columnas públicas de usuario, progreso y parada: devuelve
+    ``(usuario, progresos)`` con los datos de cada parada en ``parada``, o
+    ``(None, [])`` si el usuario no existe.
+    """
+    campos_usuario, campos_progreso, campos_parada = (
+        Usuario.CAMPOS_PUBLICOS, Progreso.CAMPOS_PUBLICOS, Parada.CAMPOS_PUBLICOS
+    )
+    condicion = Progreso.usuario_id == Usuario.id
+    if desde is not None:
+        condicion = and_(condicion, Progreso.fecha_actualizacion > desde)
+    
+    consulta = (
+        select(*columnas(Usuario), *columnas(Progreso), *columnas(Parada))
+        .select_from(Usuario)
+        .outerjoin(Progreso, condicion)
+        .outerjoin(Parada, Parada.id == Progreso.parada_id)
+        .where(Usuario.id == usuario_id)
+        .order_by(Parada.ruta_id, Parada.orden)
+    )
+    filas = db.session.execute(consulta).all()
+    if not filas:
+        return None, []
+    
+    inicio_progreso = len(campos_usuario)
+    inicio_parada = inicio_progreso + len(campos_progreso)
+    progresos = [
+        dict(fila_a_dict(fila, campos_progreso, inicio_progreso),
+             parada=fila_a_dict(fila, campos_parada, inicio_parada))
+        for fila in filas if fila[inicio_progreso] is not None
+    ]
+    return fila_a_dict(filas[0], campos_usuario), progresos
@@ -0,0 +1,158 @@
+"""Ranking de usuarios por la puntuación de las paradas completadas.
+
+Los totales de cada usuario (``puntuaciones_usuarios``) y de cada usuario y
+día (``puntuaciones_diarias``) se mantienen en la misma transacción que cada
+parada completada o métrica modificada, a través de ``CambiosEstadisticas``.
+Para responder, cada worker guarda una instantánea ordenada de cada ranking
+durante ``RANKING_TTL`` segundos: la posición de un usuario se busca en ella
+con una búsqueda binaria en lugar de contar filas en la base de datos.
+
+El orden es por puntuación (mayor primero) y, a igual puntuación, por tiempo
+empleado (menor primero). Los empates comparten posición.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.coalescencia import VueloUnico
+from app.models import Progreso, PuntuacionDiaria, PuntuacionUsuario, Usuario
+
+_vuelos = VueloUnico()
+
+
+class Clasificacion:
+    """Instantánea inmutable de un ranking"""
+
+    def __init__(self, filas):
+        # filas: (usuario_id, nombre, puntuacion, tiempo_empleado, completadas)
+        self.filas = sorted(filas, key=lambda f: (-f[2], f[3], f[0]))
+        self.claves = [(-f[2], f[3]) for f in self.filas]
+        self.indices = {f[0]: i for i, f in enumerate(self.filas)}
+        self.total = len(self.filas)
+
+    def posicion(self, indice):
+        """Posición (desde 1) de la fila ``indice``; los empates comparten la del primero"""
+        return bisect_left(self.claves, self.claves[indice]) + 1
+
+    def _entrada(self, indice):
+        usuario_id, nombre, puntuacion, tiempo, completadas = self.filas[indice]
+        return {
+            'posicion': self.posicion(indice),
+            'usuario_id': usuario_id,
+            'nombre': nombre,
+            'puntuacion': puntuacion,
+            'tiempo_empleado': tiempo,
+            'completadas': completadas
+        }
+
+    def primeros(self, limite):
+        """Las ``limite`` primeras entradas"""
+        return [self._entrada(i) for i in range(min(limite, self.total))]
+
+    def alrededor(self, usuario_id, limite):
+        """Entrada del usuario y ``limite`` entradas centradas en él, o (None, [])"""
+        indice = self.indices.get(usuario_id)
+        if indice is None:
+            return None, []
+        inicio = max(0, min(indice - limite // 2, self.total - limite))
+        return self._entrada(indice), [self._entrada(i) for i in range(inicio, min(inicio + limite, self.total))]
+
+
+def _insertar(tabla):
+    """INSERT con ON CONFLICT del dialecto de la base de datos"""
+    dialecto = db.session.get_bind().dialect.name
+    return (postgresql if dialecto == 'postgresql' else sqlite).insert(tabla)
+
+
+def _sumar(tabla, claves, filas):
+    """Sumar las variaciones de ``filas`` a las de ``tabla``, creando las que no existan"""
+    sentencia = _insertar(tabla)
+    db.session.execute(
+        sentencia.on_conflict_do_update(
+            index_elements=claves,
+            set_={campo: tabla.c[campo] + sentencia.excluded[campo]
+                  for campo in ('puntuacion', 'tiempo_empleado', 'completadas')}
+        ),
+        filas
+    )
+
+
+def aplicar(variaciones):
+    """Aplicar en la transacción actual ``{(usuario_id, fecha): [puntuacion, tiempo, completadas]}``
+
+    ``fecha`` es el día en que se completó la parada (o None si no se sabe).
+    """
+    por_usuario = defaultdict(lambda: [0, 0, 0])
+    diarias = []
+    for (usuario_id, fecha), valores in variaciones.items():
+        if not any(valores):
+            continue
+        por_usuario[usuario_id] = [a + b for a, b in zip(por_usuario[usuario_id], valores)]
+        if fecha is not None:
+            diarias.append(dict(zip(('usuario_id', 'fecha', 'puntuacion', 'tiempo_empleado', 'completadas'),
+                                    (usuario_id, fecha, *valores))))
+    if not por_usuario:
+        return
+
+    _sumar(PuntuacionUsuario.__table__, ['usuario_id'], [
+        {'usuario_id': usuario_id, 'puntuacion': p, 'tiempo_empleado': t, 'completadas': c}
+        for usuario_id, (p, t, c) in por_usuario.items()
+    ])
+    if diarias:
+        _sumar(PuntuacionDiaria.__table__, ['fecha', 'usuario_id'], diarias)
+
+
+def reconstruir():
+    """Recalcular los totales a partir de los progresos completados"""
+    por_usuario = defaultdict(lambda: [0, 0, 0])
+    por_dia = defaultdict(lambda: [0, 0, 0])
+    filas = db.session.query(
+        Progreso.usuario_id, Progreso.fecha_completado, Progreso.puntuacion, Progreso.tiempo_empleado
+    ).filter(Progreso.estado == 'completada')
+    for usuario_id, fecha_completado, puntuacion, tiempo in filas:
+        valores = (puntuacion or 0, tiempo or 0, 1)
+        totales = [por_usuario[usuario_id]]
+        if fecha_completado is not None:
+            totales.append(por_dia[(fecha_completado.date(), usuario_id)])
+        for total in totales:
+            for i, valor in enumerate(valores):
+                total[i] += valor
+
+    PuntuacionDiaria.query.delete()
+    PuntuacionUsuario.query.delete()
+    db.session.add_all(
+        PuntuacionUsuario(usuario_id=usuario_id, puntuacion=p, tiempo_empleado=t, completadas=c)
+        for usuario_id, (p, t, c) in por_usuario.items()
+    )
+    db.session.add_all(
+        PuntuacionDiaria(fecha=fecha, usuario_id=usuario_id, puntuacion=p, tiempo_empleado=t, completadas=c)
+        for (fecha, usuario_id), (p, t, c) in por_dia.items()
+    )
+    db.session.flush()
+    _vuelos.olvidar()
+
+
+def _filas(fecha=None, parada_id=None):
+    if parada_id is not None:
+        # Una parada: la puntuación y el tiempo de cada progreso completado
+        consulta = select(
+            Progreso.usuario_id, Usuario.nombre, Progreso.puntuacion, Progreso.tiempo_empleado
+        ).join(Usuario).where(Progreso.parada_id == parada_id, Progreso.estado == 'completada')
+        return [(u, n, p or 0, t or 0, 1) for u, n, p, t in db.session.execute(consulta)]
+
+    modelo = PuntuacionDiaria if fecha is not None else PuntuacionUsuario
+    consulta = select(
+        modelo.usuario_id, Usuario.nombre, modelo.puntuacion, modelo.tiempo_empleado, modelo.completadas
+    ).join(Usuario, Usuario.id == modelo.usuario_id).where(modelo.completadas > 0)
+    if fecha is not None:
+        consulta = consulta.where(PuntuacionDiaria.fecha == fecha)
+    return [tuple(fila) for fila in db.session.execute(consulta)]
+
+
+def clasificacion(fecha=None, parada_id=None, ventana=0.0):
+    """Ranking general, de un día o de una parada (instantánea compartida durante ``ventana`` segundos)"""
+    clave = ('parada', parada_id) if parada_id is not None else ('dia', fecha) if fecha is not None else ('general',)
+    return _vuelos.hacer(clave, lambda: Clasificacion(_filas(fecha, parada_id)), ventana)
@@ -0,0 +1,101 @@
+"""Registro de usuarios de la app móvil en un número fijo de consultas.
+
+Tanto el registro individual como el de grupos hacen una búsqueda de los
+usuarios existentes, un ``INSERT ... RETURNING`` para los nuevos y un único
+``INSERT`` con todos sus progresos iniciales en la ruta elegida, sin
+importar el tamaño del grupo.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, insert, or_
+
+from app import db
+from app.models import Progreso, Usuario
+from app.services import indice_paradas
+from app.services.sincronizacion import siguientes_revisiones
+from app.services.estadisticas import CambiosEstadisticas
+
+
+def _clave(datos):
+    return (datos.get('nombre'), datos.get('apellido'), datos.get('device_id'))
+
+
+def _condicion(clave):
+    nombre, apellido, device_id = clave
+    return and_(
+        Usuario.nombre == nombre,
+        Usuario.apellido == apellido,
+        Usuario.device_id.is_(None) if device_id is None else Usuario.device_id == device_id
+    )
+
+
+def registrar(personas, ruta_id=None):
+    """Registrar (o recuperar) una lista de personas en la transacción actual
+
+    Cada persona es un diccionario con ``nombre``, ``apellido`` y
+    ``device_id`` opcional. Un mismo nombre y apellido en el mismo
+    dispositivo se considera el mismo usuario. Los usuarios sin progreso en
+    la ruta ``ruta_id`` (por defecto, la primera) lo reciben con su primera
+    parada activa. Devuelve una lista de ``(usuario, nuevo)`` en el orden
+    recibido. No hace commit.
+    """
+    claves = list(dict.fromkeys(_clave(p) for p in personas))
+    
+    # Usuarios ya registrados
+    usuarios = {}
+    for usuario in Usuario.query.filter(or_(*[_condicion(c) for c in claves])).all():
+        usuarios.setdefault((usuario.nombre, usuario.apellido, usuario.device_id), usuario)
+    
+    # Usuarios nuevos en un único INSERT ... RETURNING (las claves son únicas
+    # dentro del lote, así que cada fila devuelta se asocia por su clave)
+    nuevas = [c for c in claves if c not in usuarios]
+    if nuevas:
+        creados = db.session.scalars(
+            insert(Usuario).returning(Usuario).execution_options(render_nulls=True),
+            [{'nombre': n, 'apellido': a, 'device_id': d} for n, a, d in nuevas]
+        ).all()
+        for usuario in creados:
+            usuarios[(usuario.nombre, usuario.apellido, usuario.device_id)] = usuario
+    nuevas = set(nuevas)
+    
+    indice = indice_paradas.obtener()
+    if ruta_id is None:
+        ruta_id = indice.ruta_defecto
+    
+    # Los existentes solo necesitan progreso si no lo tienen en esta ruta (se
+    # apuntan a otra ruta, o se reseteó la BD)
+    existentes = [usuarios[c].id for c in claves if c not in nuevas]
+    con_progreso = set()
+    if existentes:
+        con_progreso = {
+            usuario_id for (usuario_id,) in db.session.query(Progreso.usuario_id).filter(
+                Progreso.usuario_id.in_(existentes), Progreso.ruta_id == ruta_id
+            ).distinct()
+        }
+    sin_progreso = [usuarios[c].id for c in claves if usuarios[c].id not in con_progreso]
+    
+    cambios = CambiosEstadisticas()
+    cambios.usuarios += len(nuevas)
+    paradas = indice.paradas_ruta(ruta_id)
+    if sin_progreso and paradas:
+        ahora = datetime.utcnow()
+        # El INSERT masivo no pasa por el flush del ORM: la revisión se asigna aquí
+        revisiones = siguientes_revisiones(db.session.connection(), sin_progreso)
+        filas = []
+        for usuario_id in sin_progreso:
+            for parada_id in paradas:
+                activa = parada_id == paradas[0]
+                filas.append({
+                    'usuario_id': usuario_id,
+                    'parada_id': parada_id,
+                    'ruta_id': ruta_id,
+                    'revision': revisiones[usuario_id],
+                    'estado': 'activa' if activa else 'bloqueada',
+                    'fecha_inicio': ahora if activa else None
+                })
+                cambios.transicion(parada_id, None, filas[-1]['estado'])
+        db.session.execute(insert(Progreso.__table__), filas)
+        cambios.rutas[ruta_id]['usuarios'] += len(sin_progreso)
+    cambios.aplicar()
+    
+    return [(usuarios[_clave(p)], _clave(p) in nuevas) for p in personas]
@@ -0,0 +1,168 @@
+"""Sincronización del progreso para la app sin conexión.
+
+Cada usuario tiene un contador de revisión (``usuarios.revision``). Cada
+transacción que crea o modifica progresos lo incrementa una vez por usuario,
+aunque haga varios flush, y guarda el nuevo valor en ``progreso.revision`` de
+esas filas. El contador se
+incrementa con un ``UPDATE`` sobre la fila del usuario, que queda bloqueada
+hasta el commit. Por eso las revisiones de un usuario se confirman en orden
+y pedir los cambios con ``revision > N`` nunca se salta ninguno.
+
+``cambios_desde`` es el feed que lee la app y ``aplicar_cambios`` el envío
+de lo que hizo sin conexión. En ese envío los estados solo avanzan: una
+parada completada desbloquea la siguiente igual que en
+``/api/progreso/completar``. Las métricas de un progreso que cambió en el
+servidor desde la revisión que vio el dispositivo se resuelven con la
+política ``SYNC_RESOLUCION``:
+
+- ``max``: gana el intento con más puntuación.
+- ``lww``: gana la modificación más reciente (``modificado`` del
+  dispositivo frente a ``fecha_actualizacion``).
+
+Reenviar el mismo lote no cambia nada.
+"""
+from sqlalchemy import and_, event, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Progreso, Usuario
+from app.serializacion import fila_a_dict
+from app.services import progreso as progreso_servicio
+from app.services.estadisticas import CambiosEstadisticas
+
+# Campos de cada cambio del feed
+CAMPOS_CAMBIO = ('id', 'parada_id', 'ruta_id', 'estado', 'fecha_inicio', 'fecha_completado',
+                 'puntuacion', 'tiempo_empleado', 'intentos', 'revision')
+
+# Resultado de aplicar_completados -> resultado del envío
+_RESULTADOS_COMPLETAR = {'completada': 'aplicado', 'ya_completada': 'sin_cambios'}
+
+
+def siguientes_revisiones(conexion, usuario_ids):
+    """Incrementar el contador de los usuarios y devolver ``{usuario_id: revision}``"""
+    tabla = Usuario.__table__
+    filas = conexion.execute(
+        update(tabla)
+        .where(tabla.c.id.in_(sorted(usuario_ids)))
+        .values(revision=tabla.c.revision + 1)
+        .returning(tabla.c.id, tabla.c.revision)
+    ).all()
+    return dict(filas)
+
+
+@event.listens_for(Session, 'before_flush')
+def _asignar_revisiones(sesion, contexto, instancias):
+    """Dar la revisión de esta transacción a los progresos creados o modificados
+
+    El primer flush de la transacción incrementa el contador de cada usuario y
+    lo guarda en ``sesion.info``; los siguientes reutilizan ese valor.
+    """
+    progresos = [objeto for objeto in sesion.new if isinstance(objeto, Progreso)]
+    progresos += [objeto for objeto in sesion.dirty
+                  if isinstance(objeto, Progreso) and sesion.is_modified(objeto)]
+    if not progresos:
+        return
+    revisiones = sesion.info.setdefault('_revisiones', {})
+    pendientes = {p.usuario_id for p in progresos} - revisiones.keys()
+    if pendientes:
+        revisiones.update(siguientes_revisiones(sesion.connection(), pendientes))
+    for progreso in progresos:
+        progreso.revision = revisiones.get(progreso.usuario_id, progreso.revision)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _olvidar_revisiones(sesion, transaccion):
+    if transaccion.parent is None:
+        sesion.info.pop('_revisiones', None)
+
+
+def cambios_desde(usuario_id, desde=0):
+    """Revisión actual del usuario y sus progresos con revisión mayor que ``desde``
+
+    Una sola consulta por el índice (usuario_id, revision). Devuelve
+    ``(revision, cambios)`` ordenados por revisión, o ``(None, [])`` si el
+    usuario no existe.
+    """
+    columnas = [getattr(Progreso, campo) for campo in CAMPOS_CAMBIO]
+    consulta = (
+        select(Usuario.revision, *columnas)
+        .select_from(Usuario)
+        .outerjoin(Progreso, and_(Progreso.usuario_id == Usuario.id, Progreso.revision > desde))
+        .where(Usuario.id == usuario_id)
+        .order_by(Progreso.revision, Progreso.id)
+    )
+    filas = db.session.execute(consulta).all()
+    if not filas:
+        return None, []
+    return filas[0][0], [fila_a_dict(fila, CAMPOS_CAMBIO, 1) for fila in filas if fila[1] is not None]
+
+
+def _gana_dispositivo(progreso, elemento, politica):
+    """Resolver un conflicto de métricas: True si se aplican las del dispositivo"""
+    if politica == 'lww':
+        try:
+            modificado = progreso_servicio.leer_desde(elemento['modificado'])
+        except (KeyError, TypeError, AttributeError, ValueError):
+            return False
+        return progreso.fecha_actualizacion is None or modificado > progreso.fecha_actualizacion
+    return int(elemento.get('puntuacion') or 0) > int(progreso.puntuacion or 0)
+
+
+def aplicar_cambios(usuario_id, elementos, politica='max'):
+    """Aplicar en la transacción actual lo que el dispositivo hizo sin conexión
+
+    Cada elemento lleva ``parada_id`` y, opcionalmente, ``estado``
+    (``completada``), las métricas, la ``revision`` que vio el dispositivo
+    y ``modificado`` (ISO 8601). Devuelve un resultado por elemento:
+    ``aplicado``, ``sin_cambios``, ``descartado`` (perdió el conflicto),
+    ``no_encontrado`` o ``invalido``. No hace commit.
+    """
+    progresos = {p.parada_id: p for p in Progreso.query.filter_by(usuario_id=usuario_id).all()}
+    resultados = []
+    completados = []
+    metricas = []
+    for indice, elemento in enumerate(elementos):
+        resultado = {'indice': indice}
+        resultados.append(resultado)
+        if not isinstance(elemento, dict) or not isinstance(elemento.get('parada_id'), int):
+            resultado.update(resultado='invalido', error='parada_id es requerido')
+            continue
+        resultado['parada_id'] = elemento['parada_id']
+        campo = progreso_servicio.metrica_invalida(elemento)
+        progreso = progresos.get(elemento['parada_id'])
+        if campo:
+            resultado.update(resultado='invalido', error=f'{campo} debe ser un entero')
+        elif progreso is None:
+            resultado['resultado'] = 'no_encontrado'
+        elif elemento.get('estado') == 'completada' and progreso.estado != 'completada':
+            completados.append((resultado, elemento))
+        else:
+            metricas.append((resultado, elemento, progreso))
+
+    # Completar: mismas reglas de desbloqueo y contadores que el resto de la API
+    if completados:
+        aplicados = progreso_servicio.aplicar_completados(
+            [dict(elemento, usuario_id=usuario_id) for _, elemento in completados]
+        )
+        for (resultado, _), aplicado in zip(completados, aplicados):
+            # Una parada repetida en el mismo envío ya está completada al llegar a ella
+            resultado['resultado'] = _RESULTADOS_COMPLETAR.get(aplicado['resultado'], aplicado['resultado'])
+            for clave in ('siguiente_parada_id', 'error'):
+                if clave in aplicado:
+                    resultado[clave] = aplicado[clave]
+
+    # Métricas: sin conflicto si el dispositivo vio la última revisión del progreso
+    cambios = CambiosEstadisticas()
+    for resultado, elemento, progreso in metricas:
+        datos = {campo: elemento[campo] for campo in progreso_servicio.METRICAS if campo in elemento}
+        if all(getattr(progreso, campo) == valor for campo, valor in datos.items()):
+            resultado['resultado'] = 'sin_cambios'
+        elif elemento.get('revision') == progreso.revision or _gana_dispositivo(progreso, elemento, politica):
+            progreso_servicio.actualizar_metricas(progreso, datos, cambios)
+            resultado['resultado'] = 'aplicado'
+        else:
+            resultado['resultado'] = 'descartado'
+    cambios.aplicar()
+    db.session.flush()
+
+    return resultados
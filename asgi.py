@@ -0,0 +1,8 @@
+import os
+from app import create_app
+from app.asincrono import crear_asgi
+
+# API móvil asíncrona; el resto de rutas las sirve la misma app Flask
+# gunicorn -c gunicorn_asgi.py asgi:app
+flask_app = create_app(os.getenv('FLASK_ENV', 'default'))
+app = crear_asgi(flask_app)
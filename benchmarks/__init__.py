@@ -0,0 +1,11 @@
+"""Benchmarks de MentxuApp Backend
+
+Genera una base de datos SQLite con usuarios sintéticos, reproduce una mezcla
+realista de tráfico del recorrido (registros, cadenas de paradas completadas,
+consultas del catálogo y del panel) contra el cliente de pruebas de Flask y/o
+un gunicorn local, y guarda los resultados en JSON para comparar dos
+ejecuciones:
+
+    python -m benchmarks ejecutar --usuarios 5000 --escenarios 500 --salida base.json
+    python -m benchmarks comparar base.json nuevo.json
+"""
@@ -0,0 +1,174 @@
+"""Punto de entrada: ``python -m benchmarks ejecutar|escrituras|comparar``"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from benchmarks import datos, informe, trafico
+from benchmarks.datos import RAIZ
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ejecutar(args):
+    """Sembrar la base de datos, reproducir el tráfico y guardar los resultados"""
+    directorio = tempfile.mkdtemp(prefix='mentxu-bench-')
+    ruta_cliente = os.path.join(directorio, 'cliente.db')
+    # La configuración lee DATABASE_URL al importarse: la app se importa después
+    app = datos.preparar_app(ruta_cliente)
+
+    from app import db
+    from benchmarks import ejecutor
+    credenciales = (app.config['ADMIN_USERNAME'], app.config['ADMIN_PASSWORD'])
+
+    with app.app_context():
+        print(f"🌱 Generando {args.usuarios} usuarios en {directorio}...")
+        usuarios, paradas = datos.sembrar_usuarios(args.usuarios, args.semilla)
+        db.engine.dispose()
+
+    # Cada modo parte de una copia idéntica de la base de datos sembrada
+    modos = ['cliente', 'gunicorn'] if args.modo == 'ambos' else [args.modo]
+    if 'gunicorn' in modos:
+        shutil.copyfile(ruta_cliente, os.path.join(directorio, 'gunicorn.db'))
+
+    resultados = {
+        'fecha': datetime.utcnow().isoformat(),
+        'commit': _commit(),
+        'parametros': {
+            'usuarios': args.usuarios, 'escenarios': args.escenarios, 'semilla': args.semilla,
+            'workers': args.workers, 'concurrencia': args.concurrencia
+        },
+        'modos': {}
+    }
+
+    for modo in modos:
+        escenarios = trafico.generar_escenarios(args.escenarios, usuarios, paradas, args.semilla)
+        print(f"🚦 {modo}: {args.escenarios} escenarios...")
+        if modo == 'cliente':
+            medidas, duracion = ejecutor.ejecutar_cliente(app, escenarios, credenciales)
+        else:
+            with ejecutor.servidor_gunicorn(os.path.join(directorio, 'gunicorn.db'), args.workers) as base:
+                medidas, duracion = ejecutor.ejecutar_http(base, escenarios, credenciales, args.concurrencia)
+        resultados['modos'][modo] = informe.resumir(medidas, duracion)
+        informe.imprimir(modo, resultados['modos'][modo])
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados guardados en {args.salida}")
+    shutil.rmtree(directorio, ignore_errors=True)
+    return 1 if any(resumen['errores'] for resumen in resultados['modos'].values()) else 0
+
+
+def escrituras(args):
+    """Medir cómo escalan las escrituras con el número de workers de gunicorn"""
+    directorio = tempfile.mkdtemp(prefix='mentxu-escrituras-')
+    ruta_base = os.path.join(directorio, 'base.db')
+    app = datos.preparar_app(ruta_base)
+
+    from app import db
+    from benchmarks import ejecutor
+    credenciales = (app.config['ADMIN_USERNAME'], app.config['ADMIN_PASSWORD'])
+
+    with app.app_context():
+        print(f"🌱 Generando {args.usuarios} usuarios en {directorio}...")
+        usuarios, paradas = datos.sembrar_usuarios(args.usuarios, args.semilla)
+        db.engine.dispose()
+
+    modos = {'escritor_unico': '1', 'sin_escritor_unico': '0'}
+    if args.escritor_unico == 'si':
+        del modos['sin_escritor_unico']
+    elif args.escritor_unico == 'no':
+        del modos['escritor_unico']
+
+    resultados = {
+        'fecha': datetime.utcnow().isoformat(),
+        'commit': _commit(),
+        'parametros': {
+            'usuarios': args.usuarios, 'escenarios': args.escenarios, 'semilla': args.semilla,
+            'workers': args.workers, 'concurrencia': args.concurrencia
+        },
+        'modos': {}
+    }
+    for modo, valor in modos.items():
+        resultados['modos'][modo] = {}
+        for workers in args.workers:
+            # Cada ejecución parte de una copia de la base de datos sembrada
+            ruta = os.path.join(directorio, f'{modo}-{workers}.db')
+            shutil.copyfile(ruta_base, ruta)
+            escenarios = trafico.generar_escenarios(args.escenarios, usuarios, paradas, args.semilla,
+                                                    trafico.MEZCLA_ESCRITURA)
+            print(f"🚦 {modo}, {workers} workers: {args.escenarios} escenarios...")
+            with ejecutor.servidor_gunicorn(ruta, workers, entorno={'SQLITE_ESCRITOR_UNICO': valor}) as base:
+                medidas, duracion = ejecutor.ejecutar_http(base, escenarios, credenciales, args.concurrencia)
+            resultados['modos'][modo][workers] = informe.resumir_escrituras(medidas, duracion)
+
+    informe.imprimir_escalado(resultados['modos'])
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados guardados en {args.salida}")
+    shutil.rmtree(directorio, ignore_errors=True)
+    return 0
+
+
+def comparar(args):
+    """Comparar dos ficheros de resultados (sale con 1 si hay regresiones)"""
+    regresiones = informe.comparar(args.base, args.nuevo, args.umbral, args.minimo_ms)
+    if regresiones:
+        print(f"\n❌ {regresiones} endpoints empeoran")
+        return 1
+    print("\n✅ Sin regresiones")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks de MentxuApp Backend')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    p = subparsers.add_parser('ejecutar', help='reproducir la mezcla de tráfico y medir')
+    p.add_argument('--usuarios', type=int, default=5000, help='usuarios sintéticos (por defecto 5000)')
+    p.add_argument('--escenarios', type=int, default=500, help='escenarios a reproducir (por defecto 500)')
+    p.add_argument('--modo', choices=('cliente', 'gunicorn', 'ambos'), default='cliente',
+                   help='cliente de pruebas de Flask, gunicorn local o ambos')
+    p.add_argument('--workers', type=int, default=2, help='workers de gunicorn (por defecto 2)')
+    p.add_argument('--concurrencia', type=int, default=8, help='clientes HTTP en paralelo (por defecto 8)')
+    p.add_argument('--semilla', type=int, default=42, help='semilla de los datos y del tráfico')
+    p.add_argument('--salida', help='fichero JSON donde guardar los resultados')
+    p.set_defaults(funcion=ejecutar)
+
+    p = subparsers.add_parser('escrituras', help='escrituras por segundo según el número de workers (SQLite)')
+    p.add_argument('--usuarios', type=int, default=5000, help='usuarios sintéticos (por defecto 5000)')
+    p.add_argument('--escenarios', type=int, default=300, help='escenarios por ejecución (por defecto 300)')
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                   help='números de workers a probar (por defecto 1 2 4 8)')
+    p.add_argument('--concurrencia', type=int, default=16, help='clientes HTTP en paralelo (por defecto 16)')
+    p.add_argument('--escritor-unico', choices=('si', 'no', 'ambos'), default='ambos',
+                   help='con SQLITE_ESCRITOR_UNICO activado, desactivado o ambos')
+    p.add_argument('--semilla', type=int, default=42, help='semilla de los datos y del tráfico')
+    p.add_argument('--salida', help='fichero JSON donde guardar los resultados')
+    p.set_defaults(funcion=escrituras)
+
+    p = subparsers.add_parser('comparar', help='comparar dos ficheros de resultados')
+    p.add_argument('base')
+    p.add_argument('nuevo')
+    p.add_argument('--umbral', type=float, default=0.2, help='aumento de p95 tolerado (0.2 = 20%%)')
+    p.add_argument('--minimo-ms', type=float, default=1.0, help='diferencia mínima de p95 en ms para contar')
+    p.set_defaults(funcion=comparar)
+
+    args = parser.parse_args()
+    return args.funcion(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Base de datos de pruebas con usuarios sintéticos"""
+import os
+import random
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def preparar_app(ruta_db, config_name='production'):
+    """Crear la app contra un SQLite nuevo con las migraciones y los datos iniciales"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + ruta_db
+    # Todo el tráfico sintético sale del mismo cliente: sin límite de peticiones
+    os.environ['LIMITES_ACTIVOS'] = '0'
+
+    from flask_migrate import upgrade
+    from app import create_app
+    from app.comandos import sembrar_datos_iniciales
+
+    app = create_app(config_name)
+    app.config['TESTING'] = True
+    with app.app_context():
+        upgrade(directory=os.path.join(RAIZ, 'migrations'))
+        sembrar_datos_iniciales()
+    return app
+
+
+def sembrar_usuarios(total_usuarios, semilla=42):
+    """Insertar usuarios con progresos en distintos puntos del recorrido
+
+    Debe llamarse dentro de un contexto de aplicación. Devuelve los ids de
+    los usuarios y de las paradas (en orden de recorrido).
+    """
+    from app import db
+    from app.models import Parada, Progreso, Usuario
+    from app.services import estadisticas, ranking
+
+    aleatorio = random.Random(semilla)
+    inicio = datetime.utcnow() - timedelta(days=120)
+    filas = db.session.query(Parada.id, Parada.ruta_id).order_by(Parada.ruta_id, Parada.orden).all()
+    paradas = [parada_id for parada_id, _ in filas]
+    rutas = dict(filas)
+
+    usuarios = [{
+        'nombre': f'Usuario{i}',
+        'apellido': f'Prueba{i % 97}',
+        'device_id': f'device-{i % 5000}',
+        'fecha_registro': inicio + timedelta(minutes=i)
+    } for i in range(total_usuarios)]
+    db.session.execute(Usuario.__table__.insert(), usuarios)
+
+    ids = [fila[0] for fila in db.session.query(Usuario.id).order_by(Usuario.id).all()]
+    progresos = []
+    for usuario_id in ids:
+        avance = aleatorio.randint(0, len(paradas))
+        for posicion, parada_id in enumerate(paradas):
+            if posicion < avance:
+                estado = 'completada'
+            elif posicion == avance:
+                estado = 'activa'
+            else:
+                estado = 'bloqueada'
+            progresos.append({
+                'usuario_id': usuario_id,
+                'parada_id': parada_id,
+                'ruta_id': rutas[parada_id],
+                'estado': estado,
+                'puntuacion': aleatorio.randint(0, 100) if estado == 'completada' else 0,
+                'tiempo_empleado': aleatorio.randint(30, 900) if estado == 'completada' else None,
+                'intentos': aleatorio.randint(1, 5) if estado == 'completada' else 0
+            })
+    db.session.execute(Progreso.__table__.insert(), progresos)
+    estadisticas.reconstruir()
+    ranking.reconstruir()
+    db.session.commit()
+
+    # En una transacción con commit: con SQLITE_ESCRITOR_UNICO la conexión abre BEGIN IMMEDIATE
+    with db.engine.begin() as conexion:
+        conexion.exec_driver_sql('ANALYZE')
+    # Las conexiones del pool abiertas antes de ANALYZE planifican sin las estadísticas nuevas
+    for motor in db.engines.values():
+        motor.dispose()
+    return ids, paradas
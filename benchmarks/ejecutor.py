@@ -0,0 +1,176 @@
+"""Ejecución de los escenarios contra el cliente de pruebas o un gunicorn local"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from benchmarks.datos import RAIZ
+from benchmarks.trafico import Respuesta
+
+
+class Medidas:
+    """Latencias, errores y sentencias SQL acumuladas por endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.sentencias = defaultdict(list)
+
+    def anotar(self, endpoint, estado, segundos, sentencias=None):
+        with self._lock:
+            self.latencias[endpoint].append(segundos * 1000)
+            if estado == 0 or estado >= 500:
+                self.errores[endpoint] += 1
+            if sentencias is not None:
+                self.sentencias[endpoint].append(sentencias)
+
+
+class ClientePruebas:
+    """Cliente de pruebas de Flask en el mismo proceso; cuenta las sentencias SQL"""
+
+    def __init__(self, app):
+        from sqlalchemy import event
+        from app import db
+
+        self.cliente = app.test_client()
+        self.total_sentencias = 0
+        with app.app_context():
+            for motor in db.engines.values():
+                event.listen(motor, 'before_cursor_execute', self._contar)
+
+    def _contar(self, *args):
+        self.total_sentencias += 1
+
+    def iniciar_sesion(self, usuario, clave):
+        self.cliente.post('/login', data={'username': usuario, 'password': clave})
+
+    def enviar(self, peticion):
+        antes = self.total_sentencias
+        inicio = time.perf_counter()
+        r = self.cliente.open(peticion.url, method=peticion.metodo,
+                              json=peticion.json, headers=peticion.cabeceras)
+        segundos = time.perf_counter() - inicio
+        respuesta = Respuesta(r.status_code, r.get_json(silent=True), dict(r.headers))
+        return respuesta, segundos, self.total_sentencias - antes
+
+
+class ClienteHTTP:
+    """Cliente HTTP con su propia sesión (cookies) contra un servidor real"""
+
+    def __init__(self, base):
+        self.base = base
+        self.abridor = build_opener(HTTPCookieProcessor(CookieJar()))
+
+    def iniciar_sesion(self, usuario, clave):
+        datos = urlencode({'username': usuario, 'password': clave}).encode()
+        self.abridor.open(Request(self.base + '/login', data=datos), timeout=30).read()
+
+    def enviar(self, peticion):
+        cuerpo = json.dumps(peticion.json).encode() if peticion.json is not None else None
+        cabeceras = dict(peticion.cabeceras)
+        if cuerpo is not None:
+            cabeceras['Content-Type'] = 'application/json'
+        solicitud = Request(self.base + peticion.url, data=cuerpo,
+                            method=peticion.metodo, headers=cabeceras)
+
+        inicio = time.perf_counter()
+        try:
+            with self.abridor.open(solicitud, timeout=30) as r:
+                estado, datos, cabeceras_respuesta = r.status, r.read(), r.headers
+        except HTTPError as e:
+            estado, datos, cabeceras_respuesta = e.code, e.read(), e.headers
+        except (URLError, ConnectionError, TimeoutError):
+            estado, datos, cabeceras_respuesta = 0, b'', {}
+        segundos = time.perf_counter() - inicio
+
+        contenido = None
+        if datos and 'json' in (cabeceras_respuesta.get('Content-Type') or ''):
+            contenido = json.loads(datos)
+        return Respuesta(estado, contenido, dict(cabeceras_respuesta)), segundos, None
+
+
+def conducir(escenario, cliente, medidas):
+    """Ejecutar un escenario completo pasando cada respuesta al generador"""
+    try:
+        peticion = next(escenario)
+        while True:
+            respuesta, segundos, sentencias = cliente.enviar(peticion)
+            medidas.anotar(peticion.endpoint, respuesta.estado, segundos, sentencias)
+            peticion = escenario.send(respuesta)
+    except StopIteration:
+        pass
+
+
+def ejecutar_cliente(app, escenarios, credenciales):
+    """Ejecutar los escenarios uno tras otro con el cliente de pruebas"""
+    cliente = ClientePruebas(app)
+    cliente.iniciar_sesion(*credenciales)
+    medidas = Medidas()
+
+    inicio = time.perf_counter()
+    for escenario in escenarios:
+        conducir(escenario, cliente, medidas)
+    return medidas, time.perf_counter() - inicio
+
+
+def ejecutar_http(base, escenarios, credenciales, concurrencia):
+    """Ejecutar los escenarios con ``concurrencia`` clientes HTTP en paralelo"""
+    medidas = Medidas()
+    locales = threading.local()
+
+    def ejecutar(escenario):
+        if not hasattr(locales, 'cliente'):
+            locales.cliente = ClienteHTTP(base)
+            locales.cliente.iniciar_sesion(*credenciales)
+        conducir(escenario, locales.cliente, medidas)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        list(ejecutor.map(ejecutar, escenarios))
+    return medidas, time.perf_counter() - inicio
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def servidor_gunicorn(ruta_db, workers, espera=30, entorno=None):
+    """Arrancar ``gunicorn run:app`` contra ``ruta_db`` y devolver su URL base"""
+    puerto = _puerto_libre()
+    entorno = dict(os.environ, DATABASE_URL='sqlite:///' + ruta_db, FLASK_ENV='production',
+                   LIMITES_ACTIVOS='0', WEB_CONCURRENCY=str(workers), **(entorno or {}))
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{puerto}',
+         '--log-level', 'warning', 'run:app'],
+        cwd=RAIZ, env=entorno
+    )
+    try:
+        limite = time.monotonic() + espera
+        while True:
+            if proceso.poll() is not None:
+                raise RuntimeError(f'gunicorn terminó al arrancar (código {proceso.returncode})')
+            try:
+                socket.create_connection(('127.0.0.1', puerto), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > limite:
+                    raise RuntimeError('gunicorn no respondió a tiempo')
+                time.sleep(0.2)
+        yield f'http://127.0.0.1:{puerto}'
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=15)
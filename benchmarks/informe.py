@@ -0,0 +1,113 @@
+"""Resumen de las medidas y comparación de dos ejecuciones"""
+import json
+
+
+def percentil(ordenados, p):
+    """Percentil ``p`` (0-100) por rango más cercano de una lista ordenada"""
+    if not ordenados:
+        return 0.0
+    posicion = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[posicion]
+
+
+def resumir(medidas, duracion):
+    """Resultados de un modo: totales y, por endpoint, rendimiento y latencias"""
+    endpoints = {}
+    for endpoint, latencias in sorted(medidas.latencias.items()):
+        ordenadas = sorted(latencias)
+        sentencias = medidas.sentencias.get(endpoint)
+        endpoints[endpoint] = {
+            'peticiones': len(ordenadas),
+            'errores': medidas.errores.get(endpoint, 0),
+            'rps': round(len(ordenadas) / duracion, 2) if duracion else 0.0,
+            'media_ms': round(sum(ordenadas) / len(ordenadas), 3),
+            'p50_ms': round(percentil(ordenadas, 50), 3),
+            'p95_ms': round(percentil(ordenadas, 95), 3),
+            'p99_ms': round(percentil(ordenadas, 99), 3),
+            'sql_por_peticion': round(sum(sentencias) / len(sentencias), 2) if sentencias else None
+        }
+
+    total = sum(datos['peticiones'] for datos in endpoints.values())
+    return {
+        'duracion_s': round(duracion, 3),
+        'peticiones': total,
+        'errores': sum(datos['errores'] for datos in endpoints.values()),
+        'rps': round(total / duracion, 2) if duracion else 0.0,
+        'endpoints': endpoints
+    }
+
+
+def imprimir(modo, resumen):
+    """Tabla legible de un modo"""
+    print(f"\n📊 {modo}: {resumen['peticiones']} peticiones en {resumen['duracion_s']} s "
+          f"({resumen['rps']} req/s, {resumen['errores']} errores)")
+    print(f"   {'endpoint':<36} {'n':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'sql':>6}")
+    for endpoint, datos in resumen['endpoints'].items():
+        sql = '-' if datos['sql_por_peticion'] is None else f"{datos['sql_por_peticion']:.1f}"
+        print(f"   {endpoint:<36} {datos['peticiones']:>6} {datos['rps']:>8.1f} {datos['p50_ms']:>8.2f} "
+              f"{datos['p95_ms']:>8.2f} {datos['p99_ms']:>8.2f} {sql:>6}")
+
+
+def resumir_escrituras(medidas, duracion):
+    """Escrituras por segundo, errores y latencias de las peticiones POST"""
+    latencias = sorted(ms for endpoint, lista in medidas.latencias.items()
+                       if endpoint.startswith('POST ') for ms in lista)
+    return {
+        'duracion_s': round(duracion, 3),
+        'escrituras': len(latencias),
+        'escrituras_s': round(len(latencias) / duracion, 2) if duracion else 0.0,
+        'errores': sum(total for endpoint, total in medidas.errores.items() if endpoint.startswith('POST ')),
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p95_ms': round(percentil(latencias, 95), 3),
+        'p99_ms': round(percentil(latencias, 99), 3)
+    }
+
+
+def imprimir_escalado(resultados):
+    """Tabla de escrituras por segundo según el número de workers"""
+    print(f"\n📊 {'modo':<20} {'workers':>7} {'escr/s':>9} {'errores':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for modo, filas in resultados.items():
+        for workers, datos in filas.items():
+            print(f"   {modo:<20} {workers:>7} {datos['escrituras_s']:>9.1f} {datos['errores']:>8} "
+                  f"{datos['p50_ms']:>8.2f} {datos['p95_ms']:>8.2f} {datos['p99_ms']:>8.2f}")
+
+
+def comparar(ruta_base, ruta_nueva, umbral=0.2, minimo_ms=1.0):
+    """Comparar dos ficheros de resultados; devuelve el número de regresiones
+
+    Cuenta como regresión un p95 que crece más de ``umbral`` (proporción) y
+    más de ``minimo_ms``, cualquier aumento de sentencias SQL por petición o
+    la aparición de errores.
+    """
+    with open(ruta_base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(ruta_nueva, encoding='utf-8') as f:
+        nueva = json.load(f)
+
+    regresiones = 0
+    for modo, resumen in nueva['modos'].items():
+        anterior = base['modos'].get(modo)
+        if anterior is None:
+            continue
+        print(f"\n🔍 {modo}: {anterior['rps']} → {resumen['rps']} req/s")
+        for endpoint, datos in resumen['endpoints'].items():
+            previo = anterior['endpoints'].get(endpoint)
+            if previo is None:
+                print(f"   ➕ {endpoint} (nuevo)")
+                continue
+
+            motivos = []
+            if datos['p95_ms'] > previo['p95_ms'] * (1 + umbral) and datos['p95_ms'] - previo['p95_ms'] > minimo_ms:
+                motivos.append(f"p95 {previo['p95_ms']:.2f} → {datos['p95_ms']:.2f} ms")
+            if previo['sql_por_peticion'] is not None and datos['sql_por_peticion'] is not None \
+                    and datos['sql_por_peticion'] > previo['sql_por_peticion'] + 0.05:
+                motivos.append(f"sql {previo['sql_por_peticion']} → {datos['sql_por_peticion']}")
+            if datos['errores'] > previo['errores']:
+                motivos.append(f"errores {previo['errores']} → {datos['errores']}")
+
+            if motivos:
+                regresiones += 1
+                print(f"   ❌ {endpoint}: {', '.join(motivos)}")
+            else:
+                print(f"   ✅ {endpoint}: p95 {previo['p95_ms']:.2f} → {datos['p95_ms']:.2f} ms")
+    return regresiones
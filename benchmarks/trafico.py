@@ -0,0 +1,106 @@
+"""Generador de tráfico realista del recorrido
+
+Cada escenario es un generador que produce ``Peticion`` y recibe la
+``Respuesta`` de la anterior (``respuesta = yield peticion``), así una cadena
+puede usar el id devuelto por el registro para completar sus paradas.
+"""
+import random
+from collections import namedtuple
+
+Peticion = namedtuple('Peticion', 'endpoint metodo url json cabeceras')
+Respuesta = namedtuple('Respuesta', 'estado json cabeceras')
+
+
+def peticion(endpoint, url=None, json=None, cabeceras=None):
+    """Petición etiquetada con su endpoint (``'GET /api/paradas/<id>'``)"""
+    metodo, ruta = endpoint.split(' ', 1)
+    return Peticion(endpoint, metodo, url or ruta, json, cabeceras or {})
+
+
+def recorrido(aleatorio, contexto):
+    """Un visitante se registra y completa las paradas en orden consultando su progreso"""
+    n = contexto['siguiente']()
+    respuesta = yield peticion('POST /api/usuarios/registro', json={
+        'nombre': f'Visitante{n}', 'apellido': 'Bench', 'device_id': f'bench-{n}'
+    })
+    if respuesta.estado != 200:
+        return
+    usuario_id = respuesta.json['usuario']['id']
+
+    hasta = aleatorio.randint(1, len(contexto['paradas']))
+    for parada_id in contexto['paradas'][:hasta]:
+        yield peticion('POST /api/progreso/completar', json={
+            'usuario_id': usuario_id,
+            'parada_id': parada_id,
+            'puntuacion': aleatorio.randint(0, 100),
+            'tiempo_empleado': aleatorio.randint(30, 900),
+            'intentos': aleatorio.randint(1, 4)
+        })
+        yield peticion('GET /api/progreso/<id>', url=f'/api/progreso/{usuario_id}')
+
+
+def registro_grupo(aleatorio, contexto):
+    """Una clase entera se registra a la vez desde la misma tablet"""
+    n = contexto['siguiente']()
+    tamano = aleatorio.randint(15, 30)
+    yield peticion('POST /api/usuarios/registro/lote', json={'usuarios': [
+        {'nombre': f'Alumno{i}', 'apellido': f'Clase{n}', 'device_id': f'tablet-{n}'}
+        for i in range(tamano)
+    ]})
+
+
+def catalogo(aleatorio, contexto):
+    """La app consulta el catálogo y vuelve a preguntar con If-None-Match"""
+    respuesta = yield peticion('GET /api/paradas')
+    etag = respuesta.cabeceras.get('ETag')
+    for _ in range(aleatorio.randint(1, 4)):
+        yield peticion('GET /api/paradas (304)', url='/api/paradas',
+                       cabeceras={'If-None-Match': etag} if etag else {})
+    parada_id = aleatorio.choice(contexto['paradas'])
+    yield peticion('GET /api/paradas/<id>', url=f'/api/paradas/{parada_id}')
+
+
+def consulta_progreso(aleatorio, contexto):
+    """Un usuario existente reabre la app y consulta su progreso y las estadísticas"""
+    usuario_id = aleatorio.choice(contexto['usuarios'])
+    yield peticion('GET /api/progreso/<id>', url=f'/api/progreso/{usuario_id}')
+    yield peticion('GET /api/estadisticas')
+
+
+def panel(aleatorio, contexto):
+    """Un administrador navega por el panel web (requiere sesión iniciada)"""
+    yield peticion('GET /dashboard')
+    yield peticion('GET /usuarios')
+    usuario_id = aleatorio.choice(contexto['usuarios'])
+    yield peticion('GET /usuarios/<id>', url=f'/usuarios/{usuario_id}')
+
+
+# Peso relativo de cada escenario en la mezcla
+MEZCLA = (
+    (recorrido, 30),
+    (catalogo, 35),
+    (consulta_progreso, 20),
+    (registro_grupo, 5),
+    (panel, 10),
+)
+
+# Mezcla dominada por escrituras para medir cómo escala con los workers
+MEZCLA_ESCRITURA = (
+    (recorrido, 70),
+    (registro_grupo, 10),
+    (consulta_progreso, 20),
+)
+
+
+def generar_escenarios(total, usuarios, paradas, semilla=42, mezcla=MEZCLA):
+    """Lista reproducible de ``total`` escenarios listos para ejecutar"""
+    aleatorio = random.Random(semilla)
+    contador = iter(range(10 ** 9))
+    contexto = {'usuarios': usuarios, 'paradas': paradas, 'siguiente': lambda: next(contador)}
+    funciones = [funcion for funcion, _ in mezcla]
+    pesos = [peso for _, peso in mezcla]
+
+    return [
+        elegida(random.Random(aleatorio.random()), contexto)
+        for elegida in aleatorio.choices(funciones, weights=pesos, k=total)
+    ]
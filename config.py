@@ -1,8 +1,65 @@
 import os
 from dotenv import load_dotenv
+from sqlalchemy.pool import NullPool
 
 load_dotenv()
 
+# Perfiles del motor de base de datos (DB_PERFIL)
+PERFILES_MOTOR = ('pooled', 'pgbouncer', 'sqlite')
+
+
+def perfil_motor(url):
+    """Perfil elegido con DB_PERFIL o, si no se indica, el que corresponde a la URL"""
+    perfil = (os.environ.get('DB_PERFIL') or 'auto').lower()
+    if perfil == 'auto':
+        return 'sqlite' if url.startswith('sqlite') else 'pooled'
+    if perfil not in PERFILES_MOTOR:
+        raise ValueError(f"DB_PERFIL debe ser uno de {', '.join(PERFILES_MOTOR)} o auto")
+    return perfil
+
+
+def url_solo_lectura(url):
+    """URL SQLite que abre el mismo fichero en modo solo lectura"""
+    ruta = url.split('///', 1)[1]
+    return f'sqlite:///file:{ruta}?mode=ro&uri=true'
+
+
+def opciones_motor(perfil, url):
+    """SQLALCHEMY_ENGINE_OPTIONS de cada perfil a partir de las variables de entorno
+
+    - pooled: pool propio por worker, con pre-ping y reciclado para sobrevivir a
+      las conexiones que el proxy cierra tras un rato inactivas.
+    - pgbouncer: sin pool (NullPool), las conexiones las reparte PgBouncer.
+    - sqlite: fichero compartido entre hilos con espera si está bloqueado (los
+      PRAGMA de WAL se aplican al conectar, ver app/motor.py).
+    """
+    if perfil == 'sqlite':
+        return {
+            'connect_args': {
+                'check_same_thread': False,
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000) / 1000
+            }
+        }
+    
+    connect_args = {'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT') or 10)}
+    if perfil == 'pgbouncer':
+        # PgBouncer rechaza parámetros de arranque como `options`: el
+        # statement_timeout se configura en el rol (ALTER ROLE ... SET)
+        return {'poolclass': NullPool, 'connect_args': connect_args}
+    
+    timeout_sentencia = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS') or 15000)
+    if url.startswith('postgresql') and timeout_sentencia:
+        connect_args['options'] = f'-c statement_timeout={timeout_sentencia}'
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 5),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 5),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 280),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT') or 10),
+        'pool_pre_ping': True,
+        'pool_use_lifo': True,
+        'connect_args': connect_args
+    }
+
 class Config:
     """Configuración base de la aplicación Flask"""
     
@@ -21,6 +78,125 @@ class Config:
         'sqlite:///' + os.path.join(BASE_DIR, 'instance', 'mentxuapp.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Perfil del motor (pooled, pgbouncer o sqlite; por defecto según la URL)
+    DB_PERFIL = perfil_motor(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_ENGINE_OPTIONS = opciones_motor(DB_PERFIL, SQLALCHEMY_DATABASE_URI)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB') or 16000)
+    
+    # SQLite con varios workers (opcional): una sola conexión de escritura por
+    # proceso (BEGIN IMMEDIATE con reintentos) y un pool aparte de solo lectura
+    # para las consultas previas a escribir. Solo con ficheros (no en memoria)
+    SQLITE_ESCRITOR_UNICO = (
+        DB_PERFIL == 'sqlite'
+        and ':memory:' not in SQLALCHEMY_DATABASE_URI
+        and SQLALCHEMY_DATABASE_URI.rstrip('/') != 'sqlite:'
+        and (os.environ.get('SQLITE_ESCRITOR_UNICO') or '0').lower() in ('1', 'true', 'si', 'yes')
+    )
+    SQLITE_REINTENTOS = int(os.environ.get('SQLITE_REINTENTOS') or 5)
+    SQLITE_BACKOFF_MS = int(os.environ.get('SQLITE_BACKOFF_MS') or 50)
+    if SQLITE_ESCRITOR_UNICO:
+        SQLALCHEMY_BINDS = {
+            'lector': dict(opciones_motor('sqlite', SQLALCHEMY_DATABASE_URI),
+                           url=url_solo_lectura(SQLALCHEMY_DATABASE_URI))
+        }
+        SQLALCHEMY_ENGINE_OPTIONS = dict(SQLALCHEMY_ENGINE_OPTIONS, pool_size=1, max_overflow=0, pool_timeout=30)
+    
+    # Conexiones que admite la base de datos; si se indica, al arrancar se avisa
+    # cuando workers × (pool_size + max_overflow) lo supera
+    DB_MAX_CONEXIONES = int(os.environ.get('DB_MAX_CONEXIONES') or 0)
+    
+    # Caché del catálogo de paradas (segundos)
+    CATALOGO_TTL_VERSION = int(os.environ.get('CATALOGO_TTL_VERSION') or 5)
+    CATALOGO_MAX_AGE = int(os.environ.get('CATALOGO_MAX_AGE') or 300)
+    
+    # Búsqueda de paradas cercanas (radio por defecto y máximo, en metros) y radio
+    # en el que /api/progreso/checkin da por llegado al dispositivo
+    PARADAS_CERCANAS_RADIO = int(os.environ.get('PARADAS_CERCANAS_RADIO') or 500)
+    PARADAS_CERCANAS_RADIO_MAXIMO = int(os.environ.get('PARADAS_CERCANAS_RADIO_MAXIMO') or 5000)
+    CHECKIN_RADIO = int(os.environ.get('CHECKIN_RADIO') or 50)
+    
+    # Máximo de paradas completadas por petición de /api/progreso/sync
+    SYNC_MAX_ELEMENTOS = int(os.environ.get('SYNC_MAX_ELEMENTOS') or 500)
+    
+    # Conflictos de métricas en /api/sync/push: 'max' (gana la mayor puntuación)
+    # o 'lww' (gana la modificación más reciente)
+    SYNC_RESOLUCION = (os.environ.get('SYNC_RESOLUCION') or 'max').lower()
+    
+    # Filas por lote al exportar el historial de progreso (memoria constante)
+    EXPORTACION_LOTE = int(os.environ.get('EXPORTACION_LOTE') or 5000)
+    
+    # Máximo de usuarios por petición de /api/usuarios/registro/lote
+    REGISTRO_LOTE_MAXIMO = int(os.environ.get('REGISTRO_LOTE_MAXIMO') or 100)
+    
+    # Tamaño de página de /api/usuarios (por defecto y máximo con ?limit=)
+    USUARIOS_LIMITE = int(os.environ.get('USUARIOS_LIMITE') or 100)
+    USUARIOS_LIMITE_MAXIMO = int(os.environ.get('USUARIOS_LIMITE_MAXIMO') or 1000)
+    
+    # Modo write-behind del progreso: las escrituras van a una cola local y se
+    # aplican en lotes en segundo plano (ver app/services/cola_progreso.py)
+    PROGRESO_WRITE_BEHIND = (os.environ.get('PROGRESO_WRITE_BEHIND') or '').lower() in ('1', 'true', 'si', 'yes')
+    PROGRESO_COLA_RUTA = os.environ.get('PROGRESO_COLA_RUTA')  # por defecto instance/cola_progreso.db
+    PROGRESO_COLA_LOTE = int(os.environ.get('PROGRESO_COLA_LOTE') or 500)
+    PROGRESO_COLA_INTERVALO = float(os.environ.get('PROGRESO_COLA_INTERVALO') or 0.5)
+    PROGRESO_COLA_CADUCIDAD = int(os.environ.get('PROGRESO_COLA_CADUCIDAD') or 60)
+    
+    # Logging: nivel y formato ('texto' o 'json')
+    LOG_NIVEL = os.environ.get('LOG_NIVEL') or 'INFO'
+    LOG_FORMATO = os.environ.get('LOG_FORMATO') or 'texto'
+    
+    # Métricas por endpoint en /metrics (protegidas con un token) y cabecera
+    # Server-Timing en las respuestas. Sin token, /metrics responde 404 salvo con
+    # METRICAS_PUBLICAS=1 (pensado para desarrollo local, no para producción)
+    METRICAS_ACTIVAS = (os.environ.get('METRICAS_ACTIVAS') or '1').lower() in ('1', 'true', 'si', 'yes')
+    METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
+    METRICAS_PUBLICAS = (os.environ.get('METRICAS_PUBLICAS') or '').lower() in ('1', 'true', 'si', 'yes')
+    SERVER_TIMING = (os.environ.get('SERVER_TIMING') or '').lower() in ('1', 'true', 'si', 'yes')
+    
+    # Serializar JSON con orjson cuando está instalado (0 para usar la biblioteca estándar)
+    JSON_RAPIDO = (os.environ.get('JSON_RAPIDO') or '1').lower() in ('1', 'true', 'si', 'yes')
+    
+    # Compresión de las respuestas (gzip, o brotli si está instalado) a partir de un tamaño
+    COMPRESION_ACTIVA = (os.environ.get('COMPRESION_ACTIVA') or '1').lower() in ('1', 'true', 'si', 'yes')
+    COMPRESION_MINIMO = int(os.environ.get('COMPRESION_MINIMO') or 1024)
+    COMPRESION_NIVEL = int(os.environ.get('COMPRESION_NIVEL') or 6)
+    COMPRESION_CALIDAD_BROTLI = int(os.environ.get('COMPRESION_CALIDAD_BROTLI') or 5)
+    
+    # Caché HTTP: preflight de CORS y ficheros estáticos con hash en el nombre
+    CORS_MAX_AGE = int(os.environ.get('CORS_MAX_AGE') or 86400)
+    ESTATICOS_MAX_AGE = int(os.environ.get('ESTATICOS_MAX_AGE') or 31536000)
+    
+    # Ranking: tamaño de la respuesta y segundos que cada worker reutiliza su instantánea
+    RANKING_LIMITE = int(os.environ.get('RANKING_LIMITE') or 10)
+    RANKING_LIMITE_MAXIMO = int(os.environ.get('RANKING_LIMITE_MAXIMO') or 100)
+    RANKING_TTL = int(os.environ.get('RANKING_TTL') or 5)
+    
+    # Segundos que cada worker reutiliza las métricas del embudo (/api/estadisticas/embudo)
+    ANALITICA_TTL = int(os.environ.get('ANALITICA_TTL') or 300)
+    
+    # Panel: segundos que se reutilizan sus datos, cada cuánto se buscan cambios
+    # para las conexiones en directo (SSE), duración y máximo de esas conexiones por worker
+    DASHBOARD_TTL = int(os.environ.get('DASHBOARD_TTL') or 5)
+    DASHBOARD_INTERVALO = float(os.environ.get('DASHBOARD_INTERVALO') or 1.0)
+    DASHBOARD_SSE_DURACION = int(os.environ.get('DASHBOARD_SSE_DURACION') or 300)
+    DASHBOARD_SSE_MAXIMO = int(os.environ.get('DASHBOARD_SSE_MAXIMO') or 5)
+    
+    # Límite de peticiones por cliente ('n/segundos'; vacío o 0 para quitarlo) en
+    # el registro y en las estadísticas públicas. Los cubos se guardan en memoria
+    # de cada worker o en un SQLite local compartido ('fichero')
+    LIMITES_ACTIVOS = (os.environ.get('LIMITES_ACTIVOS') or '1').lower() in ('1', 'true', 'si', 'yes')
+    LIMITES_BACKEND = (os.environ.get('LIMITES_BACKEND') or 'memoria').lower()
+    LIMITES_RUTA = os.environ.get('LIMITES_RUTA')  # por defecto instance/limites.db
+    LIMITE_REGISTRO = os.environ.get('LIMITE_REGISTRO', '10/60')
+    LIMITE_ESTADISTICAS = os.environ.get('LIMITE_ESTADISTICAS', '60/60')
+    # Proxies de confianza delante de la app (Railway: 1) para tomar la IP de X-Forwarded-For
+    LIMITES_PROXIES = int(os.environ.get('LIMITES_PROXIES') or 0)
+    
+    # Las estadísticas públicas se calculan una vez para todas las peticiones
+    # simultáneas y se reutilizan durante esta ventana (milisegundos)
+    ESTADISTICAS_VENTANA_MS = int(os.environ.get('ESTADISTICAS_VENTANA_MS', 1000))
+    
     # Google Maps
     GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY') or ''
     
@@ -0,0 +1,11 @@
+"""Perfil de gunicorn para asgi.py: workers de uvicorn (una conexión en espera no ocupa un hilo)"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY') or 2)
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Las apps móviles reutilizan la conexión entre peticiones del recorrido
+keepalive = int(os.environ.get('ASGI_KEEPALIVE') or 75)
+timeout = int(os.environ.get('ASGI_TIMEOUT') or 30)
+graceful_timeout = 30
@@ -1,6 +1,7 @@
 from app import create_app, db
-from app.models import Admin, Parada
+from app.models import Admin, Parada, Ruta
 from config import config
+from flask_migrate import upgrade
 import os
 
 def init_database():
@@ -9,9 +10,9 @@ def init_database():
     app = create_app('default')
     
     with app.app_context():
-        # Crear todas las tablas
-        print("📦 Creando tablas en la base de datos...")
-        db.create_all()
+        # Crear o actualizar las tablas con las migraciones
+        print("📦 Aplicando migraciones de la base de datos...")
+        upgrade()
         
         # Crear usuario administrador si no existe
         admin = Admin.query.filter_by(username='admin').first()
@@ -85,13 +86,20 @@ def init_database():
                 }
             ]
             
+            # La ruta por defecto la crea la migración de rutas
+            ruta = Ruta.query.order_by(Ruta.id).first()
             for parada_data in paradas_data:
-                parada = Parada(**parada_data)
+                parada = Parada(ruta_id=ruta.id, **parada_data)
                 db.session.add(parada)
                 print(f"   ✓ Parada {parada_data['orden']}: {parada_data['nombre_corto']}")
         else:
             print("ℹ️  Las paradas ya existen")
         
+        # Recalcular los contadores de estadísticas y la versión del catálogo
+        from app.services import catalogo, estadisticas
+        catalogo.incrementar_version()
+        estadisticas.reconstruir()
+        
         # Commit de todos los cambios
         db.session.commit()
         
@@ -0,0 +1,72 @@
+"""esquema inicial
+
+Revision ID: 26d169ec6033
+Revises: 
+Create Date: 2026-10-18 16:04:02.579044
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '26d169ec6033'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('admins',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=80), nullable=False),
+    sa.Column('password_hash', sa.String(length=200), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=True),
+    sa.Column('fecha_creacion', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('paradas',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=200), nullable=False),
+    sa.Column('nombre_corto', sa.String(length=100), nullable=True),
+    sa.Column('latitud', sa.Float(), nullable=False),
+    sa.Column('longitud', sa.Float(), nullable=False),
+    sa.Column('descripcion', sa.Text(), nullable=True),
+    sa.Column('tipo_juego', sa.String(length=50), nullable=True),
+    sa.Column('orden', sa.Integer(), nullable=True),
+    sa.Column('imagen_url', sa.String(length=300), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('orden')
+    )
+    op.create_table('usuarios',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=100), nullable=False),
+    sa.Column('apellido', sa.String(length=100), nullable=False),
+    sa.Column('fecha_registro', sa.DateTime(), nullable=True),
+    sa.Column('device_id', sa.String(length=200), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('progreso',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('parada_id', sa.Integer(), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=True),
+    sa.Column('fecha_inicio', sa.DateTime(), nullable=True),
+    sa.Column('fecha_completado', sa.DateTime(), nullable=True),
+    sa.Column('puntuacion', sa.Integer(), nullable=True),
+    sa.Column('tiempo_empleado', sa.Integer(), nullable=True),
+    sa.Column('intentos', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['parada_id'], ['paradas.id'], ),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('usuario_id', 'parada_id', name='unique_usuario_parada')
+    )
+
+
+def downgrade():
+    op.drop_table('progreso')
+    op.drop_table('usuarios')
+    op.drop_table('paradas')
+    op.drop_table('admins')
@@ -0,0 +1,36 @@
+"""índices de progreso y usuarios
+
+Revision ID: 58c6cb5647ed
+Revises: 9fde8fcd33e9
+Create Date: 2026-10-18 16:06:40.871562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '58c6cb5647ed'
+down_revision = '9fde8fcd33e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('usuarios', schema=None) as batch_op:
+        batch_op.create_index('ix_usuarios_fecha_registro', ['fecha_registro'], unique=False)
+        batch_op.create_index('ix_usuarios_nombre_apellido_device', ['nombre', 'apellido', 'device_id'], unique=False)
+
+    with op.batch_alter_table('progreso', schema=None) as batch_op:
+        batch_op.create_index('ix_progreso_estado', ['estado'], unique=False)
+        batch_op.create_index('ix_progreso_parada_estado', ['parada_id', 'estado'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('progreso', schema=None) as batch_op:
+        batch_op.drop_index('ix_progreso_parada_estado')
+        batch_op.drop_index('ix_progreso_estado')
+
+    with op.batch_alter_table('usuarios', schema=None) as batch_op:
+        batch_op.drop_index('ix_usuarios_nombre_apellido_device')
+        batch_op.drop_index('ix_usuarios_fecha_registro')
@@ -0,0 +1,40 @@
+"""fecha de actualización del progreso
+
+Revision ID: 68af3256f0d8
+Revises: d794cf5f2acb
+Create Date: 2026-10-18 16:09:01.350969
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '68af3256f0d8'
+down_revision = 'd794cf5f2acb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('progreso', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_progreso_usuario_actualizacion', ['usuario_id', 'fecha_actualizacion'], unique=False)
+
+    # Los progresos existentes toman la última fecha conocida
+    progreso = sa.table('progreso',
+                        sa.column('fecha_actualizacion', sa.DateTime),
+                        sa.column('fecha_inicio', sa.DateTime),
+                        sa.column('fecha_completado', sa.DateTime))
+    op.execute(progreso.update().values(
+        fecha_actualizacion=sa.func.coalesce(progreso.c.fecha_completado, progreso.c.fecha_inicio,
+                                             sa.literal(datetime.utcnow(), sa.DateTime))
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('progreso', schema=None) as batch_op:
+        batch_op.drop_index('ix_progreso_usuario_actualizacion')
+        batch_op.drop_column('fecha_actualizacion')
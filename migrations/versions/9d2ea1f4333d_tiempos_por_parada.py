@@ -0,0 +1,40 @@
+"""tiempos por parada
+
+Suma y número de tiempos de los completados en los contadores de cada
+parada, para la media de `/api/paradas/<id>/estadisticas`.
+
+Revision ID: 9d2ea1f4333d
+Revises: b9c847003952
+Create Date: 2026-10-18 17:40:12.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2ea1f4333d'
+down_revision = 'b9c847003952'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('estadisticas_paradas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tiempo_total', sa.BigInteger(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('tiempo_cuenta', sa.Integer(), server_default='0', nullable=False))
+
+    # Los contadores existentes se completan con el progreso actual
+    op.execute(
+        "UPDATE estadisticas_paradas SET "
+        "tiempo_total = COALESCE((SELECT SUM(p.tiempo_empleado) FROM progreso p "
+        "WHERE p.parada_id = estadisticas_paradas.parada_id AND p.estado = 'completada'), 0), "
+        "tiempo_cuenta = (SELECT COUNT(p.tiempo_empleado) FROM progreso p "
+        "WHERE p.parada_id = estadisticas_paradas.parada_id AND p.estado = 'completada')"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('estadisticas_paradas', schema=None) as batch_op:
+        batch_op.drop_column('tiempo_cuenta')
+        batch_op.drop_column('tiempo_total')
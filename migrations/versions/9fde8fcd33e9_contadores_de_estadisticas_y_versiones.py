@@ -0,0 +1,52 @@
+"""contadores de estadísticas y versiones
+
+Revision ID: 9fde8fcd33e9
+Revises: 26d169ec6033
+Create Date: 2026-10-18 16:05:11.204317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9fde8fcd33e9'
+down_revision = '26d169ec6033'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Estas tablas las creaba el arranque de la aplicación antes de usar
+    # migraciones, así que pueden existir ya en bases de datos anteriores
+    tablas = sa.inspect(op.get_bind()).get_table_names()
+    
+    if 'contadores_version' not in tablas:
+        op.create_table('contadores_version',
+        sa.Column('nombre', sa.String(length=50), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('nombre')
+        )
+    if 'estadisticas_globales' not in tablas:
+        op.create_table('estadisticas_globales',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('total_usuarios', sa.Integer(), nullable=False),
+        sa.Column('total_completados', sa.Integer(), nullable=False),
+        sa.Column('total_activos', sa.Integer(), nullable=False),
+        sa.Column('usuarios_completaron_todo', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'estadisticas_paradas' not in tablas:
+        op.create_table('estadisticas_paradas',
+        sa.Column('parada_id', sa.Integer(), nullable=False),
+        sa.Column('completados', sa.Integer(), nullable=False),
+        sa.Column('activos', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['parada_id'], ['paradas.id'], ),
+        sa.PrimaryKeyConstraint('parada_id')
+        )
+
+
+def downgrade():
+    op.drop_table('estadisticas_paradas')
+    op.drop_table('estadisticas_globales')
+    op.drop_table('contadores_version')
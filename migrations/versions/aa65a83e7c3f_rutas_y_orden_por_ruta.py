@@ -0,0 +1,101 @@
+"""rutas y orden por ruta
+
+Las paradas y el progreso existentes pasan a la ruta por defecto (id 1). Los
+contadores de cada ruta los calcula `flask seed` (o
+`flask estadisticas reconstruir`).
+
+Revision ID: aa65a83e7c3f
+Revises: b7fa6b58c873
+Create Date: 2026-10-18 16:47:30.279154
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'aa65a83e7c3f'
+down_revision = 'b7fa6b58c873'
+branch_labels = None
+depends_on = None
+
+
+RUTA_DEFECTO = 1
+
+# En SQLite la restricción UNIQUE(orden) del esquema inicial no tiene nombre:
+# se le da uno al reconstruir la tabla para poder eliminarla
+CONVENCION = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def _unico_orden():
+    """Nombre de la restricción UNIQUE(orden) de paradas"""
+    return 'paradas_orden_key' if op.get_bind().dialect.name == 'postgresql' else 'uq_paradas_orden'
+
+
+def upgrade():
+    op.create_table('rutas',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('slug', sa.String(length=100), nullable=False),
+    sa.Column('nombre', sa.String(length=200), nullable=False),
+    sa.Column('descripcion', sa.Text(), nullable=True),
+    sa.Column('fecha_creacion', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('slug')
+    )
+    op.create_table('estadisticas_rutas',
+    sa.Column('ruta_id', sa.Integer(), nullable=False),
+    sa.Column('usuarios', sa.Integer(), nullable=False),
+    sa.Column('total_completados', sa.Integer(), nullable=False),
+    sa.Column('total_activos', sa.Integer(), nullable=False),
+    sa.Column('usuarios_completaron_todo', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ruta_id'], ['rutas.id'], ),
+    sa.PrimaryKeyConstraint('ruta_id')
+    )
+
+    # Ruta por defecto con las paradas y el progreso que ya existen
+    rutas = sa.table('rutas', *map(sa.column, ['id', 'slug', 'nombre', 'descripcion', 'fecha_creacion']))
+    op.bulk_insert(rutas, [{'id': RUTA_DEFECTO, 'slug': 'santurtzi', 'nombre': 'Santurtzi',
+                            'descripcion': 'Recorrido de Mentxu por Santurtzi', 'fecha_creacion': datetime.utcnow()}])
+    if op.get_bind().dialect.name == 'postgresql':
+        # El id explícito no avanza la secuencia: la siguiente ruta creada chocaría con la 1
+        op.execute("SELECT setval('rutas_id_seq', (SELECT MAX(id) FROM rutas))")
+    for tabla in ('paradas', 'progreso'):
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('ruta_id', sa.Integer(), nullable=True))
+        op.execute(sa.table(tabla, sa.column('ruta_id')).update().values(ruta_id=RUTA_DEFECTO))
+
+    # El orden deja de ser único en toda la tabla para serlo dentro de cada ruta
+    with op.batch_alter_table('paradas', schema=None, naming_convention=CONVENCION) as batch_op:
+        batch_op.alter_column('ruta_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_constraint(_unico_orden(), type_='unique')
+        batch_op.create_unique_constraint('unique_ruta_orden', ['ruta_id', 'orden'])
+        batch_op.create_foreign_key('fk_paradas_ruta_id_rutas', 'rutas', ['ruta_id'], ['id'])
+
+    with op.batch_alter_table('progreso', schema=None) as batch_op:
+        batch_op.alter_column('ruta_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_index('ix_progreso_usuario_ruta_estado', ['usuario_id', 'ruta_id', 'estado'], unique=False)
+        batch_op.create_foreign_key('fk_progreso_ruta_id_rutas', 'rutas', ['ruta_id'], ['id'])
+
+
+def downgrade():
+    # Sin rutas solo puede quedar un recorrido: se conserva el de la ruta por defecto
+    op.execute('DELETE FROM progreso WHERE ruta_id <> %d' % RUTA_DEFECTO)
+    op.execute('DELETE FROM estadisticas_paradas WHERE parada_id IN '
+               '(SELECT id FROM paradas WHERE ruta_id <> %d)' % RUTA_DEFECTO)
+    op.execute('DELETE FROM paradas WHERE ruta_id <> %d' % RUTA_DEFECTO)
+
+    with op.batch_alter_table('progreso', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_progreso_ruta_id_rutas', type_='foreignkey')
+        batch_op.drop_index('ix_progreso_usuario_ruta_estado')
+        batch_op.drop_column('ruta_id')
+
+    with op.batch_alter_table('paradas', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_paradas_ruta_id_rutas', type_='foreignkey')
+        batch_op.drop_constraint('unique_ruta_orden', type_='unique')
+        batch_op.create_unique_constraint(_unico_orden(), ['orden'])
+        batch_op.drop_column('ruta_id')
+
+    op.drop_table('estadisticas_rutas')
+    op.drop_table('rutas')
@@ -0,0 +1,76 @@
+"""puntuaciones del ranking
+
+Revision ID: b7fa6b58c873
+Revises: 68af3256f0d8
+Create Date: 2026-10-18 16:35:48.791422
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7fa6b58c873'
+down_revision = '68af3256f0d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('puntuaciones_diarias',
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('puntuacion', sa.Integer(), nullable=False),
+    sa.Column('tiempo_empleado', sa.Integer(), nullable=False),
+    sa.Column('completadas', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('fecha', 'usuario_id')
+    )
+    with op.batch_alter_table('puntuaciones_diarias', schema=None) as batch_op:
+        batch_op.create_index('ix_puntuaciones_diarias_usuario', ['usuario_id'], unique=False)
+
+    op.create_table('puntuaciones_usuarios',
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('puntuacion', sa.Integer(), nullable=False),
+    sa.Column('tiempo_empleado', sa.Integer(), nullable=False),
+    sa.Column('completadas', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('usuario_id')
+    )
+
+    # Totales de los progresos ya completados
+    progreso = sa.table('progreso',
+                        sa.column('usuario_id', sa.Integer),
+                        sa.column('estado', sa.String),
+                        sa.column('fecha_completado', sa.DateTime),
+                        sa.column('puntuacion', sa.Integer),
+                        sa.column('tiempo_empleado', sa.Integer))
+    totales = [
+        sa.func.sum(sa.func.coalesce(progreso.c.puntuacion, 0)),
+        sa.func.sum(sa.func.coalesce(progreso.c.tiempo_empleado, 0)),
+        sa.func.count()
+    ]
+    columnas = ['puntuacion', 'tiempo_empleado', 'completadas']
+    completadas = progreso.c.estado == 'completada'
+    op.execute(sa.table('puntuaciones_usuarios', *map(sa.column, ['usuario_id', *columnas])).insert().from_select(
+        ['usuario_id', *columnas],
+        sa.select(progreso.c.usuario_id, *totales).where(completadas).group_by(progreso.c.usuario_id)
+    ))
+    if op.get_bind().dialect.name == 'sqlite':
+        dia = sa.func.date(progreso.c.fecha_completado)
+    else:
+        dia = sa.cast(progreso.c.fecha_completado, sa.Date)
+    op.execute(sa.table('puntuaciones_diarias', *map(sa.column, ['fecha', 'usuario_id', *columnas])).insert().from_select(
+        ['fecha', 'usuario_id', *columnas],
+        sa.select(dia, progreso.c.usuario_id, *totales)
+        .where(completadas, progreso.c.fecha_completado.isnot(None))
+        .group_by(dia, progreso.c.usuario_id)
+    ))
+
+
+def downgrade():
+    op.drop_table('puntuaciones_usuarios')
+    with op.batch_alter_table('puntuaciones_diarias', schema=None) as batch_op:
+        batch_op.drop_index('ix_puntuaciones_diarias_usuario')
+
+    op.drop_table('puntuaciones_diarias')
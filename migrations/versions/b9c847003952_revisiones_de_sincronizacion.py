@@ -0,0 +1,38 @@
+"""revisiones de sincronizacion
+
+Revision ID: b9c847003952
+Revises: aa65a83e7c3f
+Create Date: 2026-10-18 16:52:24.760671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9c847003952'
+down_revision = 'aa65a83e7c3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('progreso', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_progreso_usuario_revision', ['usuario_id', 'revision'], unique=False)
+
+    with op.batch_alter_table('usuarios', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+
+    # Los progresos existentes entran en el feed con la revisión 1
+    op.execute('UPDATE progreso SET revision = 1')
+    op.execute('UPDATE usuarios SET revision = 1 WHERE id IN (SELECT usuario_id FROM progreso)')
+
+
+def downgrade():
+    with op.batch_alter_table('usuarios', schema=None) as batch_op:
+        batch_op.drop_column('revision')
+
+    with op.batch_alter_table('progreso', schema=None) as batch_op:
+        batch_op.drop_index('ix_progreso_usuario_revision')
+        batch_op.drop_column('revision')
@@ -0,0 +1,28 @@
+"""índice de paginación de usuarios
+
+Revision ID: d794cf5f2acb
+Revises: 58c6cb5647ed
+Create Date: 2026-10-18 16:07:32.575511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd794cf5f2acb'
+down_revision = '58c6cb5647ed'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('usuarios', schema=None) as batch_op:
+        batch_op.drop_index('ix_usuarios_fecha_registro')
+        batch_op.create_index('ix_usuarios_fecha_registro_id', ['fecha_registro', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('usuarios', schema=None) as batch_op:
+        batch_op.drop_index('ix_usuarios_fecha_registro_id')
+        batch_op.create_index('ix_usuarios_fecha_registro', ['fecha_registro'], unique=False)
@@ -0,0 +1,74 @@
+"""App de pruebas contra un SQLite temporal con las migraciones y los datos iniciales"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# config.py lee el entorno al importarse: todo esto va antes de importar la app
+_DIRECTORIO = tempfile.mkdtemp(prefix='pruebas-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_DIRECTORIO, 'pruebas.db')
+os.environ['PROGRESO_COLA_RUTA'] = os.path.join(_DIRECTORIO, 'cola_progreso.db')
+os.environ['LIMITES_ACTIVOS'] = '0'
+# Sin el hilo de vaciado: las pruebas de la cola la vacían a mano
+os.environ.pop('PROGRESO_WRITE_BEHIND', None)
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from flask_migrate import upgrade
+    from app import create_app, db
+    from app.comandos import sembrar_datos_iniciales
+
+    app = create_app('default')
+    app.config['TESTING'] = True
+    with app.app_context():
+        upgrade(directory=os.path.join(RAIZ, 'migrations'))
+        sembrar_datos_iniciales()
+    yield app
+    with app.app_context():
+        for motor in db.engines.values():
+            motor.dispose()
+    shutil.rmtree(_DIRECTORIO, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def usuario(client, request):
+    """Usuario nuevo (parada 1 activa, el resto bloqueadas); devuelve su id"""
+    respuesta = client.post('/api/usuarios/registro', json={
+        'nombre': 'Prueba',
+        'apellido': request.node.name,
+        'device_id': request.node.nodeid
+    })
+    assert respuesta.status_code == 200
+    return respuesta.get_json()['usuario']['id']
+
+
+@pytest.fixture
+def cola(app, monkeypatch):
+    """Modo write-behind con la cola vacía; devuelve el módulo ``cola_progreso``"""
+    from app.services import cola_progreso
+
+    monkeypatch.setitem(app.config, 'PROGRESO_WRITE_BEHIND', True)
+    conexion = cola_progreso._conexion()
+    conexion.execute('DELETE FROM eventos')
+    conexion.execute('DELETE FROM eventos_fallidos')
+    return cola_progreso
+
+
+@pytest.fixture
+def leer_progreso(app):
+    """Función que lee el progreso de una parada tal como está en la base de datos"""
+    from app.models import Progreso
+
+    def leer(usuario_id, parada_id):
+        with app.app_context():
+            return Progreso.query.filter_by(usuario_id=usuario_id, parada_id=parada_id).one().to_dict()
+    return leer
@@ -0,0 +1,119 @@
+"""Cola write-behind: reclamos caducados, eventos apartados, repeticiones y revisiones"""
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.services import estadisticas
+
+
+def _completados(app, parada_id):
+    with app.app_context():
+        return estadisticas.obtener_parada(parada_id).completados
+
+
+def _metricas(app, cola):
+    with app.app_context():
+        return cola.metricas()
+
+
+def _fallidos(cola):
+    return cola._conexion().execute('SELECT tipo, error FROM eventos_fallidos ORDER BY id').fetchall()
+
+
+def test_reclamo_caducado_se_vuelve_a_reclamar(app, cola, usuario, leer_progreso):
+    cola.encolar('completar', {'usuario_id': usuario, 'parada_id': 1, 'puntuacion': 7})
+
+    # Un proceso reclama el lote y muere antes de aplicarlo: mientras dura el reclamo nadie más vacía
+    assert len(cola._reclamar(10, app.config['PROGRESO_COLA_CADUCIDAD'], 'proceso-caido')) == 1
+    assert cola.vaciar(app) == 0
+    assert leer_progreso(usuario, 1)['estado'] == 'activa'
+
+    cola._conexion().execute('UPDATE eventos SET reclamado = reclamado - ?',
+                             (app.config['PROGRESO_COLA_CADUCIDAD'] + 1,))
+    assert cola.vaciar(app) == 1
+    progreso = leer_progreso(usuario, 1)
+    assert progreso['estado'] == 'completada'
+    assert progreso['puntuacion'] == 7
+    assert _metricas(app, cola)['pendientes'] == 0
+
+
+def test_evento_erroneo_se_aparta_sin_bloquear_la_cola(app, cola, usuario, leer_progreso):
+    progreso_id = leer_progreso(usuario, 1)['id']
+    cola.encolar('completar', {'usuario_id': usuario, 'parada_id': 1})
+    cola.encolar('actualizar', {'id': progreso_id, 'intentos': 'x'})
+    cola.encolar('desconocido', {})
+
+    # El lote falla entero, se repite evento a evento y solo se apartan los que vuelven a fallar
+    assert cola.vaciar(app) == 3
+    assert leer_progreso(usuario, 1)['estado'] == 'completada'
+    fallidos = _fallidos(cola)
+    assert [tipo for tipo, _ in fallidos] == ['actualizar', 'desconocido']
+    assert 'intentos debe ser un entero' in fallidos[0][1]
+    metricas = _metricas(app, cola)
+    assert metricas['pendientes'] == 0
+    assert metricas['fallidos'] == 2
+
+
+def test_error_de_conexion_libera_el_lote(app, cola, usuario, leer_progreso, monkeypatch):
+    cola.encolar('completar', {'usuario_id': usuario, 'parada_id': 1})
+    aplicar_tramo = cola._aplicar_tramo
+
+    def caida(tipo, eventos):
+        raise OperationalError('UPDATE progreso', {}, Exception('database is locked'))
+
+    # El evento no tiene la culpa: vuelve a la cola sin reclamar en lugar de apartarse
+    monkeypatch.setattr(cola, '_aplicar_tramo', caida)
+    with pytest.raises(OperationalError):
+        cola.vaciar(app)
+    assert cola._conexion().execute('SELECT reclamado FROM eventos').fetchall() == [(None,)]
+    assert _fallidos(cola) == []
+
+    monkeypatch.setattr(cola, '_aplicar_tramo', aplicar_tramo)
+    assert cola.vaciar(app) == 1
+    assert leer_progreso(usuario, 1)['estado'] == 'completada'
+
+
+def test_repetir_un_lote_no_cambia_nada(app, cola, usuario, leer_progreso):
+    progreso_id = leer_progreso(usuario, 1)['id']
+    completados = _completados(app, 1)
+    lote = [('completar', {'usuario_id': usuario, 'parada_id': 1, 'puntuacion': 5, 'tiempo_empleado': 60}),
+            ('actualizar', {'id': progreso_id, 'puntuacion': 9})]
+
+    for tipo, datos in lote:
+        cola.encolar(tipo, datos)
+    assert cola.vaciar(app) == 2
+    aplicado = leer_progreso(usuario, 1)
+    assert aplicado['puntuacion'] == 9
+
+    # Como si el proceso hubiera muerto entre el commit y el borrado del lote
+    for tipo, datos in lote:
+        cola.encolar(tipo, datos)
+    assert cola.vaciar(app) == 2
+    assert leer_progreso(usuario, 1) == aplicado
+    assert leer_progreso(usuario, 2)['estado'] == 'activa'
+    assert _completados(app, 1) == completados + 1
+    assert _fallidos(cola) == []
+
+
+def test_revision_antigua_devuelve_409_sin_encolar(app, client, cola, usuario, leer_progreso):
+    progreso = leer_progreso(usuario, 1)
+
+    respuesta = client.put(f"/api/progreso/{progreso['id']}",
+                           json={'puntuacion': 3, 'revision': progreso['revision'] - 1})
+    assert respuesta.status_code == 409
+    assert respuesta.get_json()['progreso']['revision'] == progreso['revision']
+    assert _metricas(app, cola)['pendientes'] == 0
+
+
+def test_revision_que_cambia_en_la_cola_se_aparta(app, client, cola, usuario, leer_progreso):
+    progreso = leer_progreso(usuario, 1)
+    url = f"/api/progreso/{progreso['id']}"
+
+    # Dos dispositivos con la misma revisión: el segundo se comprueba contra lo que aplicó el primero
+    assert client.put(url, json={'puntuacion': 3, 'revision': progreso['revision']}).status_code == 202
+    assert client.put(url, json={'puntuacion': 4, 'revision': progreso['revision']}).status_code == 202
+    assert cola.vaciar(app) == 2
+
+    assert leer_progreso(usuario, 1)['puntuacion'] == 3
+    fallidos = _fallidos(cola)
+    assert len(fallidos) == 1
+    assert 'el progreso cambió en el servidor' in fallidos[0][1]
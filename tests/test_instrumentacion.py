@@ -0,0 +1,20 @@
+"""Acceso a /metrics según METRICAS_TOKEN y METRICAS_PUBLICAS"""
+
+
+def test_sin_token_metrics_no_se_publica(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICAS_TOKEN', None)
+    monkeypatch.setitem(app.config, 'METRICAS_PUBLICAS', False)
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setitem(app.config, 'METRICAS_PUBLICAS', True)
+    assert client.get('/metrics').status_code == 200
+
+
+def test_con_token_metrics_lo_exige(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICAS_TOKEN', 'secreto')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer otro'}).status_code == 401
+
+    respuesta = client.get('/metrics', headers={'Authorization': 'Bearer secreto'})
+    assert respuesta.status_code == 200
+    assert b'mentxu_' in respuesta.data
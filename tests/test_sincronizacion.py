@@ -0,0 +1,72 @@
+"""Sincronización sin conexión: feed de cambios y resolución de conflictos"""
+import pytest
+
+from app import db
+from app.services import sincronizacion
+
+
+def _cambios(app, usuario_id, desde=0):
+    with app.app_context():
+        return sincronizacion.cambios_desde(usuario_id, desde)
+
+
+def _aplicar(app, usuario_id, elementos, politica='max'):
+    with app.app_context():
+        resultados = sincronizacion.aplicar_cambios(usuario_id, elementos, politica)
+        db.session.commit()
+    return [resultado['resultado'] for resultado in resultados]
+
+
+def test_cambios_desde_devuelve_solo_lo_posterior(app, client, usuario):
+    revision, cambios = _cambios(app, usuario)
+    assert cambios and all(cambio['revision'] <= revision for cambio in cambios)
+    assert _cambios(app, usuario, revision) == (revision, [])
+
+    # Completar cambia la parada y desbloquea la siguiente en una sola revisión
+    client.post('/api/progreso/completar', json={'usuario_id': usuario, 'parada_id': 1})
+    nueva, cambios = _cambios(app, usuario, revision)
+    assert nueva == revision + 1
+    assert [(c['parada_id'], c['estado'], c['revision']) for c in cambios] == \
+        [(1, 'completada', nueva), (2, 'activa', nueva)]
+
+
+def test_cambios_desde_usuario_inexistente(app):
+    assert _cambios(app, 999999) == (None, [])
+
+
+def test_reenviar_el_mismo_lote_no_cambia_nada(app, usuario, leer_progreso):
+    lote = [{'parada_id': 1, 'estado': 'completada', 'puntuacion': 40},
+            {'parada_id': 3, 'intentos': 2, 'revision': leer_progreso(usuario, 3)['revision']}]
+    assert _aplicar(app, usuario, lote) == ['aplicado', 'aplicado']
+    revision, _ = _cambios(app, usuario)
+
+    assert _aplicar(app, usuario, lote) == ['sin_cambios', 'sin_cambios']
+    assert _cambios(app, usuario)[0] == revision
+    assert leer_progreso(usuario, 2)['estado'] == 'activa'
+    assert leer_progreso(usuario, 3)['intentos'] == 2
+
+
+@pytest.mark.parametrize('politica, elemento, resultado', [
+    # max: gana la puntuación más alta
+    ('max', {'puntuacion': 30}, 'descartado'),
+    ('max', {'puntuacion': 80}, 'aplicado'),
+    # lww: gana la modificación más reciente, aunque tenga menos puntuación
+    ('lww', {'puntuacion': 80, 'modificado': '2000-01-01T00:00:00'}, 'descartado'),
+    ('lww', {'puntuacion': 30, 'modificado': '2999-01-01T00:00:00'}, 'aplicado'),
+    ('lww', {'puntuacion': 80}, 'descartado'),
+])
+def test_conflicto_de_metricas(app, client, usuario, leer_progreso, politica, elemento, resultado):
+    vista = leer_progreso(usuario, 1)['revision']
+    client.post('/api/progreso/completar', json={'usuario_id': usuario, 'parada_id': 1, 'puntuacion': 50})
+
+    assert _aplicar(app, usuario, [dict(elemento, parada_id=1, revision=vista)], politica) == [resultado]
+    assert leer_progreso(usuario, 1)['puntuacion'] == (elemento['puntuacion'] if resultado == 'aplicado' else 50)
+
+
+@pytest.mark.parametrize('politica', ['max', 'lww'])
+def test_sin_conflicto_con_la_ultima_revision(app, client, usuario, leer_progreso, politica):
+    client.post('/api/progreso/completar', json={'usuario_id': usuario, 'parada_id': 1, 'puntuacion': 50})
+    vista = leer_progreso(usuario, 1)['revision']
+
+    assert _aplicar(app, usuario, [{'parada_id': 1, 'puntuacion': 10, 'revision': vista}], politica) == ['aplicado']
+    assert leer_progreso(usuario, 1)['puntuacion'] == 10
@@ -0,0 +1,134 @@
+"""Comprobar que las consultas de las rutas usan índices.
+
+Crea una base de datos SQLite temporal con muchos usuarios sintéticos,
+recorre las rutas de la API y del panel con el cliente de pruebas de Flask,
+captura cada sentencia SQL emitida y ejecuta ``EXPLAIN QUERY PLAN`` sobre
+ella. Termina con código 1 si alguna consulta recorre entera una tabla
+grande (``usuarios`` o ``progreso``) sin usar ningún índice.
+
+    python verificar_planes.py --usuarios 20000
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+# Tablas que crecen con el uso; el resto (paradas, contadores...) son pequeñas
+TABLAS_GRANDES = ('usuarios', 'progreso')
+
+# Recorrido completo de una tabla grande sin usar ningún índice
+PATRON_SCAN = re.compile(r'^SCAN (%s)\b(?!.*\bUSING\b)' % '|'.join(TABLAS_GRANDES))
+
+
+def peticiones(ids, paradas, cursor):
+    """Peticiones representativas de cada ruta: (descripción, método, url, json)"""
+    usuario = ids[len(ids) // 2]
+    otro = ids[len(ids) // 3]
+    return [
+        ('Landing', 'GET', '/', None),
+        ('Estadísticas generales', 'GET', '/api/estadisticas', None),
+        ('Catálogo de paradas', 'GET', '/api/paradas', None),
+        ('Estadísticas de parada', 'GET', f'/api/paradas/{paradas[1]}/estadisticas', None),
+        ('Listado de usuarios', 'GET', '/api/usuarios', None),
+        ('Listado de usuarios (página siguiente)', 'GET', f'/api/usuarios?fields=id,nombre&cursor={cursor}', None),
+        ('Usuario', 'GET', f'/api/usuarios/{usuario}', None),
+        ('Progreso de usuario', 'GET', f'/api/progreso/{usuario}', None),
+        ('Progreso (usuarios)', 'GET', f'/api/usuarios/{usuario}/progreso', None),
+        ('Cambios de progreso', 'GET', f'/api/progreso/{usuario}?since=2026-01-01T00:00:00', None),
+        ('Ranking', 'GET', '/api/ranking', None),
+        ('Ranking de parada', 'GET', f'/api/ranking?parada_id={paradas[0]}', None),
+        ('Rutas', 'GET', '/api/rutas', None),
+        ('Paradas de ruta', 'GET', '/api/rutas/1/paradas', None),
+        ('Estadísticas de ruta', 'GET', '/api/rutas/1/estadisticas', None),
+        ('Paradas cercanas', 'GET', '/api/paradas/cercanas?lat=43.33&lon=-3.03', None),
+        ('Check-in', 'POST', '/api/progreso/checkin', {'usuario_id': usuario, 'lat': 43.33, 'lon': -3.03}),
+        ('Check-in de ruta', 'POST', '/api/progreso/checkin', {'usuario_id': usuario, 'ruta_id': 1, 'lat': 43.33, 'lon': -3.03}),
+        ('Check-in de parada', 'POST', '/api/progreso/checkin',
+         {'usuario_id': usuario, 'parada_id': paradas[0], 'lat': 43.33, 'lon': -3.03}),
+        ('Cambios de sincronización', 'GET', f'/api/sync/changes?usuario_id={usuario}&since=0', None),
+        ('Envío de sincronización', 'POST', '/api/sync/push',
+         {'usuario_id': usuario, 'since': 0, 'cambios': [{'parada_id': paradas[0], 'puntuacion': 5}]}),
+        ('Registro nuevo', 'POST', '/api/usuarios/registro',
+         {'nombre': 'Nueva', 'apellido': 'Persona', 'device_id': 'device-nuevo'}),
+        ('Registro existente', 'POST', '/api/usuarios/registro',
+         {'nombre': 'Usuario1', 'apellido': 'Prueba1', 'device_id': 'device-1'}),
+        ('Registro de grupo', 'POST', '/api/usuarios/registro/lote',
+         {'usuarios': [{'nombre': f'Alumno{i}', 'apellido': 'Clase', 'device_id': 'tablet'} for i in range(5)]}),
+        ('Completar parada', 'POST', '/api/progreso/completar',
+         {'usuario_id': usuario, 'parada_id': paradas[0], 'puntuacion': 50}),
+        ('Sincronizar progreso', 'POST', '/api/progreso/sync',
+         {'completados': [{'usuario_id': otro, 'parada_id': p} for p in paradas[:3]]}),
+        ('Dashboard', 'GET', '/dashboard', None),
+        ('Panel de usuarios', 'GET', '/usuarios', None),
+        ('Detalle de usuario', 'GET', f'/usuarios/{usuario}', None),
+        ('Eliminar usuario', 'DELETE', f'/api/usuarios/{otro}', None),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=20000,
+                        help='usuarios sintéticos a generar (por defecto 20000)')
+    parser.add_argument('--verbose', action='store_true', help='mostrar todos los planes')
+    args = parser.parse_args()
+
+    from sqlalchemy import event
+    from benchmarks.datos import preparar_app, sembrar_usuarios
+
+    directorio = tempfile.mkdtemp(prefix='mentxu-planes-')
+    app = preparar_app(os.path.join(directorio, 'planes.db'), 'default')
+
+    from app import db
+    from app.models import Admin
+
+    with app.app_context():
+        print(f"🌱 Generando {args.usuarios} usuarios sintéticos en {directorio}...")
+        ids, paradas = sembrar_usuarios(args.usuarios)
+        admin = Admin.query.first()
+        credenciales = {'username': admin.username, 'password': os.getenv('ADMIN_PASSWORD', 'admin123')}
+
+        capturadas = []
+
+        def capturar(conn, cursor, sentencia, parametros, contexto, executemany):
+            if sentencia.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE'):
+                if executemany:
+                    parametros = parametros[0]
+                capturadas.append((sentencia, parametros))
+
+        # Con SQLITE_ESCRITOR_UNICO las lecturas van por el motor ``lector``
+        for motor in db.engines.values():
+            event.listen(motor, 'before_cursor_execute', capturar)
+
+    cliente = app.test_client()
+    cliente.post('/login', data=credenciales)
+    cursor = cliente.get('/api/usuarios').headers.get('X-Next-Cursor', '')
+
+    regresiones = 0
+    for descripcion, metodo, url, datos in peticiones(ids, paradas, cursor):
+        capturadas.clear()
+        respuesta = cliente.open(url, method=metodo, json=datos)
+        sentencias = list(capturadas)
+        print(f"\n▶ {descripcion}: {metodo} {url} → {respuesta.status_code} ({len(sentencias)} consultas)")
+
+        with app.app_context(), db.engine.connect() as conexion:
+            cursor = conexion.connection.cursor()
+            for sentencia, parametros in sentencias:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sentencia, parametros)
+                plan = [fila[3] for fila in cursor.fetchall()]
+                malos = [paso for paso in plan if PATRON_SCAN.search(paso)]
+                if malos or args.verbose:
+                    print(f"   {'❌' if malos else '  '} {' '.join(sentencia.split())[:110]}")
+                    for paso in plan:
+                        print(f"        {'⚠️ ' if paso in malos else ''}{paso}")
+                regresiones += bool(malos)
+
+    if regresiones:
+        print(f"\n❌ {regresiones} consultas recorren una tabla grande sin índice")
+        return 1
+    print("\n✅ Todas las consultas usan índices")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())